@@ -1,23 +1,116 @@
 # Default library.
 import datetime
 import sqlite3  # Only to make the db on init.
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
 
 # Requirements.
 import aiosqlite
 
 
 class DbQueries:
-    """Query the account registrations"""
+    """Query the account registrations
+
+    A user can link several accounts. Exactly one of them is primary: the account that single-account lookups use."""
     CREATE_TABLE = "CREATE TABLE `registrations` (`userID` INTEGER, `username` TEXT, `timestamp` TEXT, " \
-                   "`platform` INTEGER, `gamer_id` TEXT, PRIMARY KEY(`userID`));"
+                   "`platform` INTEGER, `gamer_id` TEXT, `is_primary` INTEGER, " \
+                   "PRIMARY KEY(`userID`, `platform`, `gamer_id`));"
     TABLE_CHECK = "SELECT count(*) FROM sqlite_master WHERE type='table' AND name='registrations';"
+    ENABLE_WAL = "PRAGMA journal_mode = WAL;"  # Readers (e.g. exports) and writers don't block each other.
+    REGISTRATIONS_COLUMNS = "PRAGMA table_info(`registrations`);"
+    # Tables made before multiple accounts were allowed had one account per user, which becomes their primary.
+    MIGRATE_RENAME = "ALTER TABLE `registrations` RENAME TO `registrations_single`;"
+    MIGRATE_COPY = "INSERT INTO `registrations` SELECT userID, username, timestamp, platform, gamer_id, 1 " \
+                   "FROM `registrations_single`;"
+    MIGRATE_DROP = "DROP TABLE `registrations_single`;"
+    # At most one primary account per user, and single-account lookups are a search of this index.
+    CREATE_PRIMARY_INDEX = "CREATE UNIQUE INDEX IF NOT EXISTS registrations_primary ON registrations(userID) " \
+                           "WHERE is_primary = 1;"
     DELETE_LINK = "DELETE FROM `registrations` WHERE userID = ?"
-    INSERT_LINK = "INSERT OR REPLACE INTO `registrations` VALUES (?, ?, ?, ?, ?);"
-    SELECT_LINK = "SELECT `platform`, `gamer_id` FROM `registrations` WHERE userID = ?"
+    DELETE_ACCOUNT = "DELETE FROM `registrations` WHERE userID = ? AND platform = ? AND gamer_id = ?;"
+    # Columns: userID, username, timestamp, platform, gamer_id. The first account of a user becomes primary.
+    INSERT_LINK = "INSERT OR IGNORE INTO `registrations` SELECT ?1, ?2, ?3, ?4, ?5, " \
+                  "NOT EXISTS (SELECT 1 FROM `registrations` WHERE userID = ?1);"
+    INSERT_LINK_NEW_USER = "INSERT OR IGNORE INTO `registrations` SELECT ?1, ?2, ?3, ?4, ?5, 1 " \
+                           "WHERE NOT EXISTS (SELECT 1 FROM `registrations` WHERE userID = ?1);"
+    CLEAR_PRIMARY = "UPDATE `registrations` SET is_primary = 0 WHERE userID = ? AND is_primary = 1;"
+    SET_PRIMARY = "UPDATE `registrations` SET is_primary = 1 WHERE userID = ? AND platform = ? AND gamer_id = ?;"
+    PROMOTE_OLDEST = "UPDATE `registrations` SET is_primary = 1 WHERE rowid = (SELECT rowid FROM `registrations` " \
+                     "WHERE userID = ? ORDER BY timestamp LIMIT 1);"
+    SELECT_IS_PRIMARY = "SELECT `is_primary` FROM `registrations` WHERE userID = ? AND platform = ? AND gamer_id = ?;"
+    SELECT_LINK = "SELECT `platform`, `gamer_id` FROM `registrations` WHERE userID = ? AND is_primary = 1"
+    SELECT_ACCOUNTS = "SELECT `platform`, `gamer_id` FROM `registrations` WHERE userID = ? " \
+                      "ORDER BY is_primary DESC, timestamp;"
+    SELECT_LINKS = "SELECT `userID`, `platform`, `gamer_id` FROM `registrations` WHERE userID IN ({}) " \
+                   "ORDER BY userID, is_primary DESC, timestamp;"
+    SELECT_ALL_LINKS = "SELECT `userID`, `platform`, `gamer_id` FROM `registrations` " \
+                       "ORDER BY userID, is_primary DESC, timestamp;"
+    # Rank history. Skills of each point are packed into one blob (see rank_history.py).
+    CREATE_HISTORY = "CREATE TABLE IF NOT EXISTS `rank_history` (`platform` TEXT, `gamer_id` TEXT, " \
+                     "`stamp` INTEGER, `skills` BLOB, PRIMARY KEY(`platform`, `gamer_id`, `stamp`)) WITHOUT ROWID;"
+    CREATE_ACCOUNT_INDEX = "CREATE INDEX IF NOT EXISTS registrations_account ON registrations(platform, gamer_id);"
+    # Only insert a point if the account is linked, and if the skills differ from the latest point.
+    INSERT_HISTORY = "INSERT OR IGNORE INTO `rank_history` SELECT :p, :g, :stamp, :skills " \
+                     "WHERE EXISTS (SELECT 1 FROM `registrations` WHERE platform = :p AND gamer_id = :g) " \
+                     "AND :skills IS NOT (SELECT skills FROM `rank_history` WHERE platform = :p AND gamer_id = :g " \
+                     "ORDER BY stamp DESC LIMIT 1);"
+    SELECT_HISTORY = "SELECT `stamp`, `skills` FROM `rank_history` " \
+                     "WHERE platform = ? AND gamer_id = ? AND stamp >= ? AND stamp <= ? ORDER BY stamp;"
+    DELETE_HISTORY = "DELETE FROM `rank_history` WHERE (platform, gamer_id) IN " \
+                     "(SELECT platform, gamer_id FROM `registrations` WHERE userID = ?);"
+    DELETE_ACCOUNT_HISTORY = "DELETE FROM `rank_history` WHERE platform = ? AND gamer_id = ?;"
+    # Rank board: the latest known ranks of linked users, kept up to date on every lookup of their primary account.
+    CREATE_BEST_RANKS = "CREATE TABLE IF NOT EXISTS `best_ranks` (`userID` INTEGER PRIMARY KEY, `tier` INTEGER, " \
+                        "`playlist` INTEGER, `mu` REAL, `sr` REAL, `division` INTEGER, `stamp` INTEGER);"
+    CREATE_BEST_INDEX = "CREATE INDEX IF NOT EXISTS best_ranks_order ON best_ranks(tier, mu, userID);"
+    CREATE_PLAYLIST_RANKS = "CREATE TABLE IF NOT EXISTS `playlist_ranks` (`userID` INTEGER, `playlist` INTEGER, " \
+                            "`mu` REAL, `sr` REAL, `tier` INTEGER, `division` INTEGER, `stamp` INTEGER, " \
+                            "PRIMARY KEY(`userID`, `playlist`));"
+    PLAYLIST_RANKS_COLUMNS = "PRAGMA table_info(`playlist_ranks`);"
+    ADD_SIGMA_COLUMN = "ALTER TABLE `playlist_ranks` ADD COLUMN `sigma` REAL;"  # Tables made before sigma was stored.
+    CREATE_PLAYLIST_INDEX = "CREATE INDEX IF NOT EXISTS playlist_ranks_order ON playlist_ranks(playlist, mu, userID);"
+    DELETE_BEST_RANKS = "DELETE FROM `best_ranks` WHERE userID IN " \
+                        "(SELECT userID FROM `registrations` WHERE platform = ? AND gamer_id = ? AND is_primary = 1);"
+    DELETE_PLAYLIST_RANKS = "DELETE FROM `playlist_ranks` WHERE userID IN (SELECT userID FROM `registrations` " \
+                            "WHERE platform = ? AND gamer_id = ? AND is_primary = 1);"
+    INSERT_BEST_RANK = "INSERT INTO `best_ranks` SELECT userID, :tier, :playlist, :mu, :sr, :division, :stamp " \
+                       "FROM `registrations` WHERE platform = :p AND gamer_id = :g AND is_primary = 1;"
+    INSERT_PLAYLIST_RANK = "INSERT INTO `playlist_ranks` (userID, playlist, mu, sigma, sr, tier, division, stamp) " \
+                           "SELECT userID, :playlist, :mu, :sigma, :sr, :tier, :division, :stamp " \
+                           "FROM `registrations` WHERE platform = :p AND gamer_id = :g AND is_primary = 1;"
+    SELECT_PRIMARY_USERS = "SELECT userID FROM `registrations` WHERE platform = ? AND gamer_id = ? AND is_primary = 1;"
+    DELETE_USER_BEST = "DELETE FROM `best_ranks` WHERE userID = ?;"
+    DELETE_USER_PLAYLISTS = "DELETE FROM `playlist_ranks` WHERE userID = ?;"
+    # Board order: only the members of a server, which are put in a temporary table. CROSS JOIN makes SQLite loop over
+    # the members, so their ranks are looked up by primary key, instead of scanning the ranks of every server.
+    # A page is looked up separately.
+    CREATE_BOARD_MEMBERS = "CREATE TEMP TABLE `board_members` (`userID` INTEGER PRIMARY KEY);"
+    INSERT_BOARD_MEMBER = "INSERT OR IGNORE INTO temp.`board_members` VALUES (?);"
+    SELECT_BEST_ORDER = "SELECT b.userID FROM temp.`board_members` m CROSS JOIN `best_ranks` b " \
+                        "ON b.userID = m.userID ORDER BY b.tier DESC, b.mu DESC, b.userID DESC;"
+    SELECT_PLAYLIST_ORDER = "SELECT p.userID FROM temp.`board_members` m CROSS JOIN `playlist_ranks` p " \
+                            "ON p.userID = m.userID AND p.playlist = ? ORDER BY p.mu DESC, p.userID DESC;"
+    SELECT_ALL_BEST_ORDER = "SELECT userID FROM `best_ranks` ORDER BY tier DESC, mu DESC, userID DESC;"
+    SELECT_ALL_PLAYLIST_ORDER = "SELECT userID FROM `playlist_ranks` WHERE playlist = ? ORDER BY mu DESC, userID DESC;"
+    BOARD_SCAN_MEMBERS = 20000  # From this many members, scanning the order index of all servers is cheaper.
+    SELECT_BEST_PAGE = "SELECT userID, tier, playlist, sr, division, stamp FROM `best_ranks` WHERE userID IN ({});"
+    SELECT_PLAYLIST_PAGE = "SELECT userID, tier, playlist, sr, division, stamp FROM `playlist_ranks` " \
+                           "WHERE playlist = ? AND userID IN ({});"
+    # Rank analytics: the playlist ranks of the members of a server (like the board order), unknown sigma as -1.
+    SELECT_MEMBER_PLAYLIST_RANKS = "SELECT p.userID, p.playlist, p.mu, IFNULL(p.sigma, -1), p.tier " \
+                                   "FROM temp.`board_members` m CROSS JOIN `playlist_ranks` p ON p.userID = m.userID;"
+    SELECT_ALL_TIERS = "SELECT userID, playlist, tier, division FROM `playlist_ranks`;"
+    IMPORT_BATCH_SIZE = 5000  # Registrations per transaction when importing.
+    HISTORY_CACHE_SIZE = 10000  # Accounts for which the latest history blob is kept in memory.
+    BOARD_CHANGES_SIZE = 50000  # Users for which the board_version of their latest rank board change is kept.
 
     def __init__(self, db_path):
         self.path = db_path
         self.init_table()
+        self._last_history: Dict[Tuple[str, str], bytes] = {}  # (platform, gamer_id) -> latest skills blob.
+        self.board_version = 0  # Incremented whenever rank board rows change, so caches of them can be invalidated.
+        self._board_changes: Dict[int, int] = {}  # userID -> board_version, oldest first.
+        self._board_floor = 0  # The latest board_version that was dropped from _board_changes.
 
     def init_table(self) -> None:
         """Check if the table exists. If not, create it.
@@ -31,24 +124,118 @@ class DbQueries:
         if is_table is False:
             print("Making the registrations table...")
             cursor.execute(self.CREATE_TABLE)
-            connection.commit()
+        elif "is_primary" not in (row[1] for row in cursor.execute(self.REGISTRATIONS_COLUMNS).fetchall()):
+            print("Migrating the registrations table to multiple accounts per user...")
+            cursor.executescript("BEGIN; {} {} {} {} COMMIT;".format(
+                self.MIGRATE_RENAME, self.CREATE_TABLE, self.MIGRATE_COPY, self.MIGRATE_DROP))  # All or nothing.
+        cursor.execute(self.CREATE_ACCOUNT_INDEX)
+        cursor.execute(self.CREATE_PRIMARY_INDEX)
+        cursor.execute(self.CREATE_HISTORY)
+        for query in (self.CREATE_BEST_RANKS, self.CREATE_BEST_INDEX,
+                      self.CREATE_PLAYLIST_RANKS, self.CREATE_PLAYLIST_INDEX):
+            cursor.execute(query)
+        if "sigma" not in (row[1] for row in cursor.execute(self.PLAYLIST_RANKS_COLUMNS).fetchall()):
+            cursor.execute(self.ADD_SIGMA_COLUMN)
+        connection.commit()
+        cursor.execute(self.ENABLE_WAL)
         connection.close()
         return
 
     # Query methods.
     async def delete_user(self, user_id) -> None:
-        """Delete the link information for a user"""
+        """Delete the link information for a user, and the rank history of the linked accounts"""
+        await self.exec_sql(self.DELETE_HISTORY, [user_id], commit=True)
+        self._last_history.clear()
+        await self.exec_sql(self.DELETE_USER_BEST, [user_id], commit=True)
+        await self.exec_sql(self.DELETE_USER_PLAYLISTS, [user_id], commit=True)
         await self.exec_sql(self.DELETE_LINK, [user_id], commit=True)
+        self._board_changed([user_id])
         return
 
+    async def delete_account(self, user_id, platform: str, gamer_id) -> bool:
+        """
+        :param user_id: The userID of the user that linked the account.
+        :param platform: The platform of the account.
+        :param gamer_id: The gamer ID of the account.
+        :return: Whether the user had linked that account.
+
+        Delete one linked account of a user, and its rank history. If it was the primary account, the oldest of the
+        remaining accounts becomes primary, and the rank board rows of the user are cleared until it's looked up.
+        """
+        account = [user_id, platform, str(gamer_id)]
+        async with aiosqlite.connect(self.path) as db:
+            async with db.execute(self.SELECT_IS_PRIMARY, account) as cursor:
+                row = await cursor.fetchone()
+            if row is None:
+                return False
+            await db.execute(self.DELETE_ACCOUNT, account)
+            await db.execute(self.DELETE_ACCOUNT_HISTORY, account[1:])
+            if row[0]:
+                await db.execute(self.PROMOTE_OLDEST, [user_id])
+                await db.execute(self.DELETE_USER_BEST, [user_id])
+                await db.execute(self.DELETE_USER_PLAYLISTS, [user_id])
+            await db.commit()
+        self._last_history.pop((platform, str(gamer_id)), None)
+        if row[0]:
+            self._board_changed([user_id])
+        return True
+
+    async def set_primary(self, user_id, platform: str, gamer_id) -> bool:
+        """Make a linked account the primary account of a user. Returns False if the user didn't link that account"""
+        async with aiosqlite.connect(self.path) as db:
+            await db.execute(self.CLEAR_PRIMARY, [user_id])
+            async with db.execute(self.SET_PRIMARY, [user_id, platform, str(gamer_id)]) as cursor:
+                is_set = cursor.rowcount > 0
+            if not is_set:
+                await db.rollback()
+                return False
+            await db.execute(self.DELETE_USER_BEST, [user_id])  # The board showed the previous primary account.
+            await db.execute(self.DELETE_USER_PLAYLISTS, [user_id])
+            await db.commit()
+        self._board_changed([user_id])
+        return True
+
     async def insert_user(self, user_id, username, platform, gamer_id) -> None:
-        """Insert the link information for a user"""
+        """Link an account to a user. The first account of a user is their primary account"""
         stamp = str(datetime.datetime.utcnow())
         await self.exec_sql(self.INSERT_LINK, [user_id, username, stamp, platform, gamer_id], commit=True)
+        self._last_history.pop((platform, str(gamer_id)), None)  # Skills cached before linking were not stored.
         return
 
+    async def insert_users(self, rows: List[Tuple[int, str, str, str]], overwrite: bool = False) -> int:
+        """
+        :param rows: (user_id, username, platform, gamer_id) per registration.
+        :param overwrite: Whether to replace the linked accounts of users that have any. If False, they are skipped.
+        :return: The amount of registrations written.
+
+        Insert many registrations at once, with one executemany and commit per batch. Every written registration is
+        the primary (and only) account of its user. Like delete_user, overwritten users lose the rank history of their
+        previous accounts, and their rank board rows.
+        """
+        stamp = str(datetime.datetime.utcnow())
+        written = 0
+        async with aiosqlite.connect(self.path) as db:
+            for start in range(0, len(rows), self.IMPORT_BATCH_SIZE):
+                batch = rows[start:start + self.IMPORT_BATCH_SIZE]
+                if overwrite:
+                    user_ids = [(u,) for u, _, _, _ in batch]
+                    for query in (self.DELETE_HISTORY, self.DELETE_USER_BEST, self.DELETE_USER_PLAYLISTS,
+                                  self.DELETE_LINK):  # The history first, as it's found through the links.
+                        await db.executemany(query, user_ids)
+                changes_before = db.total_changes
+                await db.executemany(self.INSERT_LINK_NEW_USER, [(u, name, stamp, p, g) for u, name, p, g in batch])
+                written += db.total_changes - changes_before
+                await db.commit()
+        if overwrite:
+            self._last_history.clear()
+            self._board_changed(u for u, _, _, _ in rows)
+        else:
+            for _, _, platform, gamer_id in rows:
+                self._last_history.pop((platform, str(gamer_id)), None)
+        return written
+
     async def select_user(self, user_id) -> tuple:
-        """Get the platform and gamer_id of a user in the DB. Returns (False, False) if there's no match"""
+        """Get the platform and gamer_id of the primary account of a user. Returns (None, None) if there's no match"""
         resp = await self.exec_sql(self.SELECT_LINK, [user_id])
         if len(resp) == 0:  # No match
             platform, gamer_id = (None, None)
@@ -56,7 +243,147 @@ class DbQueries:
             platform, gamer_id = resp[0]
         return platform, gamer_id
 
+    async def select_accounts(self, user_id) -> List[Tuple[str, str]]:
+        """Get the (platform, gamer_id) of every account of a user, primary first and then in the order linked"""
+        return [(platform, gamer_id) for platform, gamer_id in await self.exec_sql(self.SELECT_ACCOUNTS, [user_id])]
+
+    async def select_users(self, user_ids: List[int]) -> Dict[int, List[Tuple[str, str]]]:
+        """Get userID -> the accounts (like select_accounts) for every given user that is in the DB, in one query"""
+        if not user_ids:
+            return {}
+        placeholders = ", ".join("?" * len(user_ids))
+        return self._group_accounts(await self.exec_sql(self.SELECT_LINKS.format(placeholders), list(user_ids)))
+
+    async def select_all_users(self) -> Dict[int, List[Tuple[str, str]]]:
+        """Get userID -> the accounts (like select_accounts) for every user in the DB"""
+        return self._group_accounts(await self.exec_sql(self.SELECT_ALL_LINKS))
+
+    async def insert_history(self, platform: str, gamer_id, skills_blob: bytes, stamp: int = None) -> bool:
+        """
+        :param platform: The platform of the account.
+        :param gamer_id: The gamer ID of the account.
+        :param skills_blob: The player skills, packed by rank_history.pack_skills.
+        :param stamp: (Optional) The epoch timestamp of the point. Defaults to now.
+        :return: False if the skills are known to be unchanged, True otherwise.
+
+        Add a rank history point for an account, if it's linked and its skills changed since the latest point.
+        """
+        key = (platform, str(gamer_id))
+        if self._last_history.get(key) == skills_blob:  # Nothing changed, so skip the database entirely.
+            return False
+        stamp = int(time.time()) if stamp is None else stamp
+        params = {"p": platform, "g": str(gamer_id), "stamp": stamp, "skills": skills_blob}
+        await self.exec_sql(self.INSERT_HISTORY, params, commit=True)
+        if len(self._last_history) >= self.HISTORY_CACHE_SIZE:
+            self._last_history.clear()
+        self._last_history[key] = skills_blob
+        return True
+
+    async def select_history(self, platform: str, gamer_id, start: int, end: int) -> List[Tuple[int, bytes]]:
+        """Get the (stamp, skills blob) history points of an account between two epoch timestamps (inclusive)"""
+        return await self.exec_sql(self.SELECT_HISTORY, [platform, str(gamer_id), start, end])
+
+    async def update_rank_board(self, platform: str, gamer_id, best: dict, playlists: List[dict]) -> None:
+        """
+        :param platform: The platform of the account.
+        :param gamer_id: The gamer ID of the account.
+        :param best: The best rank, as a dict with the keys tier, playlist, mu, sr, and division.
+        :param playlists: A dict per playlist, with the keys playlist, mu, sigma, sr, tier, and division.
+        :return: None
+
+        Replace the rank board rows of every user that has this account as primary account (if any).
+        """
+        account = {"p": platform, "g": str(gamer_id), "stamp": int(time.time())}
+        async with aiosqlite.connect(self.path) as db:
+            await db.execute(self.DELETE_BEST_RANKS, [platform, str(gamer_id)])
+            await db.execute(self.DELETE_PLAYLIST_RANKS, [platform, str(gamer_id)])
+            async with db.execute(self.INSERT_BEST_RANK, {**account, **best}) as cursor:
+                is_written = cursor.rowcount > 0
+            if not is_written:  # Not a primary account, so no board rows were deleted either.
+                await db.rollback()
+                return
+            await db.executemany(self.INSERT_PLAYLIST_RANK, [{**account, **d} for d in playlists])
+            async with db.execute(self.SELECT_PRIMARY_USERS, [platform, str(gamer_id)]) as cursor:
+                user_ids = [r[0] for r in await cursor.fetchall()]
+            await db.commit()
+        self._board_changed(user_ids)
+
+    def changed_users(self, since: int) -> Optional[Set[int]]:
+        """Get the users whose rank board rows changed after a board_version, or None if that's too long ago to know"""
+        if since < self._board_floor:
+            return None
+        changed = set()
+        for user_id, version in reversed(self._board_changes.items()):
+            if version <= since:
+                break
+            changed.add(user_id)
+        return changed
+
+    async def select_board_order(self, member_ids: Iterable[int], playlist: int = None) -> List[int]:
+        """Get the user IDs on the rank board of a server, best first. If no playlist is given, the best rank is used
+
+        Only the given members (of the server) are looked up, unless there are BOARD_SCAN_MEMBERS or more."""
+        member_ids = list(member_ids)
+        if len(member_ids) >= self.BOARD_SCAN_MEMBERS:
+            if playlist is None:
+                rows = await self.exec_sql(self.SELECT_ALL_BEST_ORDER)
+            else:
+                rows = await self.exec_sql(self.SELECT_ALL_PLAYLIST_ORDER, [playlist])
+            members = set(member_ids)
+            return [r[0] for r in rows if r[0] in members]
+        if playlist is None:
+            rows = await self._select_members(member_ids, self.SELECT_BEST_ORDER)
+        else:
+            rows = await self._select_members(member_ids, self.SELECT_PLAYLIST_ORDER, [playlist])
+        return [r[0] for r in rows]
+
+    async def select_board_page(self, user_ids: List[int], playlist: int = None) -> Dict[int, tuple]:
+        """Get userID -> (userID, tier, playlist, sr, division, stamp) for the given users"""
+        placeholders = ", ".join("?" * len(user_ids))
+        if playlist is None:
+            rows = await self.exec_sql(self.SELECT_BEST_PAGE.format(placeholders), user_ids)
+        else:
+            rows = await self.exec_sql(self.SELECT_PLAYLIST_PAGE.format(placeholders), [playlist, *user_ids])
+        return {r[0]: r for r in rows}
+
+    async def select_playlist_ranks(self, member_ids: Iterable[int]) -> List[tuple]:
+        """Get (userID, playlist, mu, sigma, tier) of every playlist of the members of a server. Sigma is -1 if unknown
+
+        Unlike the board order there is no index to scan instead, so the members are looked up even in large servers."""
+        return await self._select_members(list(member_ids), self.SELECT_MEMBER_PLAYLIST_RANKS)
+
+    async def select_all_tiers(self) -> Dict[int, Dict[int, Tuple[int, int]]]:
+        """Get userID -> {playlist: (tier, division)} of every user on the rank board"""
+        tiers: Dict[int, Dict[int, Tuple[int, int]]] = {}
+        for user_id, playlist, tier, division in await self.exec_sql(self.SELECT_ALL_TIERS):
+            tiers.setdefault(user_id, {})[playlist] = (tier, division)
+        return tiers
+
     # Utilities.
+    async def _select_members(self, member_ids: List[int], query: str, params=None) -> list:
+        """Run a query that joins temp.board_members, filled with the given user IDs, on its own connection"""
+        async with aiosqlite.connect(self.path) as db:
+            await db.execute(self.CREATE_BOARD_MEMBERS)
+            await db.executemany(self.INSERT_BOARD_MEMBER, [(user_id,) for user_id in member_ids])
+            async with db.execute(query, params) as cursor:
+                return await cursor.fetchall()
+
+    def _board_changed(self, user_ids: Iterable[int]) -> None:
+        """Bump board_version, and remember it as the latest change of the rank board rows of these users"""
+        self.board_version += 1
+        for user_id in user_ids:
+            self._board_changes.pop(user_id, None)  # Re-inserted at the end, so the dict stays ordered by version.
+            self._board_changes[user_id] = self.board_version
+        while len(self._board_changes) > self.BOARD_CHANGES_SIZE:
+            self._board_floor = self._board_changes.pop(next(iter(self._board_changes)))
+
+    @staticmethod
+    def _group_accounts(rows: List[tuple]) -> Dict[int, List[Tuple[str, str]]]:
+        accounts: Dict[int, List[Tuple[str, str]]] = {}
+        for user_id, platform, gamer_id in rows:
+            accounts.setdefault(user_id, []).append((platform, gamer_id))
+        return accounts
+
     async def exec_sql(self, query, params=None, commit=False) -> list:
         """Make an SQL query to the userID - gamer ID Database"""
         async with aiosqlite.connect(self.path) as db:
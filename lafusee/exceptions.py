@@ -25,6 +25,11 @@ class SteamCallError(LaFuseeError):
     pass
 
 
+class ImportFileError(LaFuseeError):
+    """Used when a registration import file cannot be read"""
+    pass
+
+
 class TokenError(LaFuseeError):
     """Errors related to setting and using tokens"""
     pass
@@ -1,12 +1,16 @@
 # Default libraries.
+import asyncio
+import datetime
+import functools
+import io
 import re
+import time
 from collections import OrderedDict
 from json import dumps  # Only used for debug output formatting.
-from typing import List, Literal, Optional
+from typing import Dict, List, Literal, Optional, Set
 
 # Used by Red.
 import discord
-import redbot.core.utils.menus as red_menu
 from redbot.core import checks, Config, data_manager
 from redbot.core import commands
 from redbot.core.bot import Red
@@ -14,10 +18,19 @@ from redbot.core.bot import Red
 from .db_queries import DbQueries
 # Local files.
 from .exceptions import CustomNotice, LaFuseeError, AccountInputError, TokenError, PsyonixCallError
+from .job_queue import Job, JobQueue
 from .json_data import GetJsonData
+from .matchmaking import Matchmaker, QueueEntry
+from .menu_dispatcher import MenuDispatcher
 from .psyonix_calls import PsyonixCalls
-from .static_functions import best_playlist, com, float_sr
+from .rank_analytics import RankAnalytics
+from .rank_history import pack_skills, unpack_skills
+from .rank_watcher import RankChange, RankWatcher
+from .registration_import import ImportRow, parse_import_file
+from .skills_prefetcher import SkillsPrefetcher
+from .static_functions import best_account, best_playlist, com, float_sr
 from .steam_calls import SteamCalls
+from .table_export import FORMATS, export_tables
 
 
 class LaFusee(commands.Cog):
@@ -53,6 +66,8 @@ class LaFusee(commands.Cog):
                         "or rerun this command when all roles are set up."
     R_GENERATE_NO_PERMS = ERROR + "I do not have sufficient permissions to add roles"
     R_GENERATE_PROGRESS = "{n} out of 22 roles done."
+    R_GENERATE_QUEUED = "Generating the rank roles in the background. The progress is posted in this channel."
+    R_GENERATE_BUSY = ERROR + "The rank roles of this server are being generated already."
     R_DETECT_SUCCESS = DONE + "Detected `{role_id}` for {tier_str}"
     R_DETECT_FAIL = ":x: Did not find a role for {tier_str}"
     R_DETECT_TOTAL = "**Total matches:** {match_count} out of 22\n{note}\n\n{rest}"
@@ -66,17 +81,23 @@ class LaFusee(commands.Cog):
     RANK_ROLE_DISABLED = ERROR + "You cannot obtain a rank role on this server!"
     RANK_ROLE_UPDATE_UNRANKED = ERROR + LINKED_UNRANKED + "\nThus, your rank roles could not be updated."
     LINK_SUCCESS = DONE + "Successfully linked your {} ID with this account!"
+    LINK_EXTRA_SUCCESS = DONE + "Successfully linked your {} ID as an extra account!\n" \
+                                "Stats commands keep using your primary account (see {}), " \
+                                "and your rank role uses the best rank of all your accounts."
     LINK_ROLE_UNRANKED = LINKED_UNRANKED + "\nThus, you cannot receive a rank role."
-    LINK_REMOVED = BIN + "Successfully unlinked your {} ID from this account."
+    LINK_REMOVED = BIN + "Successfully unlinked your {} from this account."
     LINK_AND_RANKROLE_REMOVED = LINK_REMOVED + "\nIf you had any rank roles, these were removed as well."  # 1 {}
     LINK_REMOVE_ROLE_NOTE = "Keep in mind that you __don't__ have to unlink your account to update any rank roles.\n"
     LINK_REMOVE_PROMPT = "**Are you sure you want to unlink your account?**\n{}" \
-                         "If so, resend this command, but with `yes` at the end, to unlink your {} ID. " \
+                         "If so, resend this command, but with `yes` at the end, to unlink your {}. " \
                          "No action needed otherwise. {}"  # 3× {}.
     # General user link errors.
     USER_NOT_REGISTERED = ERROR + "This user has not registered their account!"
-    ALREADY_REGISTERED = ":no_entry_sign: You have already linked your account!\n" \
-                         "To change your account, first *unlink* the current account with {}, then link a new one."
+    ALREADY_REGISTERED = ":no_entry_sign: You have already linked that account!"
+    LINK_TOO_MANY = ":no_entry_sign: You have already linked {n} accounts, which is the maximum.\n" \
+                    "To link another account, first *remove* one with {}."
+    LINK_MAX_ACCOUNTS = 5
+    ACCOUNTS_TIMEOUT = 10  # Seconds for the lookups of all accounts of a user together. Slower accounts are left out.
     AUTHOR_NOT_REGISTERED = ERROR + "You do not have a registered account."
     AUTHOR_REGISTER_PROMPT = AUTHOR_NOT_REGISTERED + "\nUse {} to register one."
     # Platform-tag validation constants.
@@ -85,6 +106,64 @@ class LaFusee(commands.Cog):
                                  "When they do, this command will support it as soon as possible."
     PLATFORM_EXAMPLES = "Try one of these: PC, PS4, XBOX"
     PLATFORM_INVALID = ERROR + "That platform does not exist.\n" + PLATFORM_EXAMPLES
+    # Rank history constants.
+    HISTORY_NONE = ERROR + "No rank history is recorded for that account in the last {days} days.\n" \
+                           "History is recorded whenever the stats of a linked account are looked up."
+    HISTORY_TITLE = "Rank history of the last {days} days"
+    HISTORY_SR_ROW = "SR: {:0.2f} → **{:0.2f}** ({:+0.2f})"
+    HISTORY_FOOTER = "ID: {user_id} | {n} data point{s} since"
+    # Rank board constants.
+    BOARD_EMPTY = ERROR + "No linked members of this server are on the rank board yet.\n" \
+                          "Members appear once the stats of their linked account have been looked up."
+    BOARD_TITLE = "Rocket League rank board{}"
+    BOARD_ROW = "`{:0{}d}` {} • **{:0.2f}** ({}{})"
+    BOARD_FOOTER = "{n} of {total} | {count} ranked member{s}"
+    BOARD_PAGE_SIZE = 10
+    # Rank analytics constants.
+    ANALYTICS_EMPTY = ERROR + "No linked members of this server have a known rank yet.\n" \
+                              "Members are counted once the stats of their linked account have been looked up."
+    ANALYTICS_TITLE = "Rank distribution{}"
+    ANALYTICS_DESC = "Based on the latest known ranks of **{n}** linked member{s}."
+    ANALYTICS_MEDIAN_ROW = "{}: **{:0.2f}** ({} player{})"
+    ANALYTICS_TIER_ROW = "{}: {} ({:0.1f}%)"
+    ANALYTICS_PERCENTILE_ROW = "p{:d}: **{:0.2f}**"
+    ANALYTICS_POSITION_ROW = "{}: #{} of {} (higher than {:0.1f}%)"
+    ANALYTICS_NO_POSITION = "No known rank for this member."
+    ANALYTICS_PERCENTILES = (10, 25, 50, 75, 90)
+    # Import constants.
+    IMPORT_NO_FILE = ERROR + "Attach a CSV or JSON file with a Discord user ID, platform and gamer ID per row."
+    IMPORT_EMPTY = ERROR + "The attached file does not contain any rows."
+    IMPORT_DONE = DONE + "Imported **{written}** of {total} row{s}. {kept} already linked (kept), {failed} failed."
+    IMPORT_FAILURE_ROW = "Line {line}: {user_id}: {reason}"
+    IMPORT_BAD_USER = "Not a Discord user ID."
+    IMPORT_INCOMPLETE = "Missing platform or gamer ID."
+    IMPORT_DUPLICATE = "Replaced by a later row for the same user."
+    IMPORT_CONCURRENCY = 10  # Vanity IDs resolved at once.
+    # Export constants.
+    EXPORT_DONE = DONE + "Exported {rows} registration{s} to `{path}`."
+    EXPORT_BAD_FORMAT = ERROR + "Unknown format. Use one of: {}."
+    # Compare constants.
+    COMPARE_MAX_USERS = 8
+    COMPARE_TOO_MANY = ERROR + "You can compare at most {} members at once."
+    COMPARE_NONE_LINKED = ERROR + "None of those members have registered their account!"
+    COMPARE_TITLE = "Rank comparison"
+    COMPARE_ROW = "{name:<{pad}} {sr:>7.2f}  {tier}"
+    COMPARE_TIMEOUT = 10  # Seconds for all lookups together. Slower accounts are left out.
+    COMPARE_CONCURRENCY = 8  # API calls in flight at once, across all compare commands.
+    COMPARE_MISSING = "**Not registered:** {}"
+    COMPARE_FAILED = "**No stats available:** {}"
+    # Matchmaking queue constants.
+    QUEUE_GROUP_SIZES = {0: 3, 10: 2, 11: 2, 12: 3, 13: 3, 27: 2, 28: 3, 29: 3, 30: 3}  # Playlist -> players.
+    QUEUE_JOINED = DONE + "You joined the {plist} queue, together with {n} other member{s}.\n" \
+                          "You'll be pinged once a group is found. Matches are within {tol:0.0f} SR for now, " \
+                          "and this widens the longer you wait."
+    QUEUE_MATCH = ":video_game: **{plist}** group found: {mentions} (average SR: {sr:0.0f})"
+    QUEUE_LEFT = BIN + "You left the {plist} queue."
+    QUEUE_NOT_IN = ERROR + "You are not in a queue on this server."
+    QUEUE_STATUS_ROW = "{plist}: {n} waiting"
+    QUEUE_STATUS_EMPTY = "Nobody is queueing on this server right now."
+    QUEUE_STATUS_OWN = "You wait in the {plist} queue for {minutes}m{seconds:02d}s, matching within {tol:0.0f} SR."
+    # Background job constants.
     # Playlist validation constants.
     PLAYLIST_INVALID = ERROR + "Invalid playlist input."
     PLAYLIST_NOT_PLAYED = ERROR + "{plist} is never played on this account."
@@ -106,6 +185,43 @@ class LaFusee(commands.Cog):
     E_ROW_ONLY_MMR = "`{:\u2800<{}}`\u2002**{:0.2f}**"
     E_ROW_RANKED = "`{ls:\u2800<{p}}`\u2002**{n:0.2f}**\u2002({bold}{tier_div}{bold})"
     E_ROW_NO_MATCHES = "`{:\u2800<{}}`\u2002*No matches played*"
+    # API lane statistics constants.
+    API_STATS_TITLE = "Psyonix API requests"
+    API_STATS_DESC = "At most {n} requests at once. Wait and total times are p50 / p95 over the recent requests."
+    API_STATS_ROW = "Requests: **{requests}** • Queued: **{queued}** • In flight: **{in_flight}**\n" \
+                    "Wait: {wait_p50:.0f} / {wait_p95:.0f} ms • Total: {total_p50:.0f} / {total_p95:.0f} ms"
+    # Prefetch constants.
+    PREFETCH_ENABLED = DONE + "The skills of linked members that are chatting are now prefetched."
+    PREFETCH_DISABLED = BIN + "Skills are no longer prefetched."
+    PREFETCH_BAD_STATE = ERROR + "Use `on` or `off`, or nothing to see the prefetch statistics."
+    PREFETCH_TITLE = "Skills prefetching: {}"
+    PREFETCH_DESC = "A member is prefetched at most once per {floor} minutes, with at most {budget} prefetches " \
+                    "per hour. Prefetched skills are used for {ttl} minutes."
+    PREFETCH_LOOKUPS = "Hit rate: **{rate:.1%}**\n{hits} hit{hs}, {misses} miss{ms}"
+    PREFETCH_SPENT = "Used: **{rate:.1%}**\n{prefetched} prefetched, {used} used, {failed} failed"
+    PREFETCH_SKIPPED = "{not_linked} not linked, {over_budget} over budget, {dropped} dropped"
+    # Rank watch constants.
+    RANKWATCH_UP = ":chart_with_upwards_trend: {mention} ranked up to **{tier}** in {plist}!"
+    RANKWATCH_SET = DONE + "Rank ups of linked members are now posted in {channel}. " \
+                           "If rank roles are enabled, they are updated automatically as well."
+    RANKWATCH_OFF = BIN + "Rank ups are no longer posted on this server, and rank roles are no longer updated " \
+                          "automatically."
+    RANKWATCH_NO_PERMS = ERROR + "I cannot send messages in {channel}."
+    RANKWATCH_TITLE = "Rank watch"
+    RANKWATCH_DESC = "Linked accounts are polled every {min} minutes while they play, and up to every {max} minutes " \
+                     "when they don't. After {days} days without matches, that becomes every {dormant} hours."
+    RANKWATCH_SERVER = "Posting in {channel}\nRank roles: {roles}"
+    RANKWATCH_SERVER_OFF = "Off. Turn it on with {}"
+    RANKWATCH_ACCOUNTS = "Watched: **{n}**\nDue: **{overdue}**\nInterval: {p50:.0f} / {p90:.0f} min (p50 / p90)"
+    RANKWATCH_POLLS = "{polls} poll{s}, {changes} with a rank change\n{failed} failed, {skipped} skipped"
+    # Linked accounts constants.
+    ACCOUNTS_TITLE = "Linked accounts of {}"
+    ACCOUNTS_ROW = "{platform}: `{gamer_id}`{primary}"
+    ACCOUNTS_PRIMARY_MARK = " (primary)"
+    ACCOUNTS_FOOTER = "Stats commands use the primary account. The rank role uses the best rank of all accounts."
+    ACCOUNTS_NOT_LINKED = ERROR + "You have not linked that account."
+    ACCOUNTS_PRIMARY_SET = DONE + "Your {} ID is now your primary account, which the stats commands use."
+    ACCOUNTS_REMOVED = BIN + "Successfully unlinked your {} ID."
     # Other constants.
     STEAM_PROFILE_URL = "https://steamcommunity.com/profiles/{}"
     STEAM_APP_URL = "steam://url/SteamIDPage/{}"
@@ -116,13 +232,81 @@ class LaFusee(commands.Cog):
         self.FOLDER = str(data_manager.cog_data_path(self))
         self.PATH_DB = self.FOLDER + "/account_registrations.db"
         self.config = Config.get_conf(self, identifier=80590423, force_registration=True)
-        self.config.register_global(psy_token=None, steam_token=None)
+        self.config.register_global(psy_token=None, steam_token=None, prefetch_enabled=False)
         # Structure of rankrole_dict: {tier_n: role_id}
-        self.config.register_guild(rankrole_enabled=False, rankrole_dict={}, ignore_special=False)
+        self.config.register_guild(rankrole_enabled=False, rankrole_dict={}, ignore_special=False,
+                                   rankwatch_channel=None)
         self.psy_api = PsyonixCalls(self.config)
         self.steam_api = SteamCalls(self.config)
         self.link_db = DbQueries(self.PATH_DB)
         self.json_conv = GetJsonData()
+        self.menus = MenuDispatcher(bot)
+        self.analytics = RankAnalytics(self.link_db, self.PLAYLIST_IDS)
+        self.matchmaker = Matchmaker(self.QUEUE_GROUP_SIZES, self.announce_match)
+        self.compare_limit = asyncio.Semaphore(self.COMPARE_CONCURRENCY)
+        self.recordings: Set[asyncio.Task] = set()  # Rank history writes in progress (see record_skills).
+        self.jobs = JobQueue(self.FOLDER + "/jobs.db")
+        self.jobs.register("generate_roles", self.generate_rank_roles)
+        self.prefetcher = SkillsPrefetcher(self.link_db.select_user, functools.partial(
+            self.fetch_skills, prefetched=False, lane=PsyonixCalls.BACKGROUND))
+        self.rankwatch_channels: Dict[int, int] = {}  # Guild ID -> channel ID, for servers that watch rank ups.
+        self.watcher = RankWatcher(functools.partial(self.fetch_skills, prefetched=False, lane=PsyonixCalls.BACKGROUND),
+                                   self.is_rank_watched, self.announce_rank_change)
+        self.unloaded = False
+        self.startup = asyncio.ensure_future(self.start_jobs())
+
+    def cog_unload(self):
+        self.unloaded = True
+        self.startup.cancel()
+        self.menus.close()
+        self.analytics.clear()
+        self.matchmaker.close()
+        self.prefetcher.close()
+        self.watcher.close()
+        for task in self.recordings:
+            task.cancel()
+        interrupted = self.jobs.close()
+        if interrupted:
+            print("LaFusee -> Interrupted {} background job(s) on unload. They continue on the next load.".format(
+                interrupted))
+
+    # Background jobs.
+    async def start_jobs(self):
+        """Start the background jobs (including those that were queued before a restart) once the bot is ready"""
+        await self.bot.wait_until_ready()
+        if self.unloaded:  # Else the queue and watcher of this instance would keep running next to the new ones.
+            return
+        self.jobs.start()
+        self.prefetcher.enabled = await self.config.prefetch_enabled()
+        self.rankwatch_channels = {guild_id: settings["rankwatch_channel"] for guild_id, settings
+                                   in (await self.config.all_guilds()).items() if settings["rankwatch_channel"]}
+        self.watcher.load(await self.link_db.select_all_users(), await self.link_db.select_all_tiers())
+        if not self.unloaded:
+            self.watcher.start()
+
+    async def generate_rank_roles(self, job: Job):
+        """Create the rank roles of a server, and post the progress in the channel where it was requested
+
+        Every created role is checkpointed, so an interrupted job continues where it left off."""
+        gld = self.bot.get_guild(job.payload["guild_id"])
+        if gld is None:  # The bot left the server.
+            return
+        channel = gld.get_channel(job.payload["channel_id"])
+        role_dict = {int(tier): role_id for tier, role_id in job.payload["roles"].items()}
+        for i in reversed(range(1, 20)):  # Reversed because of hierarchy.
+            if i in role_dict:  # Created before the job was interrupted.
+                continue
+            role_colour = discord.Colour(self.json_conv.get_tier_colour(i))
+            role_name = self.json_conv.get_tier_name(i)
+            new_role = await gld.create_role(name=role_name, colour=role_colour, hoist=True)
+            role_dict[i] = new_role.id
+            await self.jobs.checkpoint(job, {**job.payload, "roles": role_dict})
+            progress_n = 20 - i
+            if progress_n % 5 == 0 and channel:
+                await channel.send(self.R_GENERATE_PROGRESS.format(n=progress_n))
+        await self.config.guild(gld).rankrole_dict.set(role_dict)
+        if channel:
+            await channel.send(self.R_CONF_SUCCESS)
 
     # Events
     async def cog_command_error(self, ctx, error):
@@ -131,6 +315,28 @@ class LaFusee(commands.Cog):
         else:
             await ctx.bot.on_command_error(ctx, error, unhandled_by_cog=True)
 
+    @commands.Cog.listener()
+    async def on_raw_reaction_add(self, payload: discord.RawReactionActionEvent):
+        """Route reactions to the open LFG menus"""
+        await self.menus.handle_reaction(payload)
+
+    @commands.Cog.listener()
+    async def on_message(self, message: discord.Message):
+        """Prefetch the skills of linked members that are chatting, as they're likely to look them up soon"""
+        if message.guild is None or message.author.bot or message.webhook_id is not None:  # DMs aren't activity.
+            return
+        self.prefetcher.note_activity(message.author.id)
+
+    @commands.Cog.listener()
+    async def on_member_update(self, before: discord.Member, after: discord.Member):
+        """Drop members that go offline from the matchmaking queue"""
+        if after.status == discord.Status.offline and before.status != discord.Status.offline:
+            self.matchmaker.leave(after.guild.id, after.id)
+
+    @commands.Cog.listener()
+    async def on_member_remove(self, member: discord.Member):
+        self.matchmaker.leave(member.guild.id, member.id)
+
     # Configuration commands.
     @checks.admin_or_permissions(administrator=True)
     @commands.group(name="rlset", invoke_without_command=True)
@@ -187,6 +393,106 @@ class LaFusee(commands.Cog):
             notice = self.TOKEN_NOT_SET
         await ctx.send(notice)
 
+    @_api_setup.command(name="stats")
+    @checks.is_owner()
+    async def api_stats(self, ctx):
+        """See the latency of the Psyonix API requests per lane (commands and background work)"""
+        scheduler = self.psy_api.scheduler
+        embed = discord.Embed(title=self.API_STATS_TITLE, colour=discord.Colour.red())
+        embed.description = self.API_STATS_DESC.format(n=scheduler.concurrency)
+        for lane in scheduler.weights:
+            report = scheduler.report(lane)
+            times = {k: v * 1000 for k, v in report._asdict().items() if k.startswith(("wait", "total"))}
+            embed.add_field(name="{} (weight {})".format(lane.capitalize(), scheduler.weights[lane]), inline=False,
+                            value=self.API_STATS_ROW.format(requests=report.requests, queued=report.queued,
+                                                            in_flight=report.in_flight, **times))
+        await ctx.send(embed=embed)
+
+    @_rl_setup.command(name="prefetch")
+    @checks.is_owner()
+    async def set_prefetch(self, ctx, state: str = None):
+        """Prefetch the skills of linked members that are chatting, so that their lookups are instant (on all servers)
+
+        Use `on` or `off`. Without it, the hit rate of lookups and the share of prefetches that got used are shown, \
+        to weigh the prefetches against the API quota."""
+        if state is not None:
+            if state.lower() not in ("on", "off"):
+                raise CustomNotice(self.PREFETCH_BAD_STATE)
+            enabled = state.lower() == "on"
+            await self.config.prefetch_enabled.set(enabled)
+            self.prefetcher.enabled = enabled
+            await ctx.send(self.PREFETCH_ENABLED if enabled else self.PREFETCH_DISABLED)
+            return
+        pf, stats = self.prefetcher, self.prefetcher.stats
+        embed = discord.Embed(title=self.PREFETCH_TITLE.format("on" if pf.enabled else "off"),
+                              colour=discord.Colour.red())
+        embed.description = self.PREFETCH_DESC.format(floor=pf.REFRESH_FLOOR // 60, budget=pf.BUDGET, ttl=pf.TTL // 60)
+        embed.add_field(name="Lookups", value=self.PREFETCH_LOOKUPS.format(
+            rate=pf.hit_rate(), hits=stats["hits"], hs="" if stats["hits"] == 1 else "s", misses=stats["misses"],
+            ms="" if stats["misses"] == 1 else "es"))
+        embed.add_field(name="Prefetches", value=self.PREFETCH_SPENT.format(
+            rate=pf.use_rate(), prefetched=stats["prefetched"], used=stats["used"], failed=stats["failed"]))
+        embed.add_field(name="Skipped", value=self.PREFETCH_SKIPPED.format(
+            not_linked=stats["not_linked"], over_budget=stats["over_budget"], dropped=stats["dropped"]))
+        await ctx.send(embed=embed)
+
+    @_rl_setup.command(name="import")
+    @checks.admin_or_permissions(administrator=True)
+    async def import_registrations(self, ctx, overwrite: bool = False):
+        """Link many accounts at once, from a CSV or JSON file attached to the command
+
+        Each row holds a Discord user ID, a platform and a gamer ID.
+        CSV columns must be in that order, JSON objects use the keys `discord_id`, `platform` and `gamer_id`.
+        Gamer IDs are checked like in the link command. Every imported account becomes the primary account of its user.
+        Users with linked accounts are skipped, unless overwrite is set to True, which replaces all their accounts.
+        Rows that fail are sent back as a report."""
+        if not ctx.message.attachments:
+            raise CustomNotice(self.IMPORT_NO_FILE)
+        attachment = ctx.message.attachments[0]
+        rows = parse_import_file(attachment.filename, await attachment.read())
+        if not rows:
+            raise CustomNotice(self.IMPORT_EMPTY)
+        async with ctx.typing():
+            valid, failures = await self.resolve_import_rows(rows, ctx.guild)
+            written = await self.link_db.insert_users(valid, overwrite=overwrite)
+            # Links that were kept are watched with the same account already, so only new ones are added.
+            self.watcher.load(await self.link_db.select_all_users(), {})
+        total = len(rows)
+        to_send = self.IMPORT_DONE.format(written=written, total=total, s="" if total == 1 else "s",
+                                          kept=len(valid) - written, failed=len(failures))
+        report = None
+        if failures:
+            report = discord.File(io.BytesIO("\n".join(failures).encode("utf-8")), filename="import_failures.txt")
+        await ctx.send(to_send, file=report)
+
+    @_rl_setup.command(name="export")
+    @checks.is_owner()
+    async def export_registrations(self, ctx, fmt: str = "ndjson"):
+        """Export all account links to a compressed file in the data folder of this cog
+
+        The format can be `ndjson` or `csv`. Accounts can still be linked while the export runs."""
+        fmt = fmt.lower()
+        if fmt not in FORMATS:
+            raise CustomNotice(self.EXPORT_BAD_FORMAT.format(", ".join(FORMATS)))
+        prefix = datetime.datetime.utcnow().strftime("%Y%m%d-%H%M%S-")
+        export = functools.partial(export_tables, self.PATH_DB, ["registrations"], self.FOLDER + "/exports", fmt,
+                                   prefix)
+        async with ctx.typing():
+            results = await asyncio.get_event_loop().run_in_executor(None, export)
+        path, rows = results["registrations"]
+        await ctx.send(self.EXPORT_DONE.format(rows=rows, s="" if rows == 1 else "s", path=path))
+
+    @_rl_setup.command(name="jobs")
+    @checks.is_owner()
+    async def view_jobs(self, ctx, action: str = None):
+        """See the background jobs of this cog (on all servers)
+
+        Use `retry` to queue the failed jobs again, or `clear` to delete them."""
+        if action is not None:
+            await ctx.send(await self.jobs.run_action(action))
+            return
+        await ctx.send(embed=await self.jobs.summary_embed(discord.Colour.red()))
+
     @_rl_setup.command(name="toggle_roles")
     @checks.admin_or_permissions(administrator=True)
     async def toggle_rl_role(self, ctx):
@@ -226,20 +532,14 @@ class LaFusee(commands.Cog):
         gld = ctx.guild
         low_mode = mode.lower()
         if low_mode == "generate":
-            role_dict = {}
             if gld.me.guild_permissions.manage_roles is False:
                 to_say = self.R_GENERATE_NO_PERMS
-            else:
-                for i in reversed(range(1, 20)):  # Reversed because of hierarchy.
-                    role_colour = discord.Colour(self.json_conv.get_tier_colour(i))
-                    role_name = self.json_conv.get_tier_name(i)
-                    new_role = await gld.create_role(name=role_name, colour=role_colour, hoist=True)
-                    role_dict[i] = new_role.id
-                    progress_n = 20 - i
-                    if progress_n % 5 == 0:
-                        await ctx.send(self.R_GENERATE_PROGRESS.format(n=progress_n))
-                to_say = self.R_CONF_SUCCESS
-            await self.config.guild(gld).rankrole_dict.set(role_dict)
+                await self.config.guild(gld).rankrole_dict.set({})
+            else:  # Creating the roles takes a while, so it runs as a job (see generate_rank_roles).
+                payload = {"guild_id": gld.id, "channel_id": ctx.channel.id, "roles": {}}
+                job_id = await self.jobs.enqueue("generate_roles", payload, priority=JobQueue.INTERACTIVE,
+                                                 dedupe_key="generate_roles:{}".format(gld.id))
+                to_say = self.R_GENERATE_BUSY if job_id is None else self.R_GENERATE_QUEUED
         elif low_mode == "detect":
             role_dict = {}
             say_list = []
@@ -267,6 +567,51 @@ class LaFusee(commands.Cog):
             to_say = self.R_CONF_INVALID_MODE
         await ctx.send(to_say)
 
+    @_rl_setup.group(name="rankwatch", invoke_without_command=True)
+    @checks.admin_or_permissions(administrator=True)
+    async def _rankwatch(self, ctx):
+        """Post the rank ups of linked members, and keep their rank roles up to date automatically
+
+        Shows whether this server watches ranks, and how the linked accounts are polled."""
+        channel_id = self.rankwatch_channels.get(ctx.guild.id)
+        embed = discord.Embed(title=self.RANKWATCH_TITLE, colour=discord.Colour.red())
+        embed.description = self.RANKWATCH_DESC.format(
+            min=self.watcher.MIN_INTERVAL // 60, max=self.watcher.MAX_INTERVAL // 60,
+            days=self.watcher.DORMANT_AFTER // 86400, dormant=self.watcher.DORMANT_INTERVAL // 3600)
+        if channel_id is None:
+            server = self.RANKWATCH_SERVER_OFF.format(com(ctx, self.set_rankwatch_channel))
+        else:
+            roles = "on" if await self.config.guild(ctx.guild).rankrole_enabled() else "off"
+            server = self.RANKWATCH_SERVER.format(channel="<#{}>".format(channel_id), roles=roles)
+        embed.add_field(name="This server", value=server, inline=False)
+        p50, p90 = self.watcher.interval_percentiles(50, 90)
+        embed.add_field(name="Accounts", value=self.RANKWATCH_ACCOUNTS.format(
+            n=len(self.watcher), overdue=self.watcher.overdue(), p50=p50 / 60, p90=p90 / 60))
+        stats = self.watcher.stats
+        embed.add_field(name="Polls since load", value=self.RANKWATCH_POLLS.format(
+            polls=stats["polls"], s="" if stats["polls"] == 1 else "s", changes=stats["changes"],
+            failed=stats["failed"], skipped=stats["skipped"]))
+        await ctx.send(embed=embed)
+
+    @_rankwatch.command(name="channel")
+    @checks.admin_or_permissions(administrator=True)
+    async def set_rankwatch_channel(self, ctx, channel: discord.TextChannel):
+        """Post the rank ups of the linked members of this server in a channel"""
+        if not channel.permissions_for(ctx.guild.me).send_messages:
+            raise CustomNotice(self.RANKWATCH_NO_PERMS.format(channel=channel.mention))
+        await self.config.guild(ctx.guild).rankwatch_channel.set(channel.id)
+        self.rankwatch_channels[ctx.guild.id] = channel.id
+        self.watcher.wake(m.id for m in ctx.guild.members)  # Those skipped while nothing watched them.
+        await ctx.send(self.RANKWATCH_SET.format(channel=channel.mention))
+
+    @_rankwatch.command(name="off")
+    @checks.admin_or_permissions(administrator=True)
+    async def rankwatch_off(self, ctx):
+        """Stop posting rank ups and updating rank roles automatically on this server"""
+        await self.config.guild(ctx.guild).rankwatch_channel.set(None)
+        self.rankwatch_channels.pop(ctx.guild.id, None)
+        await ctx.send(self.RANKWATCH_OFF)
+
     # Main command group.
     @commands.group(name="rl", invoke_without_command=True)
     async def _rl(self, ctx):
@@ -277,13 +622,16 @@ class LaFusee(commands.Cog):
         # View stats.
         stat_lines = ("Compact ranks: {}".format(com(ctx, self._lfg_embed)),
                       "General stats: {}".format(com(ctx, self._rocket_embed)),
-                      "Playlist stats: {}".format(com(ctx, self._plist_embed)))
+                      "Playlist stats: {}".format(com(ctx, self._plist_embed)),
+                      "Rank history: {}".format(com(ctx, self.rank_history)),
+                      "Compare members: {}".format(com(ctx, self.compare_users)))
         embed.add_field(name="View stats", value="\n".join(stat_lines))
         # Link account etc.
         link_lines = ("Link account: {}".format(com(ctx, self.register_tag)),
                       "Remove link: {}".format(com(ctx, self.de_register_tag)),
+                      "Linked accounts: {}".format(com(ctx, self._accounts)),
                       "Update rank role: {}".format(com(ctx, self.update_rank_role)))
-        t_slice = None if rankrole_enabled else 2
+        t_slice = None if rankrole_enabled else 3
         embed.add_field(name="Linking your account", value="\n".join(link_lines[:t_slice]))
         embed.set_footer(text=self.GROUP_FOOTER)
         await ctx.send(embed=embed)
@@ -301,17 +649,21 @@ class LaFusee(commands.Cog):
     # Registration commands.
     @_rl.command(name="link")
     async def register_tag(self, ctx, platform, profile_id):
-        """Register your gamer account for use in other commands"""
+        """Register your gamer account for use in other commands
+
+        You can link several accounts (e.g. on different platforms). The first one is your primary account."""
         author = ctx.author
         gld = ctx.guild
         rankrole_enabled = await self.config.guild(gld).rankrole_enabled()
-        db_platform, db_id = await self.link_db.select_user(author.id)
-        if db_platform or db_id:
-            overwrite_error = self.ALREADY_REGISTERED.format(com(ctx, self.de_register_tag))
-            if rankrole_enabled:
-                overwrite_error += "\nTo update your rank role, try {}.\n".format(com(ctx, self.update_rank_role))
-            raise CustomNotice(overwrite_error)
+        accounts = await self.link_db.select_accounts(author.id)
+        if len(accounts) >= self.LINK_MAX_ACCOUNTS:
+            raise CustomNotice(self.LINK_TOO_MANY.format(com(ctx, self.remove_account), n=len(accounts)))
         url_platform, url_id = await self.platform_id_bundle(platform, profile_id)
+        if (url_platform, str(url_id)) in accounts:
+            already_error = self.ALREADY_REGISTERED
+            if rankrole_enabled:
+                already_error += "\nTo update your rank role, try {}.\n".format(com(ctx, self.update_rank_role))
+            raise CustomNotice(already_error)
         msg = await ctx.send("Linking your account...")
         try:  # Check their rankings to see if their platform + ID pair gives an error.
             response = await self.psy_api.player_skills(url_platform, url_id)
@@ -319,14 +671,22 @@ class LaFusee(commands.Cog):
             edit_say = str(e)
         else:
             await self.link_db.insert_user(author.id, str(author), url_platform, url_id)
+            self.record_skills(url_platform, url_id, response)
+            self.watcher.add(author.id, url_platform, url_id, RankWatcher.ranks_of(response.get("player_skills")),
+                             delay=RankWatcher.INITIAL_INTERVAL)
             cap_platform = url_platform.capitalize()
-            link_say = self.LINK_SUCCESS.format(cap_platform)
+            if accounts:
+                link_say = self.LINK_EXTRA_SUCCESS.format(cap_platform, com(ctx, self._accounts))
+            else:
+                link_say = self.LINK_SUCCESS.format(cap_platform)
             if rankrole_enabled is False:
                 edit_say = link_say
             else:  # Rank roles are enabled.
-                # Check their highest roles, and give a role if this is not unranked.
-                player_skills = response.get("player_skills")  # Value is a list.
+                # Check their highest roles over all their accounts, and give a role if this is not unranked.
+                responses = {(url_platform, str(url_id)): response}
+                responses.update(await self.fetch_skills_many({acc: acc for acc in accounts}, self.ACCOUNTS_TIMEOUT))
                 ignore_special = await self.config.guild(ctx.guild).ignore_special()
+                player_skills = responses[best_account(responses, ignore_special)].get("player_skills")
                 best_tier, best_list_id, played_lists = best_playlist(player_skills, ignore_special)
                 if best_tier == 0:  # Unranked, so no actual highest rank.
                     role_say = self.LINK_ROLE_UNRANKED  # Keep roles in the event one's ranks got inactive.
@@ -337,18 +697,18 @@ class LaFusee(commands.Cog):
 
     @_rl.command(name="update")
     async def update_rank_role(self, ctx):
-        """Update your rank role based on the current best rank of your linked account"""
+        """Update your rank role based on the current best rank of your linked accounts"""
         gld = ctx.guild
         rankrole_enabled = await self.config.guild(gld).rankrole_enabled()
         if rankrole_enabled is False:
             raise CustomNotice(self.RANK_ROLE_DISABLED)
         author = ctx.author
-        url_platform, url_id = await self.link_db.select_user(author.id)
-        if url_platform is None and url_id is None:
+        accounts = await self.link_db.select_accounts(author.id)
+        if not accounts:
             raise CustomNotice(self.AUTHOR_NOT_REGISTERED)
-        response = await self.psy_api.player_skills(url_platform, url_id)
-        player_skills = response.get("player_skills")  # Value is a list.
+        responses = await self.fetch_linked_skills(accounts, prefetched=False)  # Right after a rank up, maybe.
         ignore_special = await self.config.guild(ctx.guild).ignore_special()
+        player_skills = responses[best_account(responses, ignore_special)].get("player_skills")  # Value is a list.
         best_tier, best_list_id, played_lists = best_playlist(player_skills, ignore_special)
         if best_tier == 0:  # Unranked, so no actual highest rank.
             to_say = self.RANK_ROLE_UPDATE_UNRANKED  # Keep roles in the event one's ranks got inactive.
@@ -359,22 +719,23 @@ class LaFusee(commands.Cog):
 
     @_rl.command(name="unlink")
     async def de_register_tag(self, ctx, confirmation: bool = False):
-        """De-register your gamer account for use in other commands"""
+        """De-register all your gamer accounts for use in other commands"""
         gld = ctx.guild
         author = ctx.author
         author_id = author.id
 
-        url_platform, url_id = await self.link_db.select_user(author_id)
-        if url_platform is None and url_id is None:
+        accounts = await self.link_db.select_accounts(author_id)
+        if not accounts:
             to_say = self.AUTHOR_NOT_REGISTERED
         else:
-            cap_platform = url_platform.capitalize()
+            cap_platform = self.ids_str(accounts)
             rankrole_enabled = await self.config.guild(gld).rankrole_enabled()
             if not confirmation:
                 role_note = self.LINK_REMOVE_ROLE_NOTE if rankrole_enabled else ""
                 to_say = self.LINK_REMOVE_PROMPT.format(role_note, cap_platform, author.mention)
             else:
                 await self.link_db.delete_user(author_id)
+                self.watcher.remove(author_id)
                 if rankrole_enabled is False:
                     to_say = self.LINK_REMOVED.format(cap_platform)
                 else:
@@ -383,14 +744,57 @@ class LaFusee(commands.Cog):
                     to_say = self.LINK_AND_RANKROLE_REMOVED.format(cap_platform)
         await ctx.send(to_say)
 
+    @_rl.group(name="accounts", invoke_without_command=True)
+    async def _accounts(self, ctx, user: discord.Member = None):
+        """List the linked accounts of a member
+
+        If no user is provided, it will show your own."""
+        if user is None:
+            user = ctx.author
+        accounts = await self.link_db.select_accounts(user.id)
+        if not accounts:
+            self.check_registration_complete(None, None, user, ctx)  # Raises the right error.
+        rows = [self.ACCOUNTS_ROW.format(platform=platform.capitalize(), gamer_id=gamer_id,
+                                         primary=self.ACCOUNTS_PRIMARY_MARK if n == 0 else "")
+                for n, (platform, gamer_id) in enumerate(accounts)]
+        embed = discord.Embed(title=self.ACCOUNTS_TITLE.format(user.display_name), colour=discord.Colour.red())
+        embed.description = "\n".join(rows)
+        embed.set_footer(text=self.ACCOUNTS_FOOTER)
+        await ctx.send(embed=embed)
+
+    @_accounts.command(name="primary")
+    async def primary_account(self, ctx, platform, profile_id):
+        """Make one of your linked accounts the account that the stats commands use"""
+        url_platform, url_id = await self.platform_id_bundle(platform, profile_id)
+        if not await self.link_db.set_primary(ctx.author.id, url_platform, url_id):
+            raise CustomNotice(self.ACCOUNTS_NOT_LINKED)
+        await ctx.send(self.ACCOUNTS_PRIMARY_SET.format(url_platform.capitalize()))
+
+    @_accounts.command(name="remove")
+    async def remove_account(self, ctx, platform, profile_id):
+        """Unlink one of your accounts
+
+        If it was your primary account, the oldest of your other accounts becomes primary."""
+        author = ctx.author
+        url_platform, url_id = await self.platform_id_bundle(platform, profile_id)
+        if not await self.link_db.delete_account(author.id, url_platform, url_id):
+            raise CustomNotice(self.ACCOUNTS_NOT_LINKED)
+        self.watcher.remove(author.id, url_platform, url_id)
+        to_say = self.ACCOUNTS_REMOVED.format(url_platform.capitalize())
+        rankrole_enabled = await self.config.guild(ctx.guild).rankrole_enabled()
+        if rankrole_enabled and not await self.link_db.select_accounts(author.id):  # Remove any leftover rank roles.
+            await self.update_member_rankroles(ctx.guild, author)
+            to_say = self.LINK_AND_RANKROLE_REMOVED.format(url_platform.capitalize() + " ID")
+        await ctx.send(to_say)
+
     # Rank lookup commands.
     @_rl.group(name="lfg", invoke_without_command=True)
     async def _lfg_embed(self, ctx, platform: str, profile_id: str):
         """Show a player's ranks in LFG embed format"""
         url_platform, url_id = await self.platform_id_bundle(platform, profile_id)
-        response = await self.psy_api.player_skills(url_platform, url_id, ensure_played=True)
+        response = await self.fetch_skills(url_platform, url_id, ensure_played=True)
         embeds = self.make_lfg_embed(response, url_platform)
-        await red_menu.menu(ctx, embeds, red_menu.DEFAULT_CONTROLS, timeout=30.0)
+        await self.menus.open(ctx, len(embeds), embeds.__getitem__, timeout=30.0)
 
     @_lfg_embed.command(name="user", aliases=["me"])
     async def lfg_user(self, ctx, user: discord.Member = None):
@@ -401,15 +805,15 @@ class LaFusee(commands.Cog):
             user = ctx.author
         url_platform, url_id = await self.link_db.select_user(user.id)
         self.check_registration_complete(url_platform, url_id, user, ctx)  # Valid registration or error raised.
-        response = await self.psy_api.player_skills(url_platform, url_id, ensure_played=True)
+        response = await self.fetch_skills(url_platform, url_id, ensure_played=True)
         embeds = self.make_lfg_embed(response, url_platform, user)
-        await red_menu.menu(ctx, embeds, red_menu.DEFAULT_CONTROLS, timeout=30.0)
+        await self.menus.open(ctx, len(embeds), embeds.__getitem__, timeout=30.0)
 
     @_rl.group(name="stats", aliases=["rocket"], invoke_without_command=True)
     async def _rocket_embed(self, ctx, platform: str, profile_id: str):
         """Show a player's stats in standard embed format"""
         url_platform, url_id = await self.platform_id_bundle(platform, profile_id)
-        response = await self.psy_api.player_skills(url_platform, url_id, ensure_played=True)
+        response = await self.fetch_skills(url_platform, url_id, ensure_played=True)
         gas_od = await self.psy_api.player_stat_values(url_platform, url_id)
         await ctx.send(embed=self.make_rocket_embed(response, gas_od, url_platform))
 
@@ -422,7 +826,7 @@ class LaFusee(commands.Cog):
             user = ctx.author
         url_platform, url_id = await self.link_db.select_user(user.id)
         self.check_registration_complete(url_platform, url_id, user, ctx)  # Valid registration or error raised.
-        response = await self.psy_api.player_skills(url_platform, url_id, ensure_played=True)
+        response = await self.fetch_skills(url_platform, url_id, ensure_played=True)
         gas_od = await self.psy_api.player_stat_values(url_platform, url_id)
         await ctx.send(embed=self.make_rocket_embed(response, gas_od, url_platform, user))
 
@@ -434,7 +838,7 @@ class LaFusee(commands.Cog):
         if list_id is None:  # Can be 0, so None should be explicit.
             raise CustomNotice(self.PLAYLIST_INVALID)
         url_platform, url_id = await self.platform_id_bundle(platform, profile_id)  # Get platform / ID.
-        response = await self.psy_api.player_skills(url_platform, url_id, ensure_played=True)  # Get player skills.
+        response = await self.fetch_skills(url_platform, url_id, ensure_played=True)  # Get player skills.
         content, embed = self.make_plist_embed(response, list_id, url_platform)
         await ctx.send(content, embed=embed)
 
@@ -451,10 +855,239 @@ class LaFusee(commands.Cog):
             user = ctx.author
         url_platform, url_id = await self.link_db.select_user(user.id)  # Get user from DB.
         self.check_registration_complete(url_platform, url_id, user, ctx)  # Valid registration or error raised.
-        response = await self.psy_api.player_skills(url_platform, url_id, ensure_played=True)
+        response = await self.fetch_skills(url_platform, url_id, ensure_played=True)
         content, embed = self.make_plist_embed(response, list_id, url_platform, user)
         await ctx.send(content, embed=embed)
 
+    @_rl.command(name="compare")
+    async def compare_users(self, ctx, *users: discord.Member):
+        """Compare the ranks of several members side by side
+
+        All linked accounts are looked up at the same time, so comparing a team takes as long as one lookup.
+        Members with several linked accounts are shown with their best one."""
+        users = list(dict.fromkeys(users))
+        if not users:
+            await ctx.send_help()
+            return
+        if len(users) > self.COMPARE_MAX_USERS:
+            raise CustomNotice(self.COMPARE_TOO_MANY.format(self.COMPARE_MAX_USERS))
+        accounts = await self.link_db.select_users([u.id for u in users])
+        if not accounts:
+            raise CustomNotice(self.COMPARE_NONE_LINKED)
+        async with ctx.typing():
+            found = await self.fetch_skills_many({(user_id, acc): acc for user_id, user_accounts in accounts.items()
+                                                  for acc in user_accounts}, self.COMPARE_TIMEOUT)
+        responses = {}  # User ID -> the response of their best account.
+        for user_id, user_accounts in accounts.items():
+            user_found = {acc: found[(user_id, acc)] for acc in user_accounts if (user_id, acc) in found}
+            if user_found:
+                responses[user_id] = user_found[best_account(user_found)]
+        names = {u.id: u.display_name[:12] for u in users}
+        pad = max(len(n) for n in names.values())
+        plist_rows: Dict[int, List[tuple]] = {}  # Playlist -> (sr, row) of every player that played it.
+        best_tier = 0
+        for user in users:
+            player_skills = (responses.get(user.id) or {}).get("player_skills") or []
+            best_tier = max(best_tier, best_playlist(player_skills)[0] if player_skills else 0)
+            for d in player_skills:
+                tier = self.json_conv.get_tier_name(d["tier"]) if d["playlist"] != 0 else ""
+                row = self.COMPARE_ROW.format(name=names[user.id], pad=pad, sr=float_sr(d), tier=tier)
+                plist_rows.setdefault(d["playlist"], []).append((float_sr(d), row))
+        embed = discord.Embed(title=self.COMPARE_TITLE, colour=self.json_conv.get_tier_colour(best_tier))
+        for list_id in self.PLAYLIST_IDS:
+            if list_id in plist_rows:
+                rows = [row for sr, row in sorted(plist_rows[list_id], key=lambda x: x[0], reverse=True)]
+                embed.add_field(name=self.json_conv.get_playlist_name(list_id), inline=False,
+                                value="```\n{}\n```".format("\n".join(rows)))
+        notes = []
+        missing = [u.mention for u in users if u.id not in accounts]
+        failed = [u.mention for u in users if u.id in accounts and not (responses.get(u.id) or {}).get("player_skills")]
+        if missing:
+            notes.append(self.COMPARE_MISSING.format(", ".join(missing)))
+        if failed:
+            notes.append(self.COMPARE_FAILED.format(", ".join(failed)))
+        if notes:
+            embed.description = "\n".join(notes)
+        await ctx.send(embed=embed)
+
+    @commands.guild_only()
+    @_rl.group(name="queue", aliases=["q"], invoke_without_command=True)
+    async def _queue(self, ctx, playlist: str):
+        """Join the matchmaking queue of a playlist, to find a group with a similar rank
+
+        Your linked account's rating in that playlist is used. The accepted rating difference widens while you wait.
+        You leave the queue when you go offline, or after 30 minutes."""
+        list_id = self.json_conv.get_input_playlist(playlist)
+        if list_id is None:  # Can be 0, so None should be explicit.
+            raise CustomNotice(self.PLAYLIST_INVALID)
+        user = ctx.author
+        url_platform, url_id = await self.link_db.select_user(user.id)
+        self.check_registration_complete(url_platform, url_id, user, ctx)  # Valid registration or error raised.
+        response = await self.fetch_skills(url_platform, url_id, ensure_played=True)
+        plist_name = self.json_conv.get_playlist_name(list_id)
+        skills = next((d for d in response["player_skills"] if d["playlist"] == list_id), None)
+        if skills is None:
+            raise CustomNotice(self.PLAYLIST_NOT_PLAYED.format(plist=plist_name))
+        group = self.matchmaker.join(ctx.guild.id, list_id, user.id, float_sr(skills), skills["tier"], ctx.channel.id)
+        if group is not None:
+            await self.announce_match(ctx.guild.id, list_id, group, channel=ctx.channel)
+            return
+        sizes, (_, _, tolerance) = self.matchmaker.status(ctx.guild.id, user.id)
+        n = sizes[list_id] - 1
+        await ctx.send(self.QUEUE_JOINED.format(plist=plist_name, n=n, s="" if n == 1 else "s", tol=tolerance))
+
+    @commands.guild_only()
+    @_queue.command(name="leave")
+    async def queue_leave(self, ctx):
+        """Leave the matchmaking queue"""
+        list_id = self.matchmaker.leave(ctx.guild.id, ctx.author.id)
+        if list_id is None:
+            raise CustomNotice(self.QUEUE_NOT_IN)
+        await ctx.send(self.QUEUE_LEFT.format(plist=self.json_conv.get_playlist_name(list_id)))
+
+    @commands.guild_only()
+    @_queue.command(name="status")
+    async def queue_status(self, ctx):
+        """Show how many members queue for each playlist on this server"""
+        sizes, own = self.matchmaker.status(ctx.guild.id, ctx.author.id)
+        rows = [self.QUEUE_STATUS_ROW.format(plist=self.json_conv.get_playlist_name(list_id), n=n)
+                for list_id, n in sorted(sizes.items())]
+        if own is not None:
+            list_id, waited, tolerance = own
+            minutes, seconds = divmod(int(waited), 60)
+            rows.append("\n" + self.QUEUE_STATUS_OWN.format(plist=self.json_conv.get_playlist_name(list_id),
+                                                             minutes=minutes, seconds=seconds, tol=tolerance))
+        await ctx.send("\n".join(rows) or self.QUEUE_STATUS_EMPTY)
+
+    @_rl.command(name="rankhistory", aliases=["history"])
+    async def rank_history(self, ctx, user: Optional[discord.Member] = None, days: int = 30):
+        """Show how the ranks of a member's linked account changed over time
+
+        History is recorded whenever the stats of a linked account are looked up.
+        If no user is provided, it will show your own."""
+        if user is None:
+            user = ctx.author
+        url_platform, url_id = await self.link_db.select_user(user.id)
+        self.check_registration_complete(url_platform, url_id, user, ctx)  # Valid registration or error raised.
+        end = int(time.time())
+        points = await self.link_db.select_history(url_platform, url_id, end - days * 24 * 60 * 60, end)
+        if not points:
+            raise CustomNotice(self.HISTORY_NONE.format(days=days))
+        # Collect the points of each playlist, in chronological order.
+        plist_points: Dict[int, List[dict]] = {}
+        for stamp, blob in points:
+            for d in unpack_skills(blob):
+                plist_points.setdefault(d["playlist"], []).append(d)
+        best_tier, best_list_id, played_lists = best_playlist(unpack_skills(points[-1][1]))
+        embed = discord.Embed(title=self.HISTORY_TITLE.format(days=days))
+        embed.colour = self.json_conv.get_tier_colour(best_tier)
+        for playlist_id, plist_dicts in sorted(plist_points.items()):
+            first, last = plist_dicts[0], plist_dicts[-1]
+            first_sr, last_sr = float_sr(first), float_sr(last)
+            rows = [self.HISTORY_SR_ROW.format(first_sr, last_sr, last_sr - first_sr)]
+            if playlist_id != 0:
+                rows.append("{} → {}".format(self.json_conv.tier_div_str(first), self.json_conv.tier_div_str(last)))
+            rows.append("Matches: +{}".format(last["matches_played"] - first["matches_played"]))
+            embed.add_field(name=self.json_conv.get_playlist_name(playlist_id), value="\n".join(rows))
+        n = len(points)
+        embed.set_footer(text=self.HISTORY_FOOTER.format(user_id=user.id, n=n, s="" if n == 1 else "s"),
+                         icon_url=user.avatar_url_as(static_format="png"))
+        embed.timestamp = datetime.datetime.utcfromtimestamp(points[0][0])
+        await ctx.send(embed=embed)
+
+    @commands.guild_only()
+    @commands.command(name="rlboard")
+    async def rank_board(self, ctx, playlist: str = None):
+        """Show the Rocket League ranks of the linked members on this server
+
+        If a playlist is provided, members are ranked on that playlist. Otherwise, their best rank is used.
+        Members appear once the stats of their linked account have been looked up."""
+        list_id = None
+        if playlist is not None:
+            list_id = self.json_conv.get_input_playlist(playlist)
+            if list_id is None:  # Can be 0, so None should be explicit.
+                raise CustomNotice(self.PLAYLIST_INVALID)
+        gld = ctx.guild
+        member_ids = await self.link_db.select_board_order((mem.id for mem in gld.members), list_id)
+        if not member_ids:
+            raise CustomNotice(self.BOARD_EMPTY)
+        count = len(member_ids)
+        page_count = (count + self.BOARD_PAGE_SIZE - 1) // self.BOARD_PAGE_SIZE
+        plist_name = " – " + self.json_conv.get_playlist_name(list_id) if list_id is not None else ""
+        title = self.BOARD_TITLE.format(plist_name)
+        width = len(str(count))
+
+        async def render(page: int) -> discord.Embed:
+            start = page * self.BOARD_PAGE_SIZE
+            page_ids = member_ids[start:start + self.BOARD_PAGE_SIZE]
+            board_rows = await self.link_db.select_board_page(page_ids, list_id)
+            rows = []
+            for n, user_id in enumerate(page_ids, start=start + 1):
+                if user_id not in board_rows:  # Unlinked after the order was fetched.
+                    continue
+                _, tier, best_list_id, sr, division, stamp = board_rows[user_id]
+                tier_div = self.json_conv.tier_div_str({"tier": tier, "division": division})
+                in_list = ", " + self.json_conv.get_playlist_name(best_list_id, mode=1) \
+                    if list_id is None and best_list_id is not None else ""
+                rows.append(self.BOARD_ROW.format(n, width, f"<@{user_id}>", sr, tier_div, in_list))
+            embed = discord.Embed(title=title, description="\n".join(rows), colour=discord.Colour.red())
+            embed.set_footer(text=self.BOARD_FOOTER.format(n=page + 1, total=page_count, count=count,
+                                                           s="" if count == 1 else "s"))
+            return embed
+
+        if page_count == 1:
+            await ctx.send(embed=await render(0))
+        else:
+            await self.menus.open(ctx, page_count, render, timeout=30.0)
+
+    @commands.guild_only()
+    @checks.mod_or_permissions(administrator=True)
+    @commands.command(name="rlanalytics", aliases=["rldist"])
+    async def rank_analytics(self, ctx, user: Optional[discord.Member] = None, playlist: str = None):
+        """Show the rank distribution of the linked members on this server
+
+        If a playlist is provided, the tier distribution and SR percentiles of that playlist are shown.
+        If a user is provided, their position on this server is shown as well."""
+        list_id = None
+        if playlist is not None:
+            list_id = self.json_conv.get_input_playlist(playlist)
+            if list_id is None:  # Can be 0, so None should be explicit.
+                raise CustomNotice(self.PLAYLIST_INVALID)
+        skills = await self.analytics.guild_skills(ctx.guild)
+        n = len(skills)
+        if n == 0:
+            raise CustomNotice(self.ANALYTICS_EMPTY)
+        title = " – " + self.json_conv.get_playlist_name(list_id) if list_id is not None else ""
+        embed = discord.Embed(title=self.ANALYTICS_TITLE.format(title), colour=discord.Colour.red(),
+                              description=self.ANALYTICS_DESC.format(n=n, s="" if n == 1 else "s"))
+        histogram = skills.tier_histogram(list_id)
+        total = histogram.sum()
+        tier_rows = [self.ANALYTICS_TIER_ROW.format(self.json_conv.get_tier_name(tier), count, 100 * count / total)
+                     for tier, count in reversed(list(enumerate(histogram.tolist()))) if count]
+        if list_id is None:
+            counts, medians = skills.player_counts(), skills.median_sr()
+            median_rows = [self.ANALYTICS_MEDIAN_ROW.format(self.json_conv.get_playlist_name(playlist_id), medians[i],
+                                                            counts[i], "" if counts[i] == 1 else "s")
+                           for i, playlist_id in enumerate(skills.playlist_ids) if counts[i]]
+            embed.add_field(name="Median SR", value="\n".join(median_rows), inline=False)
+            embed.add_field(name="Best tier", value="\n".join(tier_rows) or "-")
+        else:
+            embed.add_field(name="Tiers", value="\n".join(tier_rows) or "-")
+            sr_values = skills.sr_percentiles(list_id, self.ANALYTICS_PERCENTILES)
+            if sr_values is not None:
+                embed.add_field(name="SR percentiles", value="\n".join(
+                    self.ANALYTICS_PERCENTILE_ROW.format(pct, sr) for pct, sr in zip(self.ANALYTICS_PERCENTILES,
+                                                                                     sr_values)))
+        if user is not None:
+            positions = skills.positions(user.id)
+            position_rows = [self.ANALYTICS_POSITION_ROW.format(self.json_conv.get_playlist_name(playlist_id),
+                                                                *positions[playlist_id])
+                             for playlist_id in skills.playlist_ids
+                             if playlist_id in positions and list_id in (None, playlist_id)]
+            embed.add_field(name=str(user), value="\n".join(position_rows) or self.ANALYTICS_NO_POSITION,
+                            inline=False)
+        await ctx.send(embed=embed)
+
     # Extra commands.
     @commands.command(name="steamadd", aliases=["add"])
     async def send_steam_link(self, ctx, profile_id: str = None):
@@ -482,7 +1115,7 @@ class LaFusee(commands.Cog):
     async def skills_test(self, ctx, platform, profile_id):
         """Used for seeing the response of a PlayerSkills query"""
         url_platform, url_id = await self.platform_id_bundle(platform, profile_id)
-        response = await self.psy_api.player_skills(url_platform, url_id)
+        response = await self.fetch_skills(url_platform, url_id)
         str_list = []
         for k, v in response.items():
             str_row = "`{}`: {}".format(k, v)
@@ -502,7 +1135,7 @@ class LaFusee(commands.Cog):
     async def raw_skills(self, ctx, platform, profile_id):
         """Used for seeing the response of a PlayerSkills query"""
         url_platform, url_id = await self.platform_id_bundle(platform, profile_id)
-        response = await self.psy_api.player_skills(url_platform, url_id)
+        response = await self.fetch_skills(url_platform, url_id)
         await ctx.send("```json\n{}```".format(dumps(response, sort_keys=True, indent=1)))
 
     @_tests.command(name="gas")
@@ -555,6 +1188,7 @@ class LaFusee(commands.Cog):
         url_platform, url_id = await self.link_db.select_user(author_id)
         if url_platform or url_id:  # Nothing linked.
             await self.link_db.delete_user(author_id)
+            self.watcher.remove(author_id)
 
     async def check_token_fmt(self, ctx: commands.Context, token: str, expected_token_length: int) -> None:
         """Check if a token is hexadecimal and a proper length. Return None if so, raise error otherwise"""
@@ -622,6 +1256,180 @@ class LaFusee(commands.Cog):
                 to_return = self.RANK_ROLE_UPDATED.format(r_role=tier_name)
         return to_return
 
+    async def fetch_skills(self, url_platform: str, url_id, ensure_played: bool = False,
+                           lane: str = PsyonixCalls.INTERACTIVE, prefetched: bool = True) -> Optional[dict]:
+        """Get a player's skills from the Psyonix API, and record them in the rank history if the account is linked
+
+        If prefetched is True, a fresh prefetched response is used instead of an API call, if there is one."""
+        response = self.prefetcher.get(url_platform, url_id) if prefetched else None
+        if response is None:
+            response = await self.psy_api.player_skills(url_platform, url_id, ensure_played=ensure_played, lane=lane)
+            self.record_skills(url_platform, url_id, response)
+        elif ensure_played and not response.get("player_skills"):
+            raise PsyonixCallError(PsyonixCalls.NO_MATCHES)
+        return response
+
+    async def fetch_linked_skills(self, accounts: List[tuple], prefetched: bool = True,
+                                  lane: str = PsyonixCalls.INTERACTIVE) -> Dict[tuple, dict]:
+        """
+        :param accounts: The (url_platform, url_id) of the linked accounts of a user, primary first.
+        :param prefetched: Whether a fresh prefetched response may be used instead of an API call.
+        :param lane: The request lane of the API calls.
+        :return: (url_platform, url_id) -> skills response, for every account looked up within the deadline.
+
+        Look up all accounts of a user at once, under one deadline of ACCOUNTS_TIMEOUT. A single account is looked
+        up like fetch_skills. If no account could be looked up, the error of the first failed account is raised."""
+        if len(accounts) == 1:
+            return {accounts[0]: await self.fetch_skills(*accounts[0], prefetched=prefetched, lane=lane)}
+        tasks = [asyncio.ensure_future(self.fetch_skills(p, i, prefetched=prefetched, lane=lane)) for p, i in accounts]
+        done, pending = await asyncio.wait(tasks, timeout=self.ACCOUNTS_TIMEOUT)
+        for task in pending:
+            task.cancel()
+        responses = {acc: t.result() for acc, t in zip(accounts, tasks) if t in done and t.exception() is None}
+        if not responses:
+            errors = [t.exception() for t in tasks if t in done]
+            raise errors[0] if errors else PsyonixCallError(PsyonixCalls.TIMEOUT_ERROR)
+        return responses
+
+    async def fetch_best_skills(self, user_id: int, prefetched: bool = True,
+                                lane: str = PsyonixCalls.INTERACTIVE) -> Optional[dict]:
+        """Get the skills response of the best linked account of a user (see best_account), or None if not linked
+
+        All accounts are looked up like fetch_linked_skills does, which raises if none could be. Used by other cogs."""
+        accounts = await self.link_db.select_accounts(user_id)
+        if not accounts:
+            return None
+        responses = await self.fetch_linked_skills(accounts, prefetched=prefetched, lane=lane)
+        return responses[best_account(responses)]
+
+    async def fetch_skills_many(self, accounts: Dict[int, tuple], timeout: float,
+                                lane: str = PsyonixCalls.INTERACTIVE) -> Dict[int, Optional[dict]]:
+        """
+        :param accounts: A dict of key -> (url_platform, url_id).
+        :param timeout: The deadline in seconds, shared by all lookups.
+        :param lane: The request lane of the API calls.
+        :return: key -> skills response, for every lookup that succeeded within the deadline.
+
+        Look up the skills of several accounts at once. The API calls share the compare concurrency limit."""
+        async def fetch(key, url_platform, url_id):
+            async with self.compare_limit:
+                return key, await self.fetch_skills(url_platform, url_id, lane=lane)
+
+        if not accounts:
+            return {}
+        tasks = [asyncio.ensure_future(fetch(k, p, i)) for k, (p, i) in accounts.items()]
+        done, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        return dict(t.result() for t in done if not t.cancelled() and t.exception() is None)
+
+    async def resolve_import_rows(self, rows: List[ImportRow],
+                                  gld: Optional[discord.Guild]) -> (List[tuple], List[str]):
+        """
+        :param rows: The rows of an import file.
+        :param gld: The guild the import is done in, for the usernames. None in DMs.
+        :return: A list of (user_id, username, platform, gamer_id) rows to insert, and a list of failure lines.
+
+        Normalise the gamer IDs like platform_id_bundle does. Steam vanity IDs are resolved concurrently,
+        with at most IMPORT_CONCURRENCY calls at once."""
+        limit = asyncio.Semaphore(self.IMPORT_CONCURRENCY)
+
+        async def resolve(row: ImportRow):
+            if not row.user_id.isdigit():
+                raise AccountInputError(self.IMPORT_BAD_USER)
+            if not row.platform or not row.gamer_id:
+                raise AccountInputError(self.IMPORT_INCOMPLETE)
+            async with limit:
+                return await self.platform_id_bundle(row.platform, row.gamer_id)
+
+        results = await asyncio.gather(*(resolve(row) for row in rows), return_exceptions=True)
+        resolved: Dict[int, tuple] = {}  # User ID -> row. The last row of a user wins.
+        failures = []
+        for row, result in zip(rows, results):
+            if isinstance(result, Exception):
+                reason = str(result).replace(self.ERROR, "").splitlines()[0] if str(result) else repr(result)
+                failures.append(self.IMPORT_FAILURE_ROW.format(line=row.line, user_id=row.user_id, reason=reason))
+                continue
+            user_id = int(row.user_id)
+            if user_id in resolved:
+                failures.append(self.IMPORT_FAILURE_ROW.format(line=resolved[user_id][0].line, user_id=user_id,
+                                                               reason=self.IMPORT_DUPLICATE))
+            member = gld.get_member(user_id) if gld else None
+            platform, gamer_id = result
+            resolved[user_id] = (row, (user_id, str(member) if member else None, platform, gamer_id))
+        return [insert_row for _, insert_row in resolved.values()], failures
+
+    def record_skills(self, url_platform: str, url_id, response: Optional[dict]) -> None:
+        """Store the skills of an account in the background, so the lookup that fetched them doesn't wait on it"""
+        if response and response.get("player_skills"):
+            task = asyncio.ensure_future(self._record_skills(url_platform, url_id, response["player_skills"]))
+            self.recordings.add(task)
+            task.add_done_callback(self.recordings.discard)
+
+    async def _record_skills(self, url_platform: str, url_id, player_skills: list) -> None:
+        """Store the skills of an account in the rank history and rank board, if it's linked and they changed"""
+        try:
+            is_changed = await self.link_db.insert_history(url_platform, url_id, pack_skills(player_skills))
+            if is_changed:
+                best, playlists = self.rank_board_rows(player_skills)
+                await self.link_db.update_rank_board(url_platform, url_id, best, playlists)
+        except Exception as e:  # Only a side effect of a lookup, so it must never fail the command.
+            print("LaFusee -> Recording the skills of {} {} failed: {!r}".format(url_platform, url_id, e))
+
+    def is_rank_watched(self, user_id: int) -> bool:
+        """Whether a user is a member of a server that watches rank ups"""
+        for guild_id in self.rankwatch_channels:
+            gld = self.bot.get_guild(guild_id)
+            if gld is not None and gld.get_member(user_id) is not None:
+                return True
+        return False
+
+    async def announce_rank_change(self, user_id: int, changes: List[RankChange], player_skills: list) -> None:
+        """Post the tier ups of a user, and update their rank role, in every server that watches rank ups
+
+        Division changes within a tier are not posted, and don't affect the rank role. The rank role follows the best
+        of all accounts of the user, so if they linked several, the other accounts are looked up as well."""
+        tier_changes = [c for c in changes if c.old[0] != c.new[0]]
+        if not tier_changes:
+            return
+        responses = None
+        for guild_id, channel_id in list(self.rankwatch_channels.items()):
+            gld = self.bot.get_guild(guild_id)
+            mem = gld.get_member(user_id) if gld is not None else None
+            if mem is None:
+                continue
+            rows = [self.RANKWATCH_UP.format(mention=mem.mention, plist=self.json_conv.get_playlist_name(c.playlist),
+                                             tier=self.json_conv.tier_div_str({"tier": c.new[0], "division": c.new[1]}))
+                    for c in tier_changes if c.new[0] > c.old[0]]
+            channel = gld.get_channel(channel_id)
+            try:
+                if rows and channel is not None:
+                    await channel.send("\n".join(rows))
+                if await self.config.guild(gld).rankrole_enabled():
+                    if responses is None:
+                        accounts = await self.link_db.select_accounts(user_id)
+                        responses = {None: {"player_skills": player_skills}} if len(accounts) < 2 else \
+                            await self.fetch_linked_skills(accounts, prefetched=False, lane=PsyonixCalls.BACKGROUND)
+                    ignore_special = await self.config.guild(gld).ignore_special()
+                    best_skills = responses[best_account(responses, ignore_special)].get("player_skills") or []
+                    best_tier, _, _ = best_playlist(best_skills, ignore_special)
+                    if best_tier != 0:  # Keep roles when the ranks got inactive, like the update command.
+                        await self.update_member_rankroles(gld, mem, best_tier)
+            except (AssertionError, discord.HTTPException, LaFuseeError) as e:  # E.g. incomplete role setup.
+                print("LaFusee -> Rank watch of user {} in guild {} failed: {!r}".format(user_id, guild_id, e))
+
+    async def announce_match(self, guild_id: int, list_id: int, group: List[QueueEntry],
+                             channel: discord.TextChannel = None) -> None:
+        """Ping the members of a matched queue group, in the channel where the longest waiting member queued"""
+        if channel is None:
+            channel = self.bot.get_channel(min(group, key=lambda e: e.joined).channel_id)
+            if channel is None:
+                return
+        mentions = " ".join("<@{}>".format(e.user_id) for e in group)
+        average = sum(e.sr for e in group) / len(group)
+        await channel.send(self.QUEUE_MATCH.format(plist=self.json_conv.get_playlist_name(list_id),
+                                                   mentions=mentions, sr=average))
+
     async def platform_id_bundle(self, platform_in: str, id_in: str):
         """Verify the input of a platform and gamer id
 
@@ -656,6 +1464,14 @@ class LaFusee(commands.Cog):
             id_out = id_in
         return platform_out, id_out
 
+    @staticmethod
+    def ids_str(accounts: List[tuple]) -> str:
+        """The platforms of linked accounts as a readable string, e.g. Steam ID, or Steam and Ps4 IDs"""
+        names = [platform.capitalize() for platform, _ in accounts]
+        if len(names) == 1:
+            return "{} ID".format(names[0])
+        return "{} and {} IDs".format(", ".join(names[:-1]), names[-1])
+
     @staticmethod
     def int_to_steam_id64(id_64: int) -> int:
         """Converts a SteamID64 to the one that the Psyonix API recognises
@@ -664,6 +1480,22 @@ class LaFusee(commands.Cog):
         As a consequence, Discord Steam links use an ID64 that is not recognised by the Rocket League API."""
         return (id_64 % (2 ** 32)) + 76561197960265728
 
+    @staticmethod
+    def rank_board_rows(player_skills: list) -> (dict, List[dict]):
+        """Make the best-rank row and the playlist rows of the rank board from a player's skills
+
+        Missing or null ratings and ranks (e.g. of unranked playlists) count as 0."""
+        player_skills = [{**d, "mu": d.get("mu") or 0, "tier": d.get("tier") or 0, "division": d.get("division") or 0}
+                         for d in player_skills if d.get("playlist") is not None]
+        playlists = [{"playlist": d["playlist"], "mu": d["mu"], "sigma": d.get("sigma"), "sr": float_sr(d),
+                      "tier": d["tier"], "division": d["division"]} for d in player_skills]
+        best_tier, best_list_id, played_lists = best_playlist(player_skills)
+        # Unranked players are ordered on their casual rating (if any).
+        best_id = best_list_id if best_list_id is not None else 0
+        best = next((d for d in playlists if d["playlist"] == best_id),
+                    {"playlist": None, "mu": 0, "sigma": None, "sr": float_sr({"mu": 0}), "tier": 0, "division": 0})
+        return {**best, "tier": best_tier}, playlists
+
     def rank_summary_str(self, player_skills: Optional[list], best_list_id: int, unplayed_lists: set,
                          drop_casual: bool = False) -> (str, str):
         """
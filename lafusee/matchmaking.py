@@ -0,0 +1,199 @@
+# Default library.
+import asyncio
+import bisect
+import itertools
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+
+class QueueEntry:
+    """One member waiting in a matchmaking queue"""
+    __slots__ = ("user_id", "sr", "tier", "joined", "channel_id")
+
+    def __init__(self, user_id: int, sr: float, tier: int, joined: float, channel_id: int):
+        self.user_id = user_id
+        self.sr = sr
+        self.tier = tier
+        self.joined = joined
+        self.channel_id = channel_id
+
+
+MatchCallback = Callable[[int, int, List[QueueEntry]], Awaitable[None]]  # (guild ID, playlist, group).
+
+
+class PlaylistQueue:
+    """The members of one guild queueing for one playlist, sorted on skill rating
+
+    Groups are members that are next to each other in the sorted list, so a lookup costs a binary search plus the few
+    groups of consecutive neighbours around a member, instead of a scan of the whole queue. Within a group, every two
+    members must fit together (see fits), which bounds the SR span of the group, and their tiers act as buckets."""
+    BASE_TOLERANCE = 50.0  # SR difference that is accepted right after joining.
+    WIDEN_RATE = 50.0 / 60  # SR added to the tolerance per second of waiting.
+    MAX_TOLERANCE = 300.0
+    TIER_SPAN = 1  # Tiers that members of a group may be apart, on top of the SR tolerance.
+
+    def __init__(self, group_size: int):
+        self.group_size = group_size
+        self._keys: List[Tuple[float, int]] = []  # (sr, user ID), sorted.
+        self._entries: Dict[int, QueueEntry] = {}  # User ID -> entry, in order of joining.
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._entries
+
+    def get(self, user_id: int) -> Optional[QueueEntry]:
+        return self._entries.get(user_id)
+
+    def entries(self) -> List[QueueEntry]:
+        """The entries in order of joining (longest waiting first)"""
+        return list(self._entries.values())
+
+    def add(self, entry: QueueEntry) -> None:
+        self._entries[entry.user_id] = entry
+        bisect.insort(self._keys, (entry.sr, entry.user_id))
+
+    def remove(self, user_id: int) -> Optional[QueueEntry]:
+        entry = self._entries.pop(user_id, None)
+        if entry is not None:
+            del self._keys[bisect.bisect_left(self._keys, (entry.sr, user_id))]
+        return entry
+
+    def tolerance(self, entry: QueueEntry, now: float) -> float:
+        return min(self.BASE_TOLERANCE + self.WIDEN_RATE * (now - entry.joined), self.MAX_TOLERANCE)
+
+    def fits(self, a: QueueEntry, b: QueueEntry, now: float) -> bool:
+        """Whether two members fit together: their SR difference is within the tolerance of either of them, so members
+        that waited long accept a wider range, and their tiers are at most TIER_SPAN apart. Unranked members (tier 0)
+        are matched on SR only"""
+        if a.tier and b.tier and abs(a.tier - b.tier) > self.TIER_SPAN:
+            return False
+        return abs(a.sr - b.sr) <= max(self.tolerance(a, now), self.tolerance(b, now))
+
+    def find_group(self, entry: QueueEntry, now: float) -> Optional[List[QueueEntry]]:
+        """
+        :param entry: The entry to find a group for. It must be in the queue.
+        :param now: The current time, as given by time.monotonic.
+        :return: The group (entry first, then the closest neighbours), or None if no group fits.
+
+        Every run of group_size consecutive members that includes the entry is a candidate, and the one with the
+        smallest SR span in which all members fit together wins.
+        """
+        size = self.group_size
+        index = bisect.bisect_left(self._keys, (entry.sr, entry.user_id))
+        start = max(0, index - size + 1)
+        nearby = [self._entries[user_id] for _, user_id in self._keys[start:index + size]]
+        position = index - start
+        best, best_span = None, None
+        for first in range(max(0, position - size + 1), min(position, len(nearby) - size) + 1):
+            group = nearby[first:first + size]
+            span = group[-1].sr - group[0].sr
+            if best_span is not None and span >= best_span:
+                continue
+            if all(self.fits(a, b, now) for a, b in itertools.combinations(group, 2)):
+                best, best_span = group, span
+        if best is None:
+            return None
+        return [entry] + sorted((e for e in best if e is not entry), key=lambda e: abs(e.sr - entry.sr))
+
+
+class Matchmaker:
+    """Matchmaking queues of all guilds, with a timer that widens tolerances and expires stale entries
+
+    A member can be in one queue per guild."""
+    SWEEP_INTERVAL = 15  # Seconds between matching passes over the waiting members.
+    ENTRY_TTL = 30 * 60  # Seconds after which a queued member is dropped.
+
+    def __init__(self, group_sizes: Dict[int, int], on_match: MatchCallback):
+        self.group_sizes = group_sizes
+        self.on_match = on_match
+        self._queues: Dict[Tuple[int, int], PlaylistQueue] = {}  # (guild ID, playlist) -> queue.
+        self._member_queue: Dict[Tuple[int, int], int] = {}  # (guild ID, user ID) -> playlist.
+        self._task: Optional[asyncio.Task] = None
+
+    def join(self, guild_id: int, playlist: int, user_id: int, sr: float, tier: int,
+             channel_id: int) -> Optional[List[QueueEntry]]:
+        """
+        :return: The group, if the member completes one right away. Otherwise None, and the member waits.
+
+        A member that already waits in another queue of the guild is moved.
+        """
+        self.leave(guild_id, user_id)
+        queue = self._queues.get((guild_id, playlist))
+        if queue is None:
+            queue = self._queues[(guild_id, playlist)] = PlaylistQueue(self.group_sizes[playlist])
+        entry = QueueEntry(user_id, sr, tier, time.monotonic(), channel_id)
+        queue.add(entry)
+        self._member_queue[(guild_id, user_id)] = playlist
+        group = queue.find_group(entry, entry.joined)
+        if group is not None:
+            self._take(guild_id, playlist, group)
+        elif self._task is None:  # Start the timer lazily, so it always runs on the bot's event loop.
+            self._task = asyncio.ensure_future(self._sweep_loop())
+        return group
+
+    def leave(self, guild_id: int, user_id: int) -> Optional[int]:
+        """Remove a member from the queue of a guild. Returns the playlist they were queued for, if any"""
+        playlist = self._member_queue.pop((guild_id, user_id), None)
+        if playlist is not None:
+            queue = self._queues[(guild_id, playlist)]
+            queue.remove(user_id)
+            if not queue:
+                del self._queues[(guild_id, playlist)]
+        return playlist
+
+    def status(self, guild_id: int, user_id: int) -> Tuple[Dict[int, int], Optional[Tuple[int, float, float]]]:
+        """Get playlist -> queue size for a guild, and (playlist, seconds waited, tolerance) of the member if queued"""
+        sizes = {p: len(q) for (g, p), q in self._queues.items() if g == guild_id}
+        playlist = self._member_queue.get((guild_id, user_id))
+        if playlist is None:
+            return sizes, None
+        queue = self._queues[(guild_id, playlist)]
+        entry = queue.get(user_id)
+        now = time.monotonic()
+        return sizes, (playlist, now - entry.joined, queue.tolerance(entry, now))
+
+    def close(self) -> None:
+        """Stop the timer, and forget all queues"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self._queues.clear()
+        self._member_queue.clear()
+
+    # Utilities.
+    def _take(self, guild_id: int, playlist: int, group: List[QueueEntry]) -> None:
+        """Remove a matched group from its queue"""
+        for entry in group:
+            self.leave(guild_id, entry.user_id)
+
+    def sweep(self) -> List[Tuple[int, int, List[QueueEntry]]]:
+        """Drop expired entries and match the waiting members (longest waiting first). Returns the new groups"""
+        now = time.monotonic()
+        matches = []
+        for (guild_id, playlist), queue in list(self._queues.items()):
+            for entry in queue.entries():
+                if entry.user_id not in queue:  # Matched earlier in this pass.
+                    continue
+                if now - entry.joined > self.ENTRY_TTL:
+                    self.leave(guild_id, entry.user_id)
+                    continue
+                group = queue.find_group(entry, now)
+                if group is not None:
+                    self._take(guild_id, playlist, group)
+                    matches.append((guild_id, playlist, group))
+        return matches
+
+    async def _sweep_loop(self) -> None:
+        """Sweep every interval, until all queues are empty"""
+        try:
+            while self._queues:
+                await asyncio.sleep(self.SWEEP_INTERVAL)
+                for guild_id, playlist, group in self.sweep():
+                    try:
+                        await self.on_match(guild_id, playlist, group)
+                    except Exception as e:  # A failed notification must not stop the timer.
+                        print("LaFusee: could not announce a queue match: {!r}".format(e))
+        finally:
+            self._task = None
@@ -0,0 +1,168 @@
+# Default library.
+import asyncio
+import heapq
+import inspect
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple, Union
+
+# Used by Red.
+import discord
+from redbot.core import commands
+
+
+PageRenderer = Callable[[int], Union[discord.Embed, Awaitable[discord.Embed]]]
+
+
+class _OpenMenu:
+    """State of one open reaction menu"""
+    __slots__ = ("message", "author_id", "page_count", "render", "page", "rendered", "expires", "timeout")
+
+    def __init__(self, message: discord.Message, author_id: int, page_count: int,
+                 render: PageRenderer, first_page: discord.Embed, expires: float, timeout: float):
+        self.message = message
+        self.author_id = author_id
+        self.page_count = page_count
+        self.render = render
+        self.page = 0
+        self.rendered: Dict[int, discord.Embed] = {0: first_page}  # Pages are only rendered once they're needed.
+        self.expires = expires
+        self.timeout = timeout
+
+
+class MenuDispatcher:
+    """Route reactions to all open menus of a cog, instead of using one reaction listener per menu
+
+    Open menus are stored by message ID, so a reaction event costs one dict lookup regardless of the amount of
+    open menus. A single task expires menus, based on a heap of expiry times."""
+    PREV = "\N{LEFTWARDS BLACK ARROW}\N{VARIATION SELECTOR-16}"
+    CLOSE = "\N{CROSS MARK}"
+    NEXT = "\N{BLACK RIGHTWARDS ARROW}\N{VARIATION SELECTOR-16}"
+    CONTROLS = (PREV, CLOSE, NEXT)
+
+    def __init__(self, bot):
+        self.bot = bot
+        self._menus: Dict[int, _OpenMenu] = {}
+        self._expiry_heap: List[Tuple[float, int]] = []  # (expiry time, message ID). Entries may be stale.
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._menus)
+
+    async def open(self, ctx: commands.Context, page_count: int, render: PageRenderer,
+                   timeout: float = 30.0) -> discord.Message:
+        """
+        :param ctx: The context of the command that opens the menu.
+        :param page_count: The amount of pages in the menu.
+        :param render: A function (or coroutine function) that returns the embed of a page, given its index.
+        :param timeout: The amount of seconds without interaction after which the menu closes.
+        :return: The message of the menu.
+
+        Send the first page of a menu, and register it so that reactions beneath it change its page"""
+        first_page = await self._render(render, 0)
+        message = await ctx.send(embed=first_page)
+        loop = asyncio.get_event_loop()
+        if self._task is None or self._task.done():  # Start the expiry timer lazily, on the bot's event loop.
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.ensure_future(self._expire_loop())
+        expires = loop.time() + timeout
+        self._menus[message.id] = _OpenMenu(message, ctx.author.id, page_count, render, first_page, expires, timeout)
+        self._push_expiry(expires, message.id)
+        try:
+            for emoji in self.CONTROLS:
+                await message.add_reaction(emoji)
+        except discord.NotFound:  # Menu got closed whilst adding the controls.
+            pass
+        return message
+
+    async def handle_reaction(self, payload: discord.RawReactionActionEvent) -> None:
+        """Handle a raw reaction event, if it belongs to an open menu"""
+        menu = self._menus.get(payload.message_id)
+        if menu is None or payload.user_id != menu.author_id:
+            return
+        emoji = str(payload.emoji)
+        if emoji not in self.CONTROLS:
+            return
+        if emoji == self.CLOSE:
+            del self._menus[payload.message_id]
+            try:
+                await menu.message.delete()
+            except discord.NotFound:
+                pass
+            return
+        step = 1 if emoji == self.NEXT else -1
+        menu.page = (menu.page + step) % menu.page_count
+        embed = menu.rendered.get(menu.page)
+        if embed is None:
+            embed = menu.rendered[menu.page] = await self._render(menu.render, menu.page)
+        menu.expires = asyncio.get_event_loop().time() + menu.timeout  # The old heap entry is now stale.
+        self._push_expiry(menu.expires, payload.message_id)
+        try:
+            await menu.message.edit(embed=embed)
+            await menu.message.remove_reaction(emoji, discord.Object(id=payload.user_id))
+        except discord.HTTPException:  # E.g. missing permissions, or the menu got deleted.
+            pass
+
+    def close(self) -> None:
+        """Stop the expiry timer, and forget all open menus"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self._menus.clear()
+        self._expiry_heap.clear()
+
+    # Utilities.
+    @staticmethod
+    async def _render(render: PageRenderer, page: int) -> discord.Embed:
+        embed = render(page)
+        if inspect.isawaitable(embed):
+            embed = await embed
+        return embed
+
+    def _push_expiry(self, expires: float, message_id: int) -> None:
+        """Add an expiry time to the heap, and wake up the timer if it's the earliest one"""
+        is_earliest = not self._expiry_heap or expires < self._expiry_heap[0][0]
+        heapq.heappush(self._expiry_heap, (expires, message_id))
+        if is_earliest:
+            self._wakeup.set()
+
+    async def _expire_loop(self) -> None:
+        """Sleep until the earliest menu expiry, then close the menus that timed out"""
+        loop = asyncio.get_event_loop()
+        while True:
+            if not self._expiry_heap:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            delay = self._expiry_heap[0][0] - loop.time()
+            if delay > 0:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            expires, message_id = heapq.heappop(self._expiry_heap)
+            menu = self._menus.get(message_id)
+            if menu is None or menu.expires != expires:  # Menu already closed, or its timeout got extended.
+                continue
+            del self._menus[message_id]
+            try:
+                await self._clear_controls(menu.message)
+            except Exception as e:  # One failing menu must not stop the timer, or no menu expires anymore.
+                print("MenuDispatcher -> Clearing the controls of menu {} failed: {!r}".format(message_id, e))
+
+    @staticmethod
+    async def _clear_controls(message: discord.Message) -> None:
+        """Remove the menu reactions from an expired menu"""
+        try:
+            await message.clear_reactions()
+        except discord.Forbidden:  # Cannot remove reactions of others, so only remove our own.
+            for emoji in MenuDispatcher.CONTROLS:
+                try:
+                    await message.remove_reaction(emoji, message.guild.me if message.guild else message.author)
+                except discord.HTTPException:
+                    pass
+        except discord.NotFound:
+            pass
+        except discord.HTTPException as e:  # E.g. a server error. The menu is closed regardless.
+            print("MenuDispatcher -> Clearing the reactions of menu {} failed: {!r}".format(message.id, e))
@@ -8,16 +8,18 @@ import aiohttp
 
 # Local imports.
 from .exceptions import PsyonixCallError
+from .request_scheduler import RequestScheduler
 
 
 class PsyonixCalls:
     """Class for querying the Psyonix API asynchronically"""
     ERROR = ":x: Error: "
 
-    API_URL = "https://api.rocketleague.com/api/v1/{p}/"  # p=platform, uid=gamer-id
-    API_GAS = API_URL + "leaderboard/stats/{t}/{uid}"  # {} * 3, t=GAS-type
-    API_RANK = API_URL + "playerskills/{uid}"  # {} * 2
-    API_TITLES = API_URL + "playertitles/{uid}"  # {} * 2
+    API_BASE = "https://api.rocketleague.com"
+    API_URL = "{base}/api/v1/{p}/"  # base=API base url, p=platform, uid=gamer-id
+    API_GAS = API_URL + "leaderboard/stats/{t}/{uid}"  # {} * 4, t=GAS-type
+    API_RANK = API_URL + "playerskills/{uid}"  # {} * 3
+    API_TITLES = API_URL + "playertitles/{uid}"  # {} * 3
 
     GAS_LIST = ["goals", "assists", "saves", "wins", "mvps", "shots"]
     PSY_TOKEN_NONE = ERROR + "No token set for the Psyonix API."
@@ -35,24 +37,33 @@ class PsyonixCalls:
                                    "See the console for the query in question. `(Uncaught status: {})`"
     # Other errors.
     NO_MATCHES = ERROR + "This account has purchased Rocket League, but has no online matches on record!"
+    # Request lanes: commands that someone waits for, and bulk work (e.g. rank role refreshes and prefetching).
+    INTERACTIVE = "interactive"
+    BACKGROUND = "background"
+    LANE_WEIGHTS = {INTERACTIVE: 8, BACKGROUND: 1}  # Share of the slots when both lanes are busy.
+    MAX_IN_FLIGHT = 100  # Requests to the API at once, over all lanes. The connection limit of the aiohttp session.
 
-    def __init__(self, config):
+    def __init__(self, config, base_url: str = None):
         # Load config in order to always have an updated token.
         self.config = config
+        # The base url can be overridden, e.g. to point at a local mock API.
+        self.base_url = (base_url or self.API_BASE).rstrip("/")
         self.session = aiohttp.ClientSession()
-
-    async def _fetch(self, request_url, headers) -> (Optional[List[dict]], int):
-        """Send a get request to the Psyonix API, and fetch the response"""
-        async with self.session.get(request_url, headers=headers) as response:
-            resp = response
-            resp_status = resp.status
-            if resp_status == 200:  # Valid response.
-                resp_json = await resp.json()
-            else:
-                resp_json = None
+        self.scheduler = RequestScheduler(self.LANE_WEIGHTS, self.MAX_IN_FLIGHT)
+
+    async def _fetch(self, request_url, headers, lane: str = INTERACTIVE) -> (Optional[List[dict]], int):
+        """Send a get request to the Psyonix API once the lane gets a request slot, and fetch the response"""
+        async with self.scheduler.slot(lane):
+            async with self.session.get(request_url, headers=headers) as response:
+                resp = response
+                resp_status = resp.status
+                if resp_status == 200:  # Valid response.
+                    resp_json = await resp.json()
+                else:
+                    resp_json = None
         return resp_json, resp_status
 
-    async def _call_psyonix_api(self, request_url: str) -> dict:
+    async def _call_psyonix_api(self, request_url: str, lane: str = INTERACTIVE) -> dict:
         """Given an url, call the API using the configured token
 
         Returns a list if valid, False if invalid, and None if there is no token.
@@ -62,7 +73,7 @@ class PsyonixCalls:
             raise PsyonixCallError(self.PSY_TOKEN_NONE)
         headers = {"Authorization": token}
         try:
-            resp_json, resp_status = await self._fetch(request_url, headers)
+            resp_json, resp_status = await self._fetch(request_url, headers, lane)
         except aiohttp.client_exceptions.ServerTimeoutError:
             raise PsyonixCallError(self.TIMEOUT_ERROR)
         if resp_status == 200:  # TODO: test if «resp_json is not None» is needed.
@@ -80,11 +91,12 @@ class PsyonixCalls:
             raise PsyonixCallError(self.UNKNOWN_STATUS_ERROR.format(resp_status))
         return to_return
 
-    async def player_skills(self, platform: str, valid_id,
-                            ensure_played: bool = False) -> Optional[dict]:  # TODO: Check if optional
+    async def player_skills(self, platform: str, valid_id, ensure_played: bool = False,
+                            lane: str = INTERACTIVE) -> Optional[dict]:  # TODO: Check if optional
         """Composes the PlayerSkills query call, and returns its response
 
         if ensure_played is True, there will be a notice if the player_skills value is an empty list.
+        Bulk lookups should use the background lane, so that they never hold up commands.
 
         Structure of a normal API response:
         {user_name: str, player_skills: [list of playlist_dict], user_id: str, season_rewards: {wins: int, level: int}}
@@ -95,8 +107,8 @@ class PsyonixCalls:
 
         Note: the original response has the dict wrapped in a list, but the call method removes it.
         """
-        request_url = self.API_RANK.format(p=platform, uid=valid_id)
-        to_return = await self._call_psyonix_api(request_url)
+        request_url = self.API_RANK.format(base=self.base_url, p=platform, uid=valid_id)
+        to_return = await self._call_psyonix_api(request_url, lane)
         skills: List[Dict[str, Optional[float]]] = to_return.get("player_skills") if to_return else None
         if ensure_played and not skills:
             raise PsyonixCallError(self.NO_MATCHES)
@@ -113,7 +125,7 @@ class PsyonixCalls:
         Structure of a normal API response:
         {titles: [list of titles]}
         """
-        request_url = self.API_TITLES.format(p=platform, uid=valid_id)
+        request_url = self.API_TITLES.format(base=self.base_url, p=platform, uid=valid_id)
         response = await self._call_psyonix_api(request_url)
         return response.get("titles")
 
@@ -129,7 +141,7 @@ class PsyonixCalls:
         headers = {"Authorization": token}
         tasks = []
         for i in self.GAS_LIST:
-            url = self.API_GAS.format(p=platform, t=i, uid=valid_id)
+            url = self.API_GAS.format(base=self.base_url, p=platform, t=i, uid=valid_id)
             task = asyncio.ensure_future(self._fetch(url, headers))
             tasks.append(task)
         responses = await asyncio.gather(*tasks)  # Structure: List[Tuple[List[dict]]]
@@ -0,0 +1,136 @@
+# Default library.
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Requirements.
+import numpy as np
+
+TIER_COUNT = 23  # Tiers 0 (unranked) up to 22 (supersonic legend).
+ROW_DTYPE = np.dtype([("user", np.int64), ("playlist", np.int64), ("mu", np.float64), ("sigma", np.float64),
+                      ("tier", np.int64)])
+
+
+class GuildSkills:
+    """The latest known skills of the linked members of one guild, as arrays with a column per playlist
+
+    Missing values (a member never played a playlist) are NaN for mu and sigma, and -1 for tier."""
+
+    def __init__(self, user_ids: np.ndarray, playlist_ids: Sequence[int], mu: np.ndarray, sigma: np.ndarray,
+                 tier: np.ndarray):
+        self.user_ids = user_ids  # Sorted, so rows are found with a binary search.
+        self.playlist_ids = tuple(playlist_ids)
+        self.mu = mu
+        self.sigma = sigma
+        self.tier = tier
+
+    @classmethod
+    def from_rows(cls, rows: List[tuple], member_ids: Iterable[int], playlist_ids: Sequence[int]) -> "GuildSkills":
+        """
+        :param rows: (userID, playlist, mu, sigma, tier) rows. Unknown sigma is negative. Non-members are dropped.
+        :param member_ids: The IDs of the guild members.
+        :param playlist_ids: The playlists to make columns for. Rows of other playlists are dropped.
+        :return: The skills of the members that have rows.
+        """
+        data = np.array(rows, dtype=ROW_DTYPE)
+        members = np.fromiter(member_ids, dtype=np.int64)
+        columns = np.array(playlist_ids, dtype=np.int64)
+        col_order = np.argsort(columns)
+        col_pos = np.searchsorted(columns[col_order], data["playlist"]).clip(0, len(columns) - 1)
+        keep = np.isin(data["user"], members) & (columns[col_order][col_pos] == data["playlist"])
+        data, col_pos = data[keep], col_pos[keep]
+        user_ids, row_idx = np.unique(data["user"], return_inverse=True)
+        col_idx = col_order[col_pos]
+        shape = (len(user_ids), len(columns))
+        mu = np.full(shape, np.nan)
+        sigma = np.full(shape, np.nan)
+        tier = np.full(shape, -1, dtype=np.int64)
+        mu[row_idx, col_idx] = data["mu"]
+        sigma[row_idx, col_idx] = np.where(data["sigma"] < 0, np.nan, data["sigma"])
+        tier[row_idx, col_idx] = data["tier"]
+        return cls(user_ids, playlist_ids, mu, sigma, tier)
+
+    def __len__(self) -> int:
+        return len(self.user_ids)
+
+    @property
+    def sr(self) -> np.ndarray:
+        """Skill rating per member and playlist (see static_functions.float_sr)"""
+        return self.mu * 20 + 100
+
+    def column(self, playlist_id: int) -> int:
+        return self.playlist_ids.index(playlist_id)
+
+    def player_counts(self) -> np.ndarray:
+        """The amount of members with a known rank, per playlist"""
+        return np.count_nonzero(~np.isnan(self.mu), axis=0)
+
+    def median_sr(self) -> np.ndarray:
+        """The median skill rating per playlist (NaN for playlists that nobody played)"""
+        sr = self.sr
+        medians = np.full(len(self.playlist_ids), np.nan)
+        played = self.player_counts() > 0
+        medians[played] = np.nanmedian(sr[:, played], axis=0)
+        return medians
+
+    def tier_histogram(self, playlist_id: int = None) -> np.ndarray:
+        """The amount of members per tier (index 0-22) in a playlist, or of their best tier if none is given"""
+        if playlist_id is None:
+            tiers = self.tier.max(axis=1)
+        else:
+            tiers = self.tier[:, self.column(playlist_id)]
+        return np.bincount(tiers[tiers >= 0], minlength=TIER_COUNT)[:TIER_COUNT]
+
+    def sr_percentiles(self, playlist_id: int, percentiles: Sequence[float]) -> Optional[np.ndarray]:
+        """The skill rating at the given percentiles of a playlist, or None if nobody played it"""
+        sr = self.sr[:, self.column(playlist_id)]
+        sr = sr[~np.isnan(sr)]
+        return np.percentile(sr, percentiles) if sr.size else None
+
+    def positions(self, user_id: int) -> Dict[int, Tuple[int, int, float]]:
+        """
+        :param user_id: The ID of a member.
+        :return: Playlist ID -> (position, ranked members, percentile) for every playlist the member played.
+
+        The position is 1 for the highest skill rating. The percentile is the share of members with a lower rating.
+        """
+        row = np.searchsorted(self.user_ids, user_id)
+        if row == len(self.user_ids) or self.user_ids[row] != user_id:
+            return {}
+        sr = self.sr
+        own = sr[row]
+        with np.errstate(invalid="ignore"):  # NaN comparisons are False, so unplayed entries are never counted.
+            higher = np.count_nonzero(sr > own, axis=0)
+            lower = np.count_nonzero(sr < own, axis=0)
+        counts = self.player_counts()
+        return {playlist_id: (int(higher[i]) + 1, int(counts[i]), 100 * lower[i] / counts[i])
+                for i, playlist_id in enumerate(self.playlist_ids) if not np.isnan(own[i])}
+
+
+class RankAnalytics:
+    """Build the GuildSkills of a guild from the rank board tables, and cache them until the ranks of a member change"""
+
+    def __init__(self, link_db, playlist_ids: Sequence[int]):
+        self.link_db = link_db
+        self.playlist_ids = playlist_ids
+        # Guild ID -> (board_version when loaded, member count, skills).
+        self._cache: Dict[int, Tuple[int, int, GuildSkills]] = {}
+
+    def is_fresh(self, guild) -> bool:
+        """Whether the cached skills of a guild are up to date: no member joined or left, or had their ranks changed"""
+        cached = self._cache.get(guild.id)
+        if cached is None or cached[1] != guild.member_count:
+            return False
+        changed = self.link_db.changed_users(cached[0])
+        return changed is not None and not any(guild.get_member(user_id) for user_id in changed)
+
+    async def guild_skills(self, guild) -> GuildSkills:
+        """Get the skills of the linked members of a guild, loading them only if the ranks of a member changed"""
+        if self.is_fresh(guild):
+            return self._cache[guild.id][2]
+        version, member_ids = self.link_db.board_version, [m.id for m in guild.members]
+        rows = await self.link_db.select_playlist_ranks(member_ids)
+        skills = GuildSkills.from_rows(rows, member_ids, self.playlist_ids)
+        self._cache[guild.id] = (version, guild.member_count, skills)
+        return skills
+
+    def clear(self) -> None:
+        self._cache.clear()
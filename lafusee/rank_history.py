@@ -0,0 +1,29 @@
+# Default library.
+import struct
+from typing import Dict, List
+
+# One packed record per playlist: playlist, tier, division (unsigned bytes), mu, sigma (float32), matches played.
+RECORD = struct.Struct("<BBBffI")
+FIELDS = ("tier", "division", "mu", "sigma", "matches_played")  # After the playlist, in the order of RECORD.
+
+
+def pack_skills(player_skills: List[Dict[str, float]]) -> bytes:
+    """
+    :param player_skills: A list with a player's skills (extracted from the skills response dict).
+    :return: The skills packed into a compact blob, 15 bytes per playlist.
+
+    Playlists are sorted, so identical skills always give an identical blob (used to suppress duplicate points).
+    Missing or null fields (e.g. of unranked playlists) are stored as 0, and entries without a playlist are skipped.
+    """
+    return b"".join(RECORD.pack(d["playlist"], *(d.get(k) or 0 for k in FIELDS))
+                    for d in sorted((d for d in player_skills if d.get("playlist") is not None),
+                                    key=lambda x: x["playlist"]))
+
+
+def unpack_skills(blob: bytes) -> List[Dict[str, float]]:
+    """
+    :param blob: A blob made by pack_skills.
+    :return: A list of playlist dicts with the keys playlist, tier, division, mu, sigma, and matches_played.
+    """
+    return [{"playlist": p, "tier": t, "division": d, "mu": mu, "sigma": sigma, "matches_played": m}
+            for p, t, d, mu, sigma, m in RECORD.iter_unpack(blob)]
@@ -0,0 +1,235 @@
+# Default library.
+import asyncio
+import collections
+import heapq
+import itertools
+import random
+import time
+from typing import Awaitable, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+Account = Tuple[str, str]  # (platform, gamer ID).
+Ranks = Dict[int, Tuple[int, int]]  # Playlist -> (tier, division).
+SkillsFetch = Callable[[str, str], Awaitable[Optional[dict]]]  # (platform, gamer ID) -> skills response.
+
+
+class RankChange(NamedTuple):
+    playlist: int
+    old: Tuple[int, int]  # (tier, division).
+    new: Tuple[int, int]
+
+
+ChangeHandler = Callable[[int, List[RankChange], list], Awaitable[None]]  # (user ID, changes, player skills).
+
+
+class Watched(NamedTuple):
+    account: Account
+    due: float  # POSIX timestamp of the next poll.
+    interval: float  # Seconds between polls, adapted after every poll.
+    matches: Optional[int]  # Matches played over all playlists at the last poll.
+    played: float  # POSIX timestamp of the last poll that found new matches (or of the start of the watch).
+    ranks: Ranks  # As of the last poll. Empty if unknown, in which case the next poll only sets them.
+
+
+class RankWatcher:
+    """Poll the skills of linked accounts, as often as each account actually plays, and report rank changes
+
+    Accounts are kept in a heap on the time their next poll is due. Ranks only change when matches are played, and
+    matches come in sessions, so the interval follows the matches played: an account that played since its previous
+    poll is polled again after MIN_INTERVAL, and one that didn't backs off by BACKOFF per poll, up to MAX_INTERVAL.
+    Accounts without new matches for DORMANT_AFTER back off further, up to DORMANT_INTERVAL. The tier and division of
+    every playlist are compared with the previous poll, and only changes are passed to the handler."""
+    MIN_INTERVAL = 10 * 60  # Seconds. While the account plays.
+    MAX_INTERVAL = 60 * 60
+    DORMANT_AFTER = 3 * 24 * 60 * 60
+    DORMANT_INTERVAL = 6 * 60 * 60
+    BACKOFF = 2
+    INITIAL_INTERVAL = 60 * 60  # Before the first poll. Also the spread of the first polls after a load.
+    IDLE_RECHECK = 60 * 60  # Seconds before an account that isn't watched (see is_watched) is checked again.
+    CONCURRENCY = 2  # Polls at once.
+    POLL_SPACING = 1.0  # Seconds between the starts of polls, so at most 3600 polls per hour.
+
+    def __init__(self, fetch: SkillsFetch, is_watched: Callable[[int], bool], on_change: ChangeHandler):
+        self.fetch = fetch
+        self.is_watched = is_watched
+        self.on_change = on_change
+        self.stats = collections.Counter()
+        self._watched: Dict[int, Dict[Account, Watched]] = {}  # User ID -> account -> state.
+        self._heap: List[Tuple[float, int, int, Account]] = []  # (due, seq, user ID, account). Stale if due differs.
+        self._counter = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._polls: Dict[Tuple[int, Account], asyncio.Task] = {}
+
+    def __len__(self) -> int:
+        return sum(len(accounts) for accounts in self._watched.values())
+
+    def load(self, accounts: Dict[int, List[Account]], known_ranks: Dict[int, Ranks]) -> None:
+        """
+        :param accounts: User ID -> the (platform, gamer ID) of every linked account, primary first.
+        :param known_ranks: User ID -> the ranks of the primary account that were last stored (e.g. on the rank board).
+
+        Watch the given accounts, and stop watching other accounts of the given users. The first polls are spread over
+        INITIAL_INTERVAL, with a stable jitter per user, so a restart doesn't poll everyone at once. Ranks from before
+        the restart are the base of the first comparison."""
+        now = time.time()
+        for user_id, user_accounts in accounts.items():
+            user_accounts = [(platform, str(gamer_id)) for platform, gamer_id in user_accounts]
+            for account in set(self._watched.get(user_id, {})) - set(user_accounts):
+                self.remove(user_id, *account)
+            delay = random.Random(user_id).random() * self.INITIAL_INTERVAL
+            for n, (platform, gamer_id) in enumerate(user_accounts):
+                self.add(user_id, platform, gamer_id, known_ranks.get(user_id) if n == 0 else None, delay, now)
+
+    def add(self, user_id: int, platform: str, gamer_id, ranks: Ranks = None, delay: float = 0.0,
+            now: float = None) -> None:
+        """Watch an account of a user, due after delay seconds. An account that is watched already is kept"""
+        account = (platform, str(gamer_id))
+        if account in self._watched.get(user_id, {}):
+            return
+        now = time.time() if now is None else now
+        self._schedule(user_id, Watched(account, now + delay, self.INITIAL_INTERVAL, None, now, ranks or {}))
+
+    def remove(self, user_id: int, platform: str = None, gamer_id=None) -> None:
+        """Stop watching an account of a user, or all their accounts if none is given (heap entries turn stale)"""
+        if platform is None:
+            self._watched.pop(user_id, None)
+            return
+        accounts = self._watched.get(user_id, {})
+        accounts.pop((platform, str(gamer_id)), None)
+        if not accounts:
+            self._watched.pop(user_id, None)
+
+    def wake(self, user_ids: Iterable[int]) -> int:
+        """Make the accounts of the given users due now, e.g. when a server starts watching. Returns the amount"""
+        now, woken = time.time(), 0
+        for user_id in user_ids:
+            for state in list(self._watched.get(user_id, {}).values()):
+                if state.due > now:
+                    self._schedule(user_id, state._replace(due=now))
+                    woken += 1
+        return woken
+
+    def start(self) -> None:
+        """Start polling. Call this from the bot's event loop"""
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.ensure_future(self._run())
+
+    def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+        for task in self._polls.values():
+            task.cancel()
+
+    def overdue(self) -> int:
+        """The amount of watched accounts of which the poll is due, but didn't start yet"""
+        now = time.time()
+        return sum(1 for user_id, state in self._states() if state.due <= now and (user_id, state.account)
+                   not in self._polls)
+
+    def interval_percentiles(self, *pcts: int) -> List[float]:
+        """Nearest-rank percentiles of the poll intervals of the watched accounts, in seconds"""
+        intervals = sorted(state.interval for _, state in self._states())
+        if not intervals:
+            return [0.0 for _ in pcts]
+        return [intervals[min(len(intervals), max(1, -(-pct * len(intervals) // 100))) - 1] for pct in pcts]
+
+    @staticmethod
+    def ranks_of(player_skills: Optional[list]) -> Ranks:
+        """The tier and division per playlist of a player's skills"""
+        return {d["playlist"]: (d["tier"], d["division"]) for d in player_skills or ()}
+
+    # Utilities.
+    def _states(self) -> Iterable[Tuple[int, Watched]]:
+        return ((user_id, state) for user_id, accounts in self._watched.items() for state in accounts.values())
+
+    def _schedule(self, user_id: int, state: Watched) -> None:
+        self._watched.setdefault(user_id, {})[state.account] = state
+        heapq.heappush(self._heap, (state.due, next(self._counter), user_id, state.account))
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _run(self) -> None:
+        """Start the poll of the account that is due first, once it's due and a poll slot is free"""
+        slots = asyncio.Semaphore(self.CONCURRENCY)
+        while True:
+            while self._heap:  # Drop the entries of removed or rescheduled accounts.
+                due, _, user_id, account = self._heap[0]
+                state = self._watched.get(user_id, {}).get(account)
+                if state is not None and state.due == due:
+                    break
+                heapq.heappop(self._heap)
+            now = time.time()
+            if not self._heap or self._heap[0][0] > now:
+                self._wakeup.clear()
+                timeout = self._heap[0][0] - now if self._heap else None
+                try:  # Woken up early by add or wake, which may have made an account due sooner.
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            _, _, user_id, account = heapq.heappop(self._heap)
+            state = self._watched[user_id][account]
+            if (user_id, account) in self._polls:  # Linked again while polling. The poll reschedules it when done.
+                continue
+            if not self.is_watched(user_id):  # E.g. not in a server that watches ranks. Cheap to check again later.
+                self.stats["skipped"] += 1
+                self._schedule(user_id, state._replace(due=now + self.IDLE_RECHECK))
+                continue
+            await slots.acquire()
+            self._polls[(user_id, account)] = asyncio.ensure_future(self._poll(user_id, state, slots))
+            await asyncio.sleep(self.POLL_SPACING)
+
+    async def _poll(self, user_id: int, state: Watched, slots: asyncio.Semaphore) -> None:
+        try:
+            now = time.time()
+            try:
+                response = await self.fetch(*state.account)
+            except Exception:  # E.g. no token, or the API is down. Back off like an account that didn't play.
+                response = None
+            player_skills = response.get("player_skills") if response else None
+            if player_skills is None:
+                self.stats["failed"] += 1
+                interval = min(self.DORMANT_INTERVAL, state.interval * self.BACKOFF)
+                self._reschedule(user_id, state._replace(due=now + interval, interval=interval))
+                return
+            self.stats["polls"] += 1
+            updated = self._adapt(state, player_skills, now)
+            changes = self._diff(state.ranks, updated.ranks)
+            self._reschedule(user_id, updated)
+            if changes:
+                self.stats["changes"] += 1
+                await self.on_change(user_id, changes, player_skills)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:  # A failing handler must not stop the watcher.
+            print("LaFusee -> Handling the rank change of user {} failed: {!r}".format(user_id, e))
+        finally:
+            del self._polls[(user_id, state.account)]
+            slots.release()
+
+    def _reschedule(self, user_id: int, state: Watched) -> None:
+        """Store the state after a poll, unless the account was unlinked meanwhile"""
+        if state.account in self._watched.get(user_id, {}):
+            self._schedule(user_id, state)
+
+    def _adapt(self, state: Watched, player_skills: list, now: float) -> Watched:
+        """The state after a poll: the new ranks and matches, and the next interval"""
+        matches = sum(d.get("matches_played", 0) for d in player_skills)
+        played = state.played
+        if state.matches is None:  # First poll, so it's unknown whether the account plays.
+            interval = self.INITIAL_INTERVAL
+        elif matches != state.matches:  # Playing (or a new season reset the count), so likely in a session.
+            interval, played = self.MIN_INTERVAL, now
+        else:
+            ceiling = self.MAX_INTERVAL if now - played < self.DORMANT_AFTER else self.DORMANT_INTERVAL
+            interval = min(ceiling, state.interval * self.BACKOFF)
+        return Watched(state.account, now + interval, interval, matches, played, self.ranks_of(player_skills))
+
+    @staticmethod
+    def _diff(old: Ranks, new: Ranks) -> List[RankChange]:
+        """The playlists of which the tier or division changed. Nothing changed if the old ranks are unknown"""
+        if not old:
+            return []
+        return [RankChange(plist, old[plist], rank) for plist, rank in sorted(new.items())
+                if plist in old and old[plist] != rank]
@@ -0,0 +1,65 @@
+# Default library.
+import csv
+import io
+import json
+from typing import List, NamedTuple
+
+# Local files.
+from .exceptions import ImportFileError
+
+ERROR = ":x: Error: "
+USER_KEYS = ("discord_id", "user_id", "userid", "discord")
+PLATFORM_KEYS = ("platform",)
+GAMER_KEYS = ("gamer_id", "id", "profile_id", "account")
+
+
+class ImportRow(NamedTuple):
+    line: int  # Line (CSV) or item index (JSON), for the failure report.
+    user_id: str
+    platform: str
+    gamer_id: str
+
+
+def _pick(item: dict, keys: tuple) -> str:
+    lowered = {str(k).strip().lower(): v for k, v in item.items()}
+    return next((str(lowered[k]).strip() for k in keys if lowered.get(k) not in (None, "")), "")
+
+
+def parse_import_file(filename: str, data: bytes) -> List[ImportRow]:
+    """
+    :param filename: The name of the attachment. Files ending in .json are read as JSON, others as CSV.
+    :param data: The content of the attachment.
+    :return: A row per registration in the file.
+
+    CSV files have the columns discord ID, platform and gamer ID, optionally with a header row.
+    JSON files hold a list of [discord ID, platform, gamer ID] lists, or of objects with those keys.
+    """
+    try:
+        text = data.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise ImportFileError(ERROR + "The file is not UTF-8 encoded.")
+    if filename.lower().endswith(".json"):
+        try:
+            items = json.loads(text)
+        except json.JSONDecodeError as e:
+            raise ImportFileError(ERROR + "Invalid JSON: {}".format(e))
+        if not isinstance(items, list):
+            raise ImportFileError(ERROR + "The JSON file must contain a list.")
+        rows = []
+        for n, item in enumerate(items, start=1):
+            if isinstance(item, dict):
+                rows.append(ImportRow(n, _pick(item, USER_KEYS), _pick(item, PLATFORM_KEYS), _pick(item, GAMER_KEYS)))
+            elif isinstance(item, list) and len(item) >= 3:
+                rows.append(ImportRow(n, *(str(v).strip() for v in item[:3])))
+            else:
+                rows.append(ImportRow(n, "", "", ""))  # Reported as invalid.
+        return rows
+    rows = []
+    for n, record in enumerate(csv.reader(io.StringIO(text)), start=1):
+        if not record or not any(field.strip() for field in record):
+            continue
+        if n == 1 and not record[0].strip().isdigit():  # Header row.
+            continue
+        record = [field.strip() for field in record] + ["", ""]
+        rows.append(ImportRow(n, record[0], record[1], record[2]))
+    return rows
@@ -0,0 +1,103 @@
+# Default library.
+import asyncio
+import collections
+import contextlib
+import heapq
+import itertools
+from typing import AsyncIterator, Deque, Dict, List, NamedTuple, Tuple
+
+
+class LaneReport(NamedTuple):
+    requests: int  # Finished since the start.
+    queued: int  # Waiting for a slot right now.
+    in_flight: int
+    wait_p50: float  # Seconds spent waiting for a slot, over the recent requests.
+    wait_p95: float
+    total_p50: float  # Seconds from asking for a slot until the response was read.
+    total_p95: float
+
+
+class RequestScheduler:
+    """Share a limited amount of concurrent requests between lanes, with weighted fair queuing
+
+    Every request gets a start tag on arrival: the later of the current virtual time and the finish tag of the
+    previous request in its lane, where a request of a lane with weight w takes 1/w of virtual time. Free slots go to
+    the waiting request with the lowest tag. A request in an idle lane is therefore served before everything that is
+    queued, and busy lanes share the slots in proportion to their weights, so no lane starves another."""
+    SAMPLES = 1000  # Recent requests per lane that the latency percentiles are based on.
+
+    def __init__(self, weights: Dict[str, float], concurrency: int):
+        self.weights = weights
+        self.concurrency = concurrency
+        self._free = concurrency
+        self._virtual = 0.0
+        self._finish: Dict[str, float] = dict.fromkeys(weights, 0.0)  # Lane -> finish tag of its last request.
+        self._order = {lane: n for n, lane in enumerate(sorted(weights, key=lambda lane: -weights[lane]))}
+        self._heap: List[Tuple[float, int, int, str, asyncio.Future]] = []  # (tag, lane order, seq, lane, future).
+        self._counter = itertools.count()
+        self._queued: Dict[str, int] = dict.fromkeys(weights, 0)
+        self._in_flight: Dict[str, int] = dict.fromkeys(weights, 0)
+        self._requests: Dict[str, int] = dict.fromkeys(weights, 0)
+        self._waits: Dict[str, Deque[float]] = {lane: collections.deque(maxlen=self.SAMPLES) for lane in weights}
+        self._totals: Dict[str, Deque[float]] = {lane: collections.deque(maxlen=self.SAMPLES) for lane in weights}
+
+    @contextlib.asynccontextmanager
+    async def slot(self, lane: str) -> AsyncIterator[None]:
+        """Hold one of the request slots, waiting for it in a lane"""
+        loop = asyncio.get_event_loop()
+        start = loop.time()
+        await self._acquire(lane)
+        self._waits[lane].append(loop.time() - start)
+        self._in_flight[lane] += 1
+        try:
+            yield
+        finally:
+            self._in_flight[lane] -= 1
+            self._requests[lane] += 1
+            self._totals[lane].append(loop.time() - start)
+            self._release()
+
+    def report(self, lane: str) -> LaneReport:
+        waits, totals = sorted(self._waits[lane]), sorted(self._totals[lane])
+        return LaneReport(self._requests[lane], self._queued[lane], self._in_flight[lane], self._percentile(waits, 50),
+                          self._percentile(waits, 95), self._percentile(totals, 50), self._percentile(totals, 95))
+
+    # Utilities.
+    async def _acquire(self, lane: str) -> None:
+        tag = max(self._virtual, self._finish[lane])
+        self._finish[lane] = tag + 1 / self.weights[lane]
+        if self._free > 0 and not self._heap:
+            self._free -= 1
+            self._virtual = tag
+            return
+        future = asyncio.get_event_loop().create_future()
+        heapq.heappush(self._heap, (tag, self._order[lane], next(self._counter), lane, future))
+        self._queued[lane] += 1
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():  # Got the slot just before the cancel, so pass it on.
+                self._release()
+            else:  # Still in the heap, where it's skipped.
+                future.cancel()
+                self._queued[lane] -= 1
+            raise
+
+    def _release(self) -> None:
+        """Give the freed slot to the waiting request with the lowest tag"""
+        while self._heap:
+            tag, _, _, lane, future = heapq.heappop(self._heap)
+            if future.cancelled():
+                continue
+            self._queued[lane] -= 1
+            self._virtual = tag
+            future.set_result(None)
+            return
+        self._free += 1
+
+    @staticmethod
+    def _percentile(sorted_values: List[float], pct: int) -> float:
+        """Nearest-rank percentile of an already sorted list"""
+        if not sorted_values:
+            return 0.0
+        return sorted_values[min(len(sorted_values), max(1, -(-pct * len(sorted_values) // 100))) - 1]
@@ -0,0 +1,133 @@
+# Default library.
+import asyncio
+import collections
+import time
+from typing import Awaitable, Callable, Deque, Dict, NamedTuple, Optional, Set, Tuple
+
+LinkLookup = Callable[[int], Awaitable[Tuple[Optional[str], Optional[str]]]]  # User ID -> (platform, gamer ID).
+SkillsFetch = Callable[[str, str], Awaitable[Optional[dict]]]  # (platform, gamer ID) -> skills response.
+
+
+class Prefetched(NamedTuple):
+    stamp: float  # POSIX timestamp of the fetch.
+    response: dict
+    used: bool  # Whether a lookup was served from it.
+
+
+class SkillsPrefetcher:
+    """Warm the skills of linked users that are active in chat, so that their next lookup doesn't wait on the API
+
+    Activity of a user queues a prefetch of their linked account, unless they were prefetched (or turned out not to be
+    linked) within REFRESH_FLOOR, or the BUDGET of prefetches per hour is used up. Prefetched responses are served to
+    lookups for TTL seconds. The stats show how many lookups were served (hits) and how many prefetches were used,
+    which is what the API quota is spent on."""
+    TTL = 5 * 60  # Seconds that a prefetched response is served. About one match, so ranks are rarely outdated.
+    REFRESH_FLOOR = 15 * 60  # Seconds before the same user is prefetched again.
+    BUDGET = 300  # Prefetches per hour, over all users.
+    CONCURRENCY = 2  # Prefetches at once.
+    MAX_PENDING = 100  # Users waiting for a prefetch. Beyond this, the oldest activity is dropped.
+    MAX_TRACKED = 50000  # Users (and accounts) kept in memory before expired entries are dropped.
+
+    def __init__(self, lookup: LinkLookup, fetch: SkillsFetch):
+        self.lookup = lookup
+        self.fetch = fetch
+        self.enabled = False
+        self.stats = collections.Counter()
+        self._next: Dict[int, float] = {}  # User ID -> time from which the user may be prefetched again.
+        self._cache: Dict[Tuple[str, str], Prefetched] = {}
+        self._spent: Deque[float] = collections.deque()  # Times of the prefetches in the last hour.
+        self._pending: Dict[int, None] = collections.OrderedDict()  # User IDs, in order of activity.
+        self._tasks: Set[asyncio.Task] = set()
+
+    def note_activity(self, user_id: int) -> None:
+        """Start a prefetch for a user that is active (e.g. sent a message), if the floor and budget allow it"""
+        if not self.enabled:
+            return
+        now = time.time()
+        if self._next.get(user_id, 0) > now or user_id in self._pending:
+            return
+        if self._over_budget(now):
+            self.stats["over_budget"] += 1
+            return
+        self._pending[user_id] = None
+        if len(self._pending) > self.MAX_PENDING:
+            self._pending.popitem(last=False)
+            self.stats["dropped"] += 1
+        if len(self._tasks) < self.CONCURRENCY:
+            task = asyncio.ensure_future(self._work())
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    def get(self, platform: str, gamer_id) -> Optional[dict]:
+        """The prefetched response of an account, if it's fresh. Counts as a hit or miss"""
+        if not self.enabled:
+            return None
+        key = (platform, str(gamer_id))
+        entry = self._cache.get(key)
+        if entry is None or entry.stamp < time.time() - self.TTL:
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits"] += 1
+        if not entry.used:
+            self.stats["used"] += 1
+            self._cache[key] = entry._replace(used=True)
+        return entry.response
+
+    def hit_rate(self) -> float:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return self.stats["hits"] / lookups if lookups else 0.0
+
+    def use_rate(self) -> float:
+        """The fraction of prefetches that served at least one lookup"""
+        return self.stats["used"] / self.stats["prefetched"] if self.stats["prefetched"] else 0.0
+
+    def close(self) -> None:
+        self.enabled = False
+        for task in self._tasks:
+            task.cancel()
+        self._pending.clear()
+        self._cache.clear()
+
+    # Utilities.
+    def _over_budget(self, now: float) -> bool:
+        while self._spent and self._spent[0] < now - 3600:
+            self._spent.popleft()
+        return len(self._spent) >= self.BUDGET
+
+    async def _work(self) -> None:
+        """Prefetch pending users, the most recently active first, as they're the most likely to do a lookup soon"""
+        while self._pending and self.enabled:
+            user_id, _ = self._pending.popitem(last=True)
+            now = time.time()
+            if self._over_budget(now):
+                self.stats["over_budget"] += 1 + len(self._pending)
+                self._pending.clear()
+                return
+            if len(self._next) >= self.MAX_TRACKED:
+                self._next = {k: v for k, v in self._next.items() if v > now}
+            self._next[user_id] = now + self.REFRESH_FLOOR
+            await self._prefetch(user_id)
+
+    async def _prefetch(self, user_id: int) -> None:
+        try:
+            platform, gamer_id = await self.lookup(user_id)
+        except Exception:  # E.g. a locked database. Like a failed fetch, the next activity after the floor retries.
+            self.stats["failed"] += 1
+            return
+        if platform is None:  # Not linked. The floor still applies, so chatting users only cost one query per floor.
+            self.stats["not_linked"] += 1
+            return
+        now = time.time()
+        self._spent.append(now)
+        try:
+            response = await self.fetch(platform, gamer_id)
+        except Exception:  # E.g. no token, or the API is down. The next activity after the floor tries again.
+            self.stats["failed"] += 1
+            return
+        if response is None:
+            self.stats["failed"] += 1
+            return
+        self.stats["prefetched"] += 1
+        if len(self._cache) >= self.MAX_TRACKED:
+            self._cache = {k: v for k, v in self._cache.items() if v.stamp >= now - self.TTL}
+        self._cache[(platform, str(gamer_id))] = Prefetched(now, response, False)
@@ -1,4 +1,4 @@
-from typing import Optional, Tuple
+from typing import Dict, Hashable, Optional, Tuple
 
 
 def _use_plist(check_d: dict, ignore_special: bool = False) -> bool:
@@ -32,6 +32,24 @@ def best_playlist(player_skills: list, ignore_special: bool = False) -> Tuple[in
     return best_tier, best_list_id, played_lists
 
 
+def best_account(responses: Dict[Hashable, dict], ignore_special: bool = False) -> Optional[Hashable]:
+    """
+    :param responses: Skills response dicts by any key, e.g. the accounts of a player.
+    :param ignore_special: Whether to count special playlists or not
+    :return: The key of the response with the best rank, or None if there are no responses.
+
+    Responses are compared on their best playlist, like best_playlist does: tier, then division, then MMR.
+    On a tie, the first response wins.
+    """
+    def rank(key) -> tuple:
+        player_skills = responses[key].get("player_skills") or []
+        best_tier, best_list_id, _ = best_playlist(player_skills, ignore_special)
+        best = next((d for d in player_skills if d["playlist"] == best_list_id), None)
+        return (best_tier, best["division"], best["mu"]) if best else (0, 0, float("-inf"))
+
+    return max(responses, key=rank, default=None)
+
+
 def com(ctx, command, tick: bool = True) -> str:
     """
     :param ctx: The context manager as provided by the command. Used for the prefix.
@@ -7,8 +7,9 @@ from .exceptions import SteamCallError
 
 class SteamCalls:
     """Class for querying the Steam API asynchronically"""
-    # t = token, v = vanity url.
-    API_VANITY = "http://api.steampowered.com/ISteamUser/ResolveVanityURL/v1/?key={t}&vanityurl={v}"
+    # base = API base url, t = token, v = vanity url.
+    API_BASE = "http://api.steampowered.com"
+    API_VANITY = "{base}/ISteamUser/ResolveVanityURL/v1/?key={t}&vanityurl={v}"
     STEAM_NO_MATCH = ":x: Error: That Steam vanity ID does not seem to exist. Please check your input."
     STEAM_TOKEN_NONE = ":x: Error: No token set for the Steam API."
     # Constants based on status codes.
@@ -21,9 +22,11 @@ class SteamCalls:
                     "Try to use the 17-digit number instead of the vanity ID, or try again later."
     UNKNOWN_STATUS_ERROR = "Something went wrong whilst querying the Steam API.\nStatus: {}\n Query: {}"
 
-    def __init__(self, config):
+    def __init__(self, config, base_url: str = None):
         # Load config in order to always have an updated token.
         self.config = config
+        # The base url can be overridden, e.g. to point at a local mock API.
+        self.base_url = (base_url or self.API_BASE).rstrip("/")
         self.session = aiohttp.ClientSession()
 
     async def _call_steam_api(self, request_url: str) -> dict:
@@ -66,7 +69,7 @@ class SteamCalls:
         token = await self.config.steam_token()
         if token is None:
             raise SteamCallError(self.STEAM_TOKEN_NONE)
-        request_url = self.API_VANITY.format(t=token, v=vanity_id)
+        request_url = self.API_VANITY.format(base=self.base_url, t=token, v=vanity_id)
         resp_dict = await self._call_steam_api(request_url)
         id64 = resp_dict.get("steamid")
         if not id64:  # No match found for steamid.
@@ -0,0 +1,80 @@
+# Default library.
+import collections
+from typing import Deque, Dict, Iterable, Optional, Tuple
+
+
+class CooldownIndex:
+    """The last rep of every (giver, receiver) pair within a window, to decide rep cooldowns without a database read
+
+    The index is complete from `since` onwards: a pair without an entry gave no rep after that time. A cooldown that
+    reaches back before `since` (a cooldown longer than the window, or an index that isn't loaded yet) can't be
+    decided here, and must be checked in the database, which stays the source of truth. Times are POSIX timestamps."""
+
+    def __init__(self):
+        self.window = 0  # Seconds of history that are kept.
+        self.since: Optional[float] = None  # The index holds all reps after this time. None until loaded.
+        self._last: Dict[Tuple[int, int], float] = {}  # (giver, receiver) -> stamp of the last rep.
+        self._events: Deque[Tuple[float, int, int]] = collections.deque()  # (stamp, giver, receiver), by stamp.
+
+    def __len__(self) -> int:
+        return len(self._last)
+
+    def load(self, reps: Iterable[Tuple[int, int, float]], since: float, window: int) -> None:
+        """
+        :param reps: (giver, receiver, timestamp) of all reps after since, e.g. from the database.
+        :param since: The time from which reps is complete.
+        :param window: The seconds of history to keep from now on, i.e. the longest cooldown in use.
+
+        Replace the index with the given reps. Reps that were recorded meanwhile are kept, so they can't be lost to
+        a load that read the database just before they were inserted."""
+        recorded = [(stamp, from_id, to_id) for (from_id, to_id), stamp in self._last.items() if stamp > since]
+        self._last.clear()
+        self._events.clear()
+        for stamp, from_id, to_id in sorted([(stamp, f, t) for f, t, stamp in reps] + recorded):
+            self.record(from_id, to_id, stamp)
+        self.window = window
+        self.since = since
+
+    def check(self, from_id: int, to_id: int, now: float, cooldown: int) -> Optional[bool]:
+        """
+        :param from_id: UserID of the user that gives the rep.
+        :param to_id: UserID of the user that is being rep'd.
+        :param now: The POSIX timestamp of the rep.
+        :param cooldown: The amount of seconds that need to have passed since the last rep of this pair.
+        :return: True if the rep is allowed, False if the pair is on cooldown, or None if the index can't tell.
+        """
+        self.expire(now)
+        last = self._last.get((from_id, to_id))
+        if last is not None and last > now - cooldown:
+            return False
+        if self.since is None or now - cooldown < self.since:
+            return None
+        return True
+
+    def record(self, from_id: int, to_id: int, stamp: float) -> Optional[float]:
+        """Remember a rep that was (or is about to be) inserted. Returns the stamp of the previous rep, if any"""
+        previous = self._last.get((from_id, to_id))
+        if previous is None or stamp >= previous:
+            self._last[(from_id, to_id)] = stamp
+            self._events.append((stamp, from_id, to_id))
+        return previous
+
+    def discard(self, from_id: int, to_id: int, stamp: float, previous: Optional[float]) -> None:
+        """Undo record (e.g. because the insert failed), unless the pair got a newer rep meanwhile"""
+        if self._last.get((from_id, to_id)) != stamp:
+            return
+        if previous is None or (self.since is not None and previous < self.since):  # Expired meanwhile.
+            del self._last[(from_id, to_id)]
+        else:  # Its event is still queued, so it expires as usual.
+            self._last[(from_id, to_id)] = previous
+
+    def expire(self, now: float) -> None:
+        """Forget the reps that are older than the window"""
+        if self.since is None:
+            return
+        before = now - self.window
+        while self._events and self._events[0][0] < before:
+            stamp, from_id, to_id = self._events.popleft()
+            if self._last.get((from_id, to_id)) == stamp:  # Otherwise the pair has a newer rep.
+                del self._last[(from_id, to_id)]
+        self.since = max(self.since, before)
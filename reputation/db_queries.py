@@ -1,37 +1,213 @@
 # Default library.
 import datetime as dt
 import sqlite3  # Only to make the db on init.
-from typing import List, Optional, Tuple, Set
+from typing import FrozenSet, Iterable, List, Optional, Tuple, Set
 
 # Requirements.
 import aiosqlite
 
+# Local files.
+from .rep_archive import ArchivedRep, pack_chunk, unpack_chunk
+
 
 # TODO: some todo about typehints that #s will take care of.
 class DbQueries:
     """Query the reputation database"""
-    CREATE_TABLE = "CREATE TABLE `reputations` (`from_user` INTEGER, `from_name` TEXT, `to_user` INTEGER, " \
-                   "`to_name` TEXT, `stamp` TEXT, `message` TEXT);"
-    CREATE_INDEX = "CREATE INDEX get_users_reps ON reputations(to_user);"
+    # Reps refer to users by ID, and stamps are POSIX timestamps (seconds, UTC). The latest known username of every
+    # user is kept once, in user_names. rep_id aliases the rowid, so it stays the same after a VACUUM.
+    CREATE_TABLE = "CREATE TABLE `reputations` (`rep_id` INTEGER PRIMARY KEY, `from_user` INTEGER, " \
+                   "`to_user` INTEGER, `stamp` INTEGER, `message` TEXT);\n" \
+                   "CREATE TABLE IF NOT EXISTS `user_names` (`user_id` INTEGER PRIMARY KEY, `name` TEXT);"
+    CREATE_INDEX = "CREATE INDEX IF NOT EXISTS reps_by_receiver ON reputations(to_user, stamp);\n" \
+                   "CREATE INDEX IF NOT EXISTS reps_by_stamp ON reputations(stamp);"
     TABLE_CHECK = "SELECT count(*) FROM sqlite_master WHERE type='table' AND name='reputations';"
-    INSERT_REP = "INSERT OR REPLACE INTO `reputations` VALUES (:f_id, :f_n, :t_id, :t_n, :stamp, :msg);"
-    SELECT_REP_PAIR = "SELECT * from reputations WHERE from_user = ? AND to_user = ? AND stamp > ?"
-    SELECT_REP_COUNT = "SELECT COUNT(*) as rep_count, COUNT(DISTINCT from_user) as u_count, " \
-                       "MAX(stamp) as most_recent FROM reputations WHERE to_user = ?;"
-    SELECT_LEADERBOARD = "SELECT to_user, COUNT(to_user) as rep_count FROM reputations " \
-                         "GROUP BY to_user ORDER BY rep_count DESC, MAX(stamp) DESC;"
-    CHECK_SIMPLE = "SELECT to_user from reputations GROUP BY to_user HAVING COUNT(*) >= ?;"
-    CHECK_DOUBLE = "SELECT to_user from reputations WHERE stamp > ? GROUP BY to_user HAVING COUNT(*) >= ?\n" \
+    LEGACY_CHECK = "SELECT count(*) FROM pragma_table_info('reputations') WHERE name='from_name';"
+    # Migration from the schema with names in every row and datetime strings as stamps. The derived tables are
+    # dropped first, and rebuilt by init_table afterwards. Rows keep their rowid as rep_id.
+    MIGRATE_LEGACY = "DROP TRIGGER IF EXISTS rep_search_insert;\n" \
+                     "DROP TRIGGER IF EXISTS rep_search_delete;\n" \
+                     "DROP TRIGGER IF EXISTS rep_search_update;\n" \
+                     "DROP TRIGGER IF EXISTS rep_daily_insert;\n" \
+                     "DROP TRIGGER IF EXISTS rep_daily_delete;\n" \
+                     "DROP TRIGGER IF EXISTS rep_daily_update;\n" \
+                     "DROP TABLE IF EXISTS rep_search;\n" \
+                     "DROP VIEW IF EXISTS rep_search_content;\n" \
+                     "DROP TABLE IF EXISTS rep_daily;\n" \
+                     "DROP INDEX IF EXISTS get_users_reps;\n" \
+                     "DROP INDEX IF EXISTS reps_by_receiver;\n" \
+                     "DROP INDEX IF EXISTS reps_by_stamp;\n" \
+                     "ALTER TABLE reputations RENAME TO reputations_legacy;\n" + CREATE_TABLE + "\n" \
+                     "INSERT INTO reputations (rep_id, from_user, to_user, stamp, message) " \
+                     "SELECT rowid, from_user, to_user, CAST(strftime('%s', substr(stamp, 1, 19)) AS INTEGER), " \
+                     "message FROM reputations_legacy ORDER BY rowid;\n" \
+                     "INSERT OR REPLACE INTO user_names (user_id, name) SELECT user_id, name FROM (\n" \
+                     "  SELECT user_id, name, MAX(r) FROM (\n" \
+                     "    SELECT from_user AS user_id, from_name AS name, rowid AS r FROM reputations_legacy\n" \
+                     "    UNION ALL SELECT to_user, to_name, rowid FROM reputations_legacy\n" \
+                     "  ) WHERE name IS NOT NULL GROUP BY user_id\n" \
+                     ");\n" \
+                     "DROP TABLE reputations_legacy;"
+    ENABLE_WAL = "PRAGMA journal_mode = WAL;"  # Readers (e.g. exports) and writers don't block each other.
+    INSERT_REP = "INSERT INTO `reputations` (from_user, to_user, stamp, message) VALUES (:f_id, :t_id, :stamp, :msg);"
+    # Only writes if the name changed, so that the usual rep costs no extra page writes.
+    UPSERT_NAME = "INSERT INTO `user_names` (user_id, name) VALUES (?, ?) " \
+                  "ON CONFLICT(user_id) DO UPDATE SET name = excluded.name WHERE name IS NOT excluded.name;"
+    SELECT_REP_PAIR = "SELECT rep_id from reputations WHERE from_user = ? AND to_user = ? AND stamp > ? LIMIT 1;"
+    SELECT_REP_COUNT = "SELECT IFNULL(SUM(reps), 0) as rep_count, COUNT(DISTINCT from_user) as u_count, " \
+                       "MAX(last_stamp) as most_recent FROM (\n" \
+                       "SELECT from_user, COUNT(*) AS reps, MAX(stamp) AS last_stamp FROM reputations " \
+                       "WHERE to_user = :user GROUP BY from_user\n" \
+                       "UNION ALL\n" \
+                       "SELECT from_user, reps, last_stamp FROM rep_archived_pairs WHERE to_user = :user\n" \
+                       ");"
+    SELECT_REPS_SINCE = "SELECT from_user, to_user, stamp FROM reputations WHERE stamp > ?;"
+    # Daily rollups: the amount of reps per receiver per (UTC) day, kept up to date by the triggers below.
+    # Days are counted since the epoch. Counts over a window sum the buckets of the whole days in it, plus the raw rows
+    # of the day it starts in. Archived reps are counted in one bucket per receiver, on day 0 (before any rep).
+    ROLLUP_CHECK = "SELECT count(*) FROM sqlite_master WHERE type='table' AND name='rep_daily';"
+    CREATE_ROLLUP = "CREATE TABLE `rep_daily` (`to_user` INTEGER, `day` INTEGER, `reps` INTEGER, " \
+                    "`last_stamp` INTEGER, PRIMARY KEY (to_user, day)) WITHOUT ROWID;\n" \
+                    "CREATE INDEX rep_daily_by_day ON rep_daily(day, reps, last_stamp);"
+    CREATE_ROLLUP_TRIGGERS = "CREATE TRIGGER IF NOT EXISTS rep_daily_insert AFTER INSERT ON reputations BEGIN\n" \
+                             "  INSERT INTO rep_daily(to_user, day, reps, last_stamp) " \
+                             "VALUES (new.to_user, new.stamp / 86400, 1, new.stamp)\n" \
+                             "  ON CONFLICT(to_user, day) DO UPDATE SET reps = reps + 1, " \
+                             "last_stamp = max(last_stamp, excluded.last_stamp);\n" \
+                             "END;\n" \
+                             "CREATE TRIGGER IF NOT EXISTS rep_daily_delete AFTER DELETE ON reputations BEGIN\n" \
+                             "  UPDATE rep_daily SET reps = reps - 1 " \
+                             "WHERE to_user = old.to_user AND day = old.stamp / 86400;\n" \
+                             "  DELETE FROM rep_daily " \
+                             "WHERE to_user = old.to_user AND day = old.stamp / 86400 AND reps <= 0;\n" \
+                             "END;\n" \
+                             "CREATE TRIGGER IF NOT EXISTS rep_daily_update AFTER UPDATE OF to_user, stamp " \
+                             "ON reputations BEGIN\n" \
+                             "  UPDATE rep_daily SET reps = reps - 1 " \
+                             "WHERE to_user = old.to_user AND day = old.stamp / 86400;\n" \
+                             "  DELETE FROM rep_daily " \
+                             "WHERE to_user = old.to_user AND day = old.stamp / 86400 AND reps <= 0;\n" \
+                             "  INSERT INTO rep_daily(to_user, day, reps, last_stamp) " \
+                             "VALUES (new.to_user, new.stamp / 86400, 1, new.stamp)\n" \
+                             "  ON CONFLICT(to_user, day) DO UPDATE SET reps = reps + 1, " \
+                             "last_stamp = max(last_stamp, excluded.last_stamp);\n" \
+                             "END;"
+    BACKFILL_ROLLUP = "DELETE FROM rep_daily;\n" \
+                      "INSERT INTO rep_daily(to_user, day, reps, last_stamp) " \
+                      "SELECT to_user, stamp / 86400, COUNT(*), MAX(stamp) FROM reputations GROUP BY 1, 2;\n" \
+                      "INSERT INTO rep_daily(to_user, day, reps, last_stamp) " \
+                      "SELECT to_user, 0, SUM(reps), MAX(last_stamp) FROM rep_archived_pairs GROUP BY 1;"
+    # (to_user, reps, last_stamp) rows whose sum per user is the amount of reps received after :since.
+    WINDOW_COUNTS = "SELECT to_user, reps, last_stamp FROM rep_daily WHERE day > :day\n" \
+                    "UNION ALL\n" \
+                    "SELECT to_user, COUNT(*), MAX(stamp) FROM reputations " \
+                    "WHERE stamp > :since AND stamp < :next_day GROUP BY to_user"
+    SELECT_LEADERBOARD = "SELECT to_user, SUM(reps) as rep_count FROM rep_daily " \
+                         "GROUP BY to_user ORDER BY rep_count DESC, MAX(last_stamp) DESC;"
+    SELECT_WINDOW_LEADERBOARD = "SELECT to_user, SUM(reps) as rep_count FROM (\n" + WINDOW_COUNTS + "\n) " \
+                                "GROUP BY to_user ORDER BY rep_count DESC, MAX(last_stamp) DESC;"
+    CHECK_SIMPLE = "SELECT to_user from rep_daily GROUP BY to_user HAVING SUM(reps) >= :role_min"
+    CHECK_DOUBLE = "SELECT to_user from (\n" + WINDOW_COUNTS + "\n) GROUP BY to_user HAVING SUM(reps) >= :decay_min\n" \
                    "INTERSECT\n" + CHECK_SIMPLE
-    GET_RECENT_REPS = "SELECT COUNT(*) from reputations WHERE to_user = ? AND stamp > ?"
+    GET_RECENT_REPS = "SELECT IFNULL(SUM(reps), 0) FROM (\n" \
+                      "SELECT reps FROM rep_daily WHERE to_user = :user AND day > :day\n" \
+                      "UNION ALL\n" \
+                      "SELECT COUNT(*) FROM reputations " \
+                      "WHERE to_user = :user AND stamp > :since AND stamp < :next_day\n" \
+                      ");"
+    # Full-text index over the comments. It is an external content table (the text is only stored in reputations),
+    # kept in sync by the triggers below. Comments without text are not indexed. The `users` column holds a "t<ID>"
+    # token for the recipient and an "f<ID>" token for the giver, so that user filters are part of the full-text
+    # match, instead of a lookup of every matching row. It has no weight in the ranking.
+    FTS_CHECK = "SELECT count(*) FROM sqlite_master WHERE type='table' AND name='rep_search';"
+    CREATE_FTS = "CREATE VIEW IF NOT EXISTS `rep_search_content` AS SELECT rep_id, message, " \
+                 "'t' || to_user || ' f' || from_user AS users FROM reputations WHERE message IS NOT NULL;\n" \
+                 "CREATE VIRTUAL TABLE `rep_search` USING fts5(message, users, content='rep_search_content', " \
+                 "content_rowid='rep_id', tokenize='porter unicode61');\n" \
+                 "INSERT INTO rep_search(rep_search, rank) VALUES ('rank', 'bm25(1.0, 0.0)');"
+    CREATE_FTS_TRIGGERS = "CREATE TRIGGER IF NOT EXISTS rep_search_insert AFTER INSERT ON reputations " \
+                          "WHEN new.message IS NOT NULL BEGIN\n" \
+                          "  INSERT INTO rep_search(rowid, message, users) " \
+                          "VALUES (new.rep_id, new.message, 't' || new.to_user || ' f' || new.from_user);\n" \
+                          "END;\n" \
+                          "CREATE TRIGGER IF NOT EXISTS rep_search_delete AFTER DELETE ON reputations " \
+                          "WHEN old.message IS NOT NULL BEGIN\n" \
+                          "  INSERT INTO rep_search(rep_search, rowid, message, users) " \
+                          "VALUES ('delete', old.rep_id, old.message, 't' || old.to_user || ' f' || old.from_user);\n" \
+                          "END;\n" \
+                          "CREATE TRIGGER IF NOT EXISTS rep_search_update AFTER UPDATE ON reputations BEGIN\n" \
+                          "  INSERT INTO rep_search(rep_search, rowid, message, users) SELECT 'delete', old.rep_id, " \
+                          "old.message, 't' || old.to_user || ' f' || old.from_user WHERE old.message IS NOT NULL;\n" \
+                          "  INSERT INTO rep_search(rowid, message, users) SELECT new.rep_id, new.message, " \
+                          "'t' || new.to_user || ' f' || new.from_user WHERE new.message IS NOT NULL;\n" \
+                          "END;"
+    REBUILD_FTS = "INSERT INTO rep_search(rep_search) VALUES ('rebuild');"
+    # Archive: reps older than the retention period are moved to compressed chunks of ARCHIVE_CHUNK reps (see
+    # rep_archive.py). The amount of reps per (receiver, giver) pair is kept, so that all-time counts stay exact.
+    # Archived reps are not in the full-text index.
+    CREATE_ARCHIVE = "CREATE TABLE IF NOT EXISTS `rep_archive` (`chunk_id` INTEGER PRIMARY KEY, " \
+                     "`first_stamp` INTEGER, `last_stamp` INTEGER, `rep_count` INTEGER, `data` BLOB);\n" \
+                     "CREATE TABLE IF NOT EXISTS `rep_archived_pairs` (`to_user` INTEGER, `from_user` INTEGER, " \
+                     "`reps` INTEGER, `last_stamp` INTEGER, PRIMARY KEY (to_user, from_user)) WITHOUT ROWID;"
+    SELECT_ARCHIVE_BATCH = "SELECT rep_id, from_user, to_user, stamp, message FROM reputations " \
+                           "WHERE stamp < ? ORDER BY stamp LIMIT ?;"
+    INSERT_ARCHIVE_CHUNK = "INSERT INTO rep_archive (first_stamp, last_stamp, rep_count, data) VALUES (?, ?, ?, ?);"
+    DELETE_REP = "DELETE FROM reputations WHERE rep_id = ?;"
+    UPSERT_ARCHIVED_PAIR = "INSERT INTO rep_archived_pairs (to_user, from_user, reps, last_stamp) " \
+                           "VALUES (?, ?, ?, ?) " \
+                           "ON CONFLICT(to_user, from_user) DO UPDATE SET reps = reps + excluded.reps, " \
+                           "last_stamp = max(last_stamp, excluded.last_stamp);"
+    UPSERT_ARCHIVED_DAY = "INSERT INTO rep_daily (to_user, day, reps, last_stamp) VALUES (?, 0, ?, ?) " \
+                          "ON CONFLICT(to_user, day) DO UPDATE SET reps = reps + excluded.reps, " \
+                          "last_stamp = max(last_stamp, excluded.last_stamp);"
+    SELECT_ARCHIVE_CHUNKS = "SELECT data FROM rep_archive WHERE last_stamp >= ? AND first_stamp < ? " \
+                            "ORDER BY chunk_id DESC;"
+    SELECT_ARCHIVE_STATUS = "SELECT IFNULL(SUM(rep_count), 0), COUNT(*), IFNULL(SUM(length(data)), 0), " \
+                            "MAX(last_stamp) FROM rep_archive;"
+    ARCHIVE_CHUNK = 10000  # Reps per chunk, and per transaction when archiving.
+    # Ring reports: the groups of users that were reported as a reputation ring (user IDs separated by spaces, sorted),
+    # so that a reload doesn't report them again.
+    CREATE_RING_REPORTS = "CREATE TABLE IF NOT EXISTS `ring_reports` (`members` TEXT PRIMARY KEY, `stamp` INTEGER) " \
+                          "WITHOUT ROWID;"
+    INSERT_RING_REPORT = "INSERT OR REPLACE INTO `ring_reports` (members, stamp) VALUES (?, ?);"
+    DELETE_RING_REPORTS = "DELETE FROM `ring_reports` WHERE stamp < ?;"
+    SELECT_RING_REPORTS = "SELECT members, stamp FROM `ring_reports`;"
+    # Ranking every match is slow for common words, so only the newest matches (rep IDs follow insertion order)
+    # are ranked. Rare words, or words combined with a user filter, have fewer matches than that anyway.
+    SEARCH_REPS = "SELECT from_user, to_user, stamp, snip FROM (\n" \
+                  "  SELECT r.from_user, r.to_user, r.stamp, rep_search.rank AS score, " \
+                  "snippet(rep_search, 0, '**', '**', '…', 16) AS snip\n" \
+                  "  FROM rep_search JOIN reputations r ON r.rep_id = rep_search.rowid\n" \
+                  "  WHERE rep_search MATCH :query AND (:after IS NULL OR r.stamp >= :after) " \
+                  "AND (:before IS NULL OR r.stamp < :before)\n" \
+                  "  ORDER BY rep_search.rowid DESC LIMIT :window\n" \
+                  ") ORDER BY score LIMIT :limit;"
+    SEARCH_WINDOW = 2000  # The amount of newest matches that are ranked.
 
     def __init__(self, db_path):
         self.path = db_path
-        self.init_table()
+        self.needs_upgrade = self.check_upgrade()
+        if not self.needs_upgrade:  # A new or current database, for which init_table is quick.
+            self.init_table()
+
+    def check_upgrade(self) -> bool:
+        """Whether the database has a table from an older schema, which init_table migrates or backfills
+
+        That can take minutes for a large database, so the caller should run init_table in an executor.
+        Note: this method uses sqlite3 rather than aiosqlite"""
+        connection = sqlite3.connect(self.path)
+        try:
+            if not connection.execute(self.TABLE_CHECK).fetchone()[0]:
+                return False
+            return bool(connection.execute(self.LEGACY_CHECK).fetchone()[0]
+                        or not connection.execute(self.ROLLUP_CHECK).fetchone()[0]
+                        or not connection.execute(self.FTS_CHECK).fetchone()[0])
+        finally:
+            connection.close()
 
     def init_table(self) -> None:
-        """Check if the table exists. If not, create it.
+        """Check if the table exists. If not, create it. Migrate and backfill tables from an older schema.
         Note: this method uses sqlite3 rather than aiosqlite"""
+        self.migrate_legacy()
         connection = sqlite3.connect(self.path)
         cursor = connection.cursor()
         cursor.execute(self.TABLE_CHECK)
@@ -39,12 +215,142 @@ class DbQueries:
         is_table = bool(resp[0][0])
         if is_table is False:
             print("Making the reputations table...")
-            cursor.execute(self.CREATE_TABLE)
-            cursor.execute(self.CREATE_INDEX)  # To ensure quick rep lookup.
+            cursor.executescript(self.CREATE_TABLE)
+        cursor.executescript(self.CREATE_INDEX)  # To ensure quick rep lookup.
+        cursor.executescript(self.CREATE_ARCHIVE)
+        cursor.execute(self.CREATE_RING_REPORTS)
+        cursor.execute(self.ROLLUP_CHECK)
+        if not cursor.fetchone()[0]:  # New table, or a database from before the rollups.
+            print("Making the daily reputation rollups...")
+            cursor.executescript(self.CREATE_ROLLUP)
+            needs_backfill = True
+        else:
+            needs_backfill = False
+        cursor.execute(self.FTS_CHECK)
+        if not cursor.fetchone()[0]:  # New table, or a database from before comments were searchable.
+            print("Indexing the reputation comments...")
+            cursor.executescript(self.CREATE_FTS)
+            cursor.execute(self.REBUILD_FTS)
             connection.commit()
+        cursor.executescript(self.CREATE_FTS_TRIGGERS)
+        cursor.executescript(self.CREATE_ROLLUP_TRIGGERS)
+        cursor.execute(self.ENABLE_WAL)
+        cursor.close()  # Finalizes the statements, so that the connection doesn't linger (and keep its lock).
         connection.close()
+        if needs_backfill:  # After the triggers exist, so that no rep is missed.
+            self.backfill_rollups()
+        self.needs_upgrade = False
         return
 
+    def migrate_legacy(self) -> bool:
+        """
+        :return: Whether the database had the legacy schema, and was migrated.
+
+        Move a database with names in every row and datetime strings as stamps to the compact schema, in one
+        transaction. The file is vacuumed afterwards, to give the freed pages back. The indexes, rollups and full-text
+        index are rebuilt by init_table.
+        Note: this method uses sqlite3 rather than aiosqlite"""
+        connection = sqlite3.connect(self.path, isolation_level=None)
+        try:
+            if not connection.execute(self.LEGACY_CHECK).fetchone()[0]:
+                return False
+            print("Migrating the reputations table to the compact schema...")
+            connection.execute("BEGIN IMMEDIATE;")
+            for statement in self.MIGRATE_LEGACY.split(";\n"):
+                connection.execute(statement)
+            connection.execute("COMMIT;")
+            connection.execute("VACUUM;")
+        finally:
+            connection.close()
+        return True
+
+    def backfill_rollups(self) -> int:
+        """
+        :return: The amount of daily buckets.
+
+        (Re)compute the daily rollups from all reputations, in one transaction
+        This runs on init when the rollups are new, and can repair them after manual edits of the table.
+        Note: this method uses sqlite3 rather than aiosqlite"""
+        connection = sqlite3.connect(self.path, isolation_level=None)
+        try:
+            connection.execute("BEGIN IMMEDIATE;")  # Block inserts, so that no rep is counted twice or missed.
+            for statement in self.BACKFILL_ROLLUP.split(";\n"):
+                connection.execute(statement)
+            bucket_count = connection.execute("SELECT COUNT(*) FROM rep_daily;").fetchone()[0]
+            connection.execute("COMMIT;")
+        finally:
+            connection.close()
+        return bucket_count
+
+    def archive_before(self, cutoff: dt.datetime) -> int:
+        """
+        :param cutoff: The datetime before which reputations are archived.
+        :return: The amount of reputations that were archived.
+
+        Move old reputations to the archive, one chunk per transaction, so that reps can still be given meanwhile
+        For every chunk, the pair counts and the archived rollup bucket are updated in the same transaction, so that
+        all-time counts are never off. The freed pages are reused by new reps.
+        Note: this method uses sqlite3 rather than aiosqlite"""
+        stamp = self.to_stamp(cutoff)
+        archived = 0
+        connection = sqlite3.connect(self.path, isolation_level=None)
+        try:
+            while True:
+                connection.execute("BEGIN IMMEDIATE;")
+                rows = connection.execute(self.SELECT_ARCHIVE_BATCH, [stamp, self.ARCHIVE_CHUNK]).fetchall()
+                if not rows:
+                    connection.execute("COMMIT;")
+                    break
+                pairs, receivers = {}, {}
+                for _, from_id, to_id, rep_stamp, _ in rows:
+                    reps, last = pairs.get((to_id, from_id), (0, rep_stamp))
+                    pairs[(to_id, from_id)] = (reps + 1, max(last, rep_stamp))
+                    reps, last = receivers.get(to_id, (0, rep_stamp))
+                    receivers[to_id] = (reps + 1, max(last, rep_stamp))
+                connection.execute(self.INSERT_ARCHIVE_CHUNK, [rows[0][3], rows[-1][3], len(rows), pack_chunk(rows)])
+                connection.executemany(self.DELETE_REP, [(row[0],) for row in rows])  # Triggers update the rollups.
+                connection.executemany(self.UPSERT_ARCHIVED_PAIR, [k + v for k, v in pairs.items()])
+                connection.executemany(self.UPSERT_ARCHIVED_DAY, [(k,) + v for k, v in receivers.items()])
+                connection.execute("COMMIT;")
+                archived += len(rows)
+        finally:
+            connection.close()
+        return archived
+
+    def archived_reps(self, to_id: int = None, from_id: int = None, after: dt.datetime = None,
+                      before: dt.datetime = None) -> List[ArchivedRep]:
+        """
+        :param to_id: (Optional) Only return reputations received by this userID.
+        :param from_id: (Optional) Only return reputations given by this userID.
+        :param after: (Optional) Only return reputations given at or after this datetime.
+        :param before: (Optional) Only return reputations given before this datetime.
+        :return: A list of (rep_id, from_user, to_user, POSIX timestamp, message) tuples, newest first.
+
+        Look up archived reputations. Every chunk in the period is decompressed, so this is meant for rare lookups.
+        Note: this method uses sqlite3 rather than aiosqlite"""
+        after_stamp = self.to_stamp(after) if after else 0
+        before_stamp = self.to_stamp(before) if before else 2 ** 62
+        connection = sqlite3.connect(self.path)
+        try:
+            chunks = connection.execute(self.SELECT_ARCHIVE_CHUNKS, [after_stamp, before_stamp]).fetchall()
+        finally:
+            connection.close()
+        found = []
+        for (data,) in chunks:
+            found.extend(row for row in unpack_chunk(data) if after_stamp <= row[3] < before_stamp
+                         and (to_id is None or row[2] == to_id) and (from_id is None or row[1] == from_id))
+        found.sort(key=lambda row: row[3], reverse=True)
+        return found
+
+    async def archive_status(self) -> Tuple[int, int, int, Optional[int]]:
+        """
+        :return: The amount of archived reputations, the amount of chunks, their total size in bytes,
+                 and the POSIX timestamp of the newest archived reputation.
+        """
+        resp = await self.exec_sql(self.SELECT_ARCHIVE_STATUS)
+        assert resp, "No response from archive_status!"
+        return resp[0]
+
     async def all_eligible_users(self, decay_threshold: int, role_threshold: int,
                                  decay_period: Optional[int]) -> Set[int]:
         """
@@ -54,10 +360,11 @@ class DbQueries:
         :return: A list of all user ids who are eligible for the reputation role.
         """
         if decay_period:
-            stamp = dt.datetime.utcnow() - dt.timedelta(seconds=decay_period)
-            id_list = await self.exec_sql(self.CHECK_DOUBLE, params=[stamp, decay_threshold, role_threshold])
+            params = self.window_params(dt.datetime.utcnow() - dt.timedelta(seconds=decay_period))
+            params.update(decay_min=decay_threshold, role_min=role_threshold)
+            id_list = await self.exec_sql(self.CHECK_DOUBLE, params=params)
         else:
-            id_list = await self.exec_sql(self.CHECK_SIMPLE, params=[role_threshold])
+            id_list = await self.exec_sql(self.CHECK_SIMPLE, params={"role_min": role_threshold})
         return {x[0] for x in id_list}
 
     async def insert_rep(self, from_id: int, from_name: str, to_id: int, to_name: str, rep_dt: dt.datetime,
@@ -73,35 +380,41 @@ class DbQueries:
                from_id rep'd to_id.
         :return: A boolean which determines whether a reputation was eligible to be inserted or not.
         """
+        stamp = self.to_stamp(rep_dt)
         if cooldown:
-            compare_stamp = rep_dt - dt.timedelta(seconds=cooldown)
-            check_rows = await self.exec_sql(self.SELECT_REP_PAIR, [from_id, to_id, compare_stamp])
+            check_rows = await self.exec_sql(self.SELECT_REP_PAIR, [from_id, to_id, stamp - cooldown])
             can_insert = not check_rows  # Boolean, if check_rows is empty then the rep can be inserted.
         else:
             can_insert = True
         if can_insert:
-            stamp = str(rep_dt)
-            params = {"f_id": from_id, "f_n": from_name, "t_id": to_id, "t_n": to_name, "stamp": stamp, "msg": rep_msg}
-            await self.exec_sql(self.INSERT_REP, params=params, commit=True)
+            params = {"f_id": from_id, "t_id": to_id, "stamp": stamp, "msg": rep_msg}
+            async with aiosqlite.connect(self.path) as db:
+                await db.execute(self.INSERT_REP, params)
+                await db.executemany(self.UPSERT_NAME, [(from_id, from_name), (to_id, to_name)])
+                await db.commit()
         return can_insert
 
-    async def user_rep_count(self, user_id: int) -> Tuple[int, int, Optional[str]]:
+    async def user_rep_count(self, user_id: int) -> Tuple[int, int, Optional[int]]:
         """
         :param user_id: The userID of the user whose reputation count should be checked.
         :return: The tuple with the amount of reputations received, given by distinct count of users,
-                 and the datetime string of the last reputation given.
+                 and the POSIX timestamp of the last reputation given.
         """
-        resp = await self.exec_sql(self.SELECT_REP_COUNT, params=[user_id])
+        resp = await self.exec_sql(self.SELECT_REP_COUNT, params={"user": user_id})
         assert resp, "No response from user_rep_count!"  # Should always return a response.
         return resp[0]
 
-    async def rep_leaderboard(self) -> Optional[List[Tuple[int, int]]]:
+    async def rep_leaderboard(self, since: dt.datetime = None) -> Optional[List[Tuple[int, int]]]:
         """
+        :param since: (Optional) Only count the reputations received after this datetime.
         :return: A list of tuples with the amount of reputations by userID, sorted on reputation count.
 
         Get the full leaderboard for reputations
         """
-        leaderboard = await self.exec_sql(self.SELECT_LEADERBOARD)
+        if since is None:
+            leaderboard = await self.exec_sql(self.SELECT_LEADERBOARD)
+        else:
+            leaderboard = await self.exec_sql(self.SELECT_WINDOW_LEADERBOARD, params=self.window_params(since))
         return leaderboard if leaderboard else None
 
     async def recent_reps(self, user_id: int, start_time: dt.datetime) -> int:
@@ -110,11 +423,87 @@ class DbQueries:
         :param start_time: The timestamp after which all reputations should be counted
         :return: An integer with the amount of reputations received by the user after start_time
         """
-        resp = await self.exec_sql(self.GET_RECENT_REPS, params=[user_id, start_time])
+        params = self.window_params(start_time)
+        params["user"] = user_id
+        resp = await self.exec_sql(self.GET_RECENT_REPS, params=params)
         assert resp, "No response from recent_reps!"
         return resp[0][0]
 
+    async def reps_since(self, since: dt.datetime) -> List[Tuple[int, int, int]]:
+        """
+        :param since: The datetime after which reputations should be returned.
+        :return: A list of (from_user, to_user, POSIX timestamp) tuples of all reputations given after since.
+        """
+        return await self.exec_sql(self.SELECT_REPS_SINCE, params=[self.to_stamp(since)])
+
+    async def insert_ring_reports(self, groups: Iterable[FrozenSet[int]], stamp: float) -> None:
+        """Remember groups of users as reported reputation rings, at a POSIX timestamp"""
+        rows = [(" ".join(str(user_id) for user_id in sorted(members)), int(stamp)) for members in groups]
+        async with aiosqlite.connect(self.path) as db:
+            await db.executemany(self.INSERT_RING_REPORT, rows)
+            await db.commit()
+
+    async def ring_reports(self, since: float) -> List[Tuple[FrozenSet[int], int]]:
+        """
+        :param since: The POSIX timestamp from which reports are kept. Older reports are deleted.
+        :return: A list of (user IDs, POSIX timestamp) of the reported reputation rings.
+        """
+        await self.exec_sql(self.DELETE_RING_REPORTS, [int(since)], commit=True)
+        rows = await self.exec_sql(self.SELECT_RING_REPORTS)
+        return [(frozenset(int(user_id) for user_id in members.split()), stamp) for members, stamp in rows]
+
+    async def search_reps(self, text: str, to_id: int = None, from_id: int = None, after: dt.datetime = None,
+                          before: dt.datetime = None, limit: int = 50) -> List[Tuple[int, int, int, str]]:
+        """
+        :param text: The words to search for. All words must occur in a comment; a word ending in * is a prefix.
+        :param to_id: (Optional) Only search reputations received by this userID.
+        :param from_id: (Optional) Only search reputations given by this userID.
+        :param after: (Optional) Only search reputations given at or after this datetime.
+        :param before: (Optional) Only search reputations given before this datetime.
+        :param limit: The maximum amount of results.
+        :return: A list of (from_user, to_user, POSIX timestamp, snippet) tuples, best match first.
+                 The matched words in the snippet are marked bold.
+        """
+        query = self.match_expression(text, to_id, from_id)
+        if query is None:
+            return []
+        params = {"query": query, "after": self.to_stamp(after) if after else None,
+                  "before": self.to_stamp(before) if before else None, "window": self.SEARCH_WINDOW, "limit": limit}
+        return await self.exec_sql(self.SEARCH_REPS, params=params)
+
     # Utilities.
+    @staticmethod
+    def to_stamp(value: dt.datetime) -> int:
+        """The POSIX timestamp of a datetime, as stored in the database. Naive datetimes are in UTC"""
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=dt.timezone.utc)
+        return int(value.timestamp())
+
+    @classmethod
+    def window_params(cls, since: dt.datetime) -> dict:
+        """The parameters of WINDOW_COUNTS: the day buckets after the day of since, and the rest of that day"""
+        stamp = cls.to_stamp(since)
+        day = stamp // 86400
+        return {"since": stamp, "day": day, "next_day": (day + 1) * 86400}
+
+    @staticmethod
+    def match_expression(text: str, to_id: int = None, from_id: int = None) -> Optional[str]:
+        """Turn user input into an FTS5 query of quoted words (so that no input is a syntax error), plus user filters"""
+        terms = []
+        for word in text.split():
+            prefix = word.endswith("*")
+            word = word.replace('"', "").rstrip("*")
+            if word:
+                terms.append('"{}"{}'.format(word, "*" if prefix else ""))
+        if not terms:
+            return None
+        query = "message : ({})".format(" ".join(terms))
+        if to_id is not None:
+            query += ' AND users : "t{}"'.format(to_id)
+        if from_id is not None:
+            query += ' AND users : "f{}"'.format(from_id)
+        return query
+
     async def exec_sql(self, query, params=None, commit=False) -> list:
         """Make an asynchronous query to the reputation database"""
         async with aiosqlite.connect(self.path) as db:
@@ -0,0 +1,103 @@
+# Default library.
+import asyncio
+import heapq
+import itertools
+from typing import Dict, List, Optional, Tuple
+
+# Used by Red.
+import discord
+
+
+class DeleteScheduler:
+    """Delete messages after a delay, using one timer for all pending deletions
+
+    Pending deletions are kept in a heap ordered by due time, and a single task sleeps until the earliest one.
+    Due messages from the same channel are removed with one bulk delete where possible."""
+    BULK_LIMIT = 100  # Maximum amount of messages per bulk delete call.
+
+    def __init__(self):
+        self._heap: List[Tuple[float, int, discord.Message]] = []
+        self._counter = itertools.count()  # Tie-breaker, so messages themselves are never compared.
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._closed = False
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def schedule(self, message: discord.Message, delay: float) -> None:
+        """
+        :param message: The message that should be deleted.
+        :param delay: The amount of seconds after which the message should be deleted.
+        :return: None
+
+        Schedule a message for deletion"""
+        if self._closed:
+            return
+        loop = asyncio.get_event_loop()
+        if self._task is None or self._task.done():  # Start the timer lazily, so it runs on the bot's event loop.
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.ensure_future(self._run())
+        due = loop.time() + delay
+        is_earliest = not self._heap or due < self._heap[0][0]
+        heapq.heappush(self._heap, (due, next(self._counter), message))
+        if is_earliest:  # The timer sleeps until the previous earliest deletion, so wake it up.
+            self._wakeup.set()
+
+    def close(self) -> int:
+        """Stop the timer and drop all pending deletions. Returns the amount of dropped deletions"""
+        self._closed = True
+        dropped = len(self._heap)
+        self._heap.clear()
+        if self._task is not None:
+            self._task.cancel()
+        return dropped
+
+    # Utilities.
+    async def _run(self) -> None:
+        """Sleep until the earliest deletion is due, then delete everything that is due"""
+        loop = asyncio.get_event_loop()
+        while not self._closed:
+            if not self._heap:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            delay = self._heap[0][0] - loop.time()
+            if delay > 0:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            # Collect all due messages, grouped per channel.
+            now = loop.time()
+            by_channel: Dict[int, List[discord.Message]] = {}
+            while self._heap and self._heap[0][0] <= now:
+                message = heapq.heappop(self._heap)[2]
+                by_channel.setdefault(message.channel.id, []).append(message)
+            for messages in by_channel.values():
+                try:
+                    await self._delete_batch(messages)
+                except Exception as e:  # One failing channel must not stop the timer, or all deletions are lost.
+                    print("DeleteScheduler -> Deleting {} messages failed: {!r}".format(len(messages), e))
+
+    async def _delete_batch(self, messages: List[discord.Message]) -> None:
+        """Delete messages of one channel, in bulk if possible, and one by one otherwise"""
+        channel = messages[0].channel
+        if len(messages) > 1 and hasattr(channel, "delete_messages"):
+            try:
+                for i in range(0, len(messages), self.BULK_LIMIT):
+                    await channel.delete_messages(messages[i:i + self.BULK_LIMIT])
+                return
+            except discord.HTTPException:  # E.g. no manage messages permissions. Fall back to single deletes.
+                pass
+        for message in messages:
+            try:
+                await message.delete()
+            except discord.NotFound:  # Already deleted.
+                pass
+            except discord.Forbidden:
+                print("DeleteScheduler -> I lack manage messages permissions!")
+            except discord.HTTPException as e:  # E.g. a server error. The message is dropped rather than retried.
+                print("DeleteScheduler -> Deleting a message failed: {!r}".format(e))
@@ -0,0 +1,71 @@
+# Default library.
+import asyncio
+import random
+import time
+from typing import Awaitable, Callable, Dict, Iterable, NamedTuple, Set
+
+# Used by Red.
+import discord
+
+GuildCheck = Callable[[discord.Guild, float], Awaitable[bool]]  # (guild, deadline) -> whether it finished.
+
+
+class SweepResult(NamedTuple):
+    started: float  # POSIX timestamp.
+    duration: float  # Seconds.
+    finished: bool  # False if the time budget ran out (or the check failed), so the guild goes first next tick.
+
+
+class GuildSweeper:
+    """Plan a check for every guild once per tick, spread out over the tick, and run the check of a guild in a budget
+
+    Every guild gets its own offset within the spread, which stays the same across ticks (and restarts), so each
+    guild is checked once per interval, and not all guilds hit the database and the Discord API at the same moment.
+    The caller schedules the checks at their offsets (e.g. as delayed jobs), and runs each with run.
+    A check gets a deadline (loop time) after BUDGET seconds, and should stop when it passes; it is cancelled if it
+    runs HARD_STOP_GRACE seconds over. Guilds that didn't finish (unfinished, which the caller may store) go first in
+    the next tick, so that their leftover work is picked up early."""
+    BUDGET = 120  # Seconds per guild per tick.
+    HARD_STOP_GRACE = 30
+
+    def __init__(self, check: GuildCheck):
+        self.check = check
+        self.results: Dict[int, SweepResult] = {}  # Guild ID -> the last sweep of that guild.
+        self.unfinished: Set[int] = set()  # Guild IDs.
+
+    def offset(self, guild_id: int, spread: float) -> float:
+        """The delay of a guild within a tick: a stable per-guild jitter, or 0 if it has leftover work"""
+        if guild_id in self.unfinished:
+            return 0.0
+        return random.Random(guild_id).random() * spread
+
+    def plan(self, guild_ids: Iterable[int], spread: float) -> Dict[int, float]:
+        """
+        :param guild_ids: The guilds to check this tick.
+        :param spread: The seconds over which the starts of the checks are spread.
+        :return: Guild ID -> the delay of its check.
+
+        Also forget the guilds that are not checked anymore (e.g. that the bot left)."""
+        delays = {guild_id: self.offset(guild_id, spread) for guild_id in guild_ids}
+        for guild_id in set(self.results) - set(delays):
+            del self.results[guild_id]
+        self.unfinished.intersection_update(delays)
+        return delays
+
+    async def run(self, gld: discord.Guild) -> bool:
+        """Check a guild within the budget. Returns whether it finished"""
+        loop = asyncio.get_event_loop()
+        started, start = time.time(), loop.time()
+        try:
+            finished = await asyncio.wait_for(self.check(gld, start + self.BUDGET), self.BUDGET + self.HARD_STOP_GRACE)
+        except asyncio.TimeoutError:
+            finished = False
+        except Exception as e:  # One broken guild must not stop the checks of the others.
+            print("Reputation -> The sweep of guild {} failed: {!r}".format(gld.id, e))
+            finished = False
+        self.results[gld.id] = SweepResult(started, loop.time() - start, finished)
+        if finished:
+            self.unfinished.discard(gld.id)
+        else:
+            self.unfinished.add(gld.id)
+        return finished
@@ -0,0 +1,39 @@
+# Default library.
+import json
+import zlib
+from typing import Iterable, List, Tuple
+
+COMPRESS_LEVEL = 9  # Chunks are written once and rarely read, so size matters more than speed.
+
+ArchivedRep = Tuple[int, int, int, int, str]  # (rep_id, from_user, to_user, stamp, message).
+
+
+def _deltas(values: List[int]) -> List[int]:
+    return [v - p for p, v in zip([0] + values, values)]
+
+
+def _undo_deltas(deltas: List[int]) -> List[int]:
+    values, total = [], 0
+    for d in deltas:
+        total += d
+        values.append(total)
+    return values
+
+
+def pack_chunk(rows: Iterable[ArchivedRep]) -> bytes:
+    """
+    :param rows: The reputations to archive, sorted on stamp.
+    :return: The compressed chunk.
+
+    Rows are stored column by column, with rep IDs and stamps as differences to the previous row. Similar values
+    next to each other (small gaps, repeated user IDs and comments) compress several times better than rows.
+    """
+    rep_ids, from_users, to_users, stamps, messages = (list(c) for c in zip(*rows))
+    columns = [_deltas(rep_ids), from_users, to_users, _deltas(stamps), messages]
+    return zlib.compress(json.dumps(columns, separators=(",", ":")).encode("utf-8"), COMPRESS_LEVEL)
+
+
+def unpack_chunk(data: bytes) -> List[ArchivedRep]:
+    """The rows of a chunk made by pack_chunk"""
+    rep_ids, from_users, to_users, stamps, messages = json.loads(zlib.decompress(data).decode("utf-8"))
+    return list(zip(_undo_deltas(rep_ids), from_users, to_users, _undo_deltas(stamps), messages))
@@ -1,18 +1,27 @@
 # Default Library.
 import asyncio
 import datetime as dt
-from asyncio import sleep
-from typing import Literal, Optional, Tuple, Set
+import functools
+import re
+import sqlite3  # For its errors, which aiosqlite raises.
+import time
+from typing import List, Literal, Optional, Tuple, Set
 
 # Used by Red.
 import discord
-import redbot.core.utils.menus as red_menu
 from redbot.core import commands, checks, Config, data_manager
 from redbot.core.bot import Red  # For type hints.
 from redbot.core.commands.context import Context  # For type hints.
 
 # Local files.
+from .cooldown_index import CooldownIndex
 from .db_queries import DbQueries
+from .delete_scheduler import DeleteScheduler
+from .guild_sweeper import GuildSweeper
+from .job_queue import Job, JobQueue
+from .menu_dispatcher import MenuDispatcher
+from .ring_detector import RingDetector, Suspect
+from .table_export import FORMATS, export_tables
 
 
 class Reputation(commands.Cog):
@@ -23,7 +32,11 @@ class Reputation(commands.Cog):
     DEFAULT_COOLDOWN = 60 * 60 * 24 * 7  # 1 week (cooldown for user A to give user B rep).
     DEFAULT_DECAY = 60 * 60 * 24 * 7 * 5  # 5 weeks (35 days, time before the reputation role will decay).
     DEFAULT_LOG_MESSAGE = "{user} has received the reputation role."
-    LOOP_SLEEP_TIME = 60 * 60 * 12  # 12 hours.
+    LOOP_SLEEP_TIME = 60 * 60 * 12  # 12 hours (every guild is checked once per period).
+    JOB_WORKERS = 4  # Background jobs at once. The periodic checks of guilds are jobs, so also those at once.
+    INDEX_FRESH = 60 * 60  # Seconds after a load in which the periodic check doesn't reload the in-memory indexes.
+    NOTICE_DELETE_DELAY = 20  # Seconds before rep notices (and the invoking message) are deleted.
+    BAD_INPUT_DELETE_DELAY = 30
 
     # Notice emote prefixes.
     BIN = ":put_litter_in_its_place: "
@@ -43,6 +56,9 @@ class Reputation(commands.Cog):
     DECAY_CLEARED = BIN + "Set the reputation decay back to the default settings."
     DECAY_REMOVED = BIN + "Disabled reputation decay."
     DECAY_SET = DONE + "Set the reputation decay to {}"
+    EXPORT_DONE = DONE + "Exported {rows} reputation{s} to `{path}`, and the usernames to `{names_path}`.\n" \
+                         "The archive is exported next to them."
+    EXPORT_BAD_FORMAT = ERROR + "Unknown format. Use one of: {}."
     DECAY_THRESHOLD_CLEARED = BIN + "Successfully set the decay threshold to the default: `2`"
     DECAY_THRESHOLD_SET = DONE + "Successfully set the decay threshold to {}"
     LOG_MSG_RESET = BIN + "Log message reset to default."
@@ -61,6 +77,17 @@ class Reputation(commands.Cog):
     ROLE_THRESHOLD_SET = DONE + "Successfully set the role threshold to {}"
     USER_OPT_IN = DONE + "You will now receive a reputation role when eligible."
     USER_OPT_OUT = BIN + "You will no longer receive a reputation role, even when eligible."
+    RETENTION_OFF = BIN + "Reputations are kept forever. Reputations that were archived already stay archived."
+    RETENTION_SET = DONE + "Reputations are archived after {months} month{s}. Older reputations are being " \
+                           "archived in the background (see `{jobs}`)."
+    RETENTION_STATUS = "Retention: **{policy}**\nArchive: **{n}** reputation{s} in {chunks} chunk{cs}, {size:.1f} MiB"
+    SWEEP_ROW = "{duration:.1f} s, <t:{started}:R>{left}"
+    SWEEP_LEFT = " (continues next period)"
+    SWEEP_NONE = "No periodic checks have run yet."
+    DB_UPGRADING = ":hourglass: The reputation database is being upgraded after an update of the cog. " \
+                   "Your command continues when that's done."
+    RING_REPORT = ":warning: Possible reputation ring: {members} gave each other **{reps}** reputation{s} " \
+                  "in the last {days} days."
     # Audit log reasons.
     ONE_ADD = "Single reputation role check"
     GLD_ADD = "Guild reputation role check"
@@ -70,8 +97,24 @@ class Reputation(commands.Cog):
     LEADERBOARD_NO_REPS = ERROR + "No reputations in the database."
     LEADERBOARD_DESC = "Users with at least 1 reputation: **{}**"
     LEADERBOARD_ROW = "`{:0{}d}` {} • **{}**"
+    LEADERBOARD_BAD_PERIOD = ERROR + "Unknown period. Use `week`, `month`, `season`, `decay` or an amount of days."
+    LEADERBOARD_PERIODS = {"week": 7, "month": 30, "season": 91}  # In days.
+    LEADERBOARD_ARCHIVED = ERROR + "Reputations before {} are archived, so a period can't start before then.\n" \
+                                   "Leave out the period to count all reputations."
+    HISTORY_NO_REPS = ERROR + "No archived reputations found for that user."
+    HISTORY_DESC = "Archived reputations received by <@{}>: **{}**"
+    HISTORY_ROW = "`{date}` from <@{from_id}>: {message}"
+    HISTORY_PAGE_SIZE = 10
+    SEARCH_BAD_DATE = ERROR + "Invalid date `{}`. Please use the format `YYYY-MM-DD`."
+    SEARCH_BAD_USER = ERROR + "User `{}` not found. Please use a mention, a user ID or a username."
+    SEARCH_NO_WORDS = ERROR + "Please give at least one word to search for."
+    SEARCH_NO_RESULTS = ERROR + "No reputation comments match your search."
+    SEARCH_DESC = "Results for: {}"
+    SEARCH_ROW = "`{date}` <@{from_id}> → <@{to_id}>\n{snippet}"
+    SEARCH_PAGE_SIZE = 5
+    SEARCH_FILTERS = ("to", "from", "after", "before")
     OFF = "Disabled"
-    TIME_FMT = "%Y-%m-%d %H:%M:%S.%f"
+    RETENTION_MONTH = 60 * 60 * 24 * 30  # Seconds.
 
     def __init__(self, bot: Red):
         super().__init__()
@@ -84,17 +127,106 @@ class Reputation(commands.Cog):
                                    reputation_channel=None, shadow_role=None, log_channel=None,
                                    log_message=self.DEFAULT_LOG_MESSAGE)
         self.config.register_user(opt_out=False)
+        self.config.register_global(retention_months=None, sweep_unfinished=[])
         self.rep_db = DbQueries(self.PATH_DB)
-        self.decay_loop = asyncio.ensure_future(self.periodical_decay_check())
+        self.db_ready = asyncio.Event()  # Set once the database has the current schema (see start_jobs).
+        if not self.rep_db.needs_upgrade:
+            self.db_ready.set()
+        self.delete_scheduler = DeleteScheduler()
+        self.menus = MenuDispatcher(bot)
+        self.rings = RingDetector()
+        self.cooldowns = CooldownIndex()
+        self.sweeper = GuildSweeper(self.sweep_guild)
+        self.rings_pending: Optional[List[Tuple[int, int, float]]] = None  # Reps given during a full ring pass.
+        self.indexes_loaded: Optional[float] = None  # POSIX timestamp of the last load of the in-memory indexes.
+        self.jobs = JobQueue(self.FOLDER + "/jobs.db", workers=self.JOB_WORKERS)
+        self.jobs.register("decay_check", self.periodical_decay_check)
+        self.jobs.register("guild_check", self.guild_check)
+        self.jobs.register("archive", self.archive_job)
+        self.unloaded = False
+        self.startup = asyncio.ensure_future(self.start_jobs())
 
-    # Loops
-    async def periodical_decay_check(self):
-        """Periodically perform the decay check for all guilds the bot is in"""
+    def cog_unload(self):
+        self.unloaded = True
+        self.startup.cancel()
+        self.menus.close()
+        dropped = self.delete_scheduler.close()
+        if dropped:
+            print("Reputation -> Dropped {} pending message deletion(s) on unload.".format(dropped))
+        interrupted = self.jobs.close()
+        if interrupted:
+            print("Reputation -> Interrupted {} background job(s) on unload. They continue on the next load.".format(
+                interrupted))
+
+    # Background jobs.
+    async def start_jobs(self):
+        """Upgrade the database if needed, then load the indexes and start the background jobs once the bot is ready"""
+        if self.rep_db.needs_upgrade:  # A migration or backfill can take minutes, so it runs outside the event loop.
+            print("Reputation -> Upgrading the database. Commands wait until it's done.")
+            try:
+                await asyncio.get_event_loop().run_in_executor(None, self.rep_db.init_table)
+            except Exception as e:
+                print("Reputation -> Upgrading the database failed: {!r}".format(e))
+                return
+            print("Reputation -> Upgraded the database.")
+            self.db_ready.set()
         await self.bot.wait_until_ready()
-        while self == self.bot.get_cog(self.__class__.__name__):
-            for gld in self.bot.guilds:
-                await self.guild_role_check(gld)
-            await asyncio.sleep(self.LOOP_SLEEP_TIME)
+        try:
+            await self.load_indexes()
+        except Exception as e:  # The jobs must start anyway. The periodic check loads the indexes again.
+            print("Reputation -> Loading the indexes failed: {!r}".format(e))
+        self.sweeper.unfinished = set(await self.config.sweep_unfinished())
+        # Recurring, so queueing it on every load is deduplicated, and its schedule carries over restarts.
+        await self.jobs.enqueue("decay_check", every=self.LOOP_SLEEP_TIME, dedupe_key="decay_check")
+        if not self.unloaded:  # Else the queue of this instance would keep running next to that of the new one.
+            self.jobs.start()
+
+    async def periodical_decay_check(self, job: Job):
+        """Queue the decay check of every guild the bot is in (a recurring job, once per LOOP_SLEEP_TIME)
+
+        Every guild gets its own job, delayed by its offset within the period, so the checks are spread out without
+        holding a worker, and a reload doesn't restart the spread."""
+        if self.indexes_loaded is None or time.time() - self.indexes_loaded >= self.INDEX_FRESH:  # Not just loaded.
+            await self.load_indexes()
+        await self.jobs.enqueue("archive", dedupe_key="archive")  # Never runs twice at once, as the key is shared.
+        # The guilds are spread over the period, so that the last one can use its full budget before the next run.
+        spread = self.LOOP_SLEEP_TIME - self.sweeper.BUDGET - self.sweeper.HARD_STOP_GRACE
+        for guild_id, delay in self.sweeper.plan((gld.id for gld in self.bot.guilds), spread).items():
+            # Deduplicated, so a guild whose check of the previous period is still queued isn't queued twice.
+            await self.jobs.enqueue("guild_check", {"guild_id": guild_id}, dedupe_key="guild_check:{}".format(guild_id),
+                                    delay=delay, max_attempts=1)
+        await self.store_unfinished()
+
+    async def guild_check(self, job: Job):
+        """Perform the decay check of one guild, within the budget of the sweeper"""
+        gld = self.bot.get_guild(job.payload["guild_id"])
+        if gld is None:  # Left the guild since the check was queued.
+            return
+        was_unfinished = gld.id in self.sweeper.unfinished
+        finished = await self.sweeper.run(gld)
+        if finished == was_unfinished:  # Changed, so the next period starts with the right guilds after a reload.
+            await self.store_unfinished()
+
+    async def store_unfinished(self):
+        await self.config.sweep_unfinished.set(sorted(self.sweeper.unfinished))
+
+    async def archive_job(self, job: Job):
+        """Archive the reputations older than the retention period, in the background as the first pass can be long"""
+        n = await self.archive_pass()
+        if n:
+            print("Reputation -> Archived {} reputation(s).".format(n))
+
+    async def cog_before_invoke(self, ctx: Context):
+        """Hold the commands until the database is upgraded"""
+        if not self.db_ready.is_set():
+            await ctx.send(self.DB_UPGRADING)
+            await self.db_ready.wait()
+
+    # Events
+    @commands.Cog.listener()
+    async def on_raw_reaction_add(self, payload: discord.RawReactionActionEvent):
+        """Route reactions to the open leaderboard menus"""
+        await self.menus.handle_reaction(payload)
 
     # Commands
     @commands.guild_only()  # Group not restricted to admins so that abstain can be used.
@@ -143,6 +275,11 @@ class Reputation(commands.Cog):
         # Decay threshold.
         decay_min = str(config_dict["decay_threshold"])
         embed.add_field(name="Decay threshold", value=decay_min if decay_min else self.OFF)
+        # Last periodic check.
+        sweep = self.sweeper.results.get(gld.id)
+        if sweep:
+            embed.add_field(name="Last periodic check", value=self.SWEEP_ROW.format(
+                duration=sweep.duration, started=int(sweep.started), left="" if sweep.finished else self.SWEEP_LEFT))
         # Send embed.
         await ctx.send(embed=embed)
 
@@ -287,6 +424,7 @@ class Reputation(commands.Cog):
         else:  # Set cooldown to time provided.
             await self.config.guild(gld).cooldown_period.set(delta_sec)
             msg = self.COOLDOWN_SET.format(str(delta))
+        await self.load_cooldowns()  # The window of the index follows the longest cooldown.
         await ctx.send(msg)
 
     @commands.guild_only()
@@ -336,9 +474,82 @@ class Reputation(commands.Cog):
     @checks.admin_or_permissions(administrator=True)
     async def manual_guild_check(self, ctx: Context):
         """Do a manual reputation eligibility check for all members on the server"""
-        add_n, del_n = await self.guild_role_check(ctx.guild)
+        add_n, del_n, _ = await self.guild_role_check(ctx.guild)
         await ctx.send(self.MANUAL_CHECK.format(add_n=add_n, s=self.plural_s(add_n), del_n=del_n))
 
+    @_reputation_settings.command(name="export")
+    @checks.is_owner()
+    async def export_reputations(self, ctx: Context, fmt: str = "ndjson"):
+        """Export all reputations (of every server) to a compressed file in the data folder of this cog
+
+        The format can be `ndjson` or `csv`. Reputations can still be given while the export runs."""
+        fmt = fmt.lower()
+        if fmt not in FORMATS:
+            await ctx.send(self.EXPORT_BAD_FORMAT.format(", ".join(FORMATS)))
+            return
+        prefix = dt.datetime.utcnow().strftime("%Y%m%d-%H%M%S-")
+        tables = ["reputations", "user_names", "rep_archive", "rep_archived_pairs"]
+        export = functools.partial(export_tables, self.PATH_DB, tables, self.FOLDER + "/exports", fmt, prefix)
+        async with ctx.typing():
+            results = await asyncio.get_event_loop().run_in_executor(None, export)
+        path, rows = results["reputations"]
+        names_path, _ = results["user_names"]
+        await ctx.send(self.EXPORT_DONE.format(rows=rows, s=self.plural_s(rows), path=path, names_path=names_path))
+
+    @_reputation_settings.command(name="retention")
+    @checks.is_owner()
+    async def set_retention(self, ctx: Context, months: int = None):
+        """Set after how many months reputations are archived (on all servers)
+
+        Archived reputations still count for roles and the all-time leaderboard, and can be looked up with \
+        `rephistory`. Reputations within the cooldown, decay and ring detection periods, and the last season, are \
+        always kept.
+        Use `0` to keep all reputations. Without a number, the current setting and the archive size are shown."""
+        if months is None:
+            current = await self.config.retention_months()
+            n, chunks, size, _ = await self.rep_db.archive_status()
+            policy = "{} month{}".format(current, self.plural_s(current)) if current else self.OFF
+            await ctx.send(self.RETENTION_STATUS.format(policy=policy, n=n, s=self.plural_s(n), chunks=chunks,
+                                                        cs=self.plural_s(chunks), size=size / 2 ** 20))
+        elif months <= 0:
+            await self.config.retention_months.clear()
+            await ctx.send(self.RETENTION_OFF)
+        else:
+            await self.config.retention_months.set(months)
+            await self.jobs.enqueue("archive", dedupe_key="archive")  # A first pass can take minutes on a big history.
+            await ctx.send(self.RETENTION_SET.format(months=months, s=self.plural_s(months),
+                                                     jobs=ctx.prefix + "repset jobs"))
+
+    @_reputation_settings.command(name="sweeps")
+    @checks.is_owner()
+    async def view_sweeps(self, ctx: Context):
+        """See the slowest periodic checks of the last period (on all servers)"""
+        results = sorted(self.sweeper.results.items(), key=lambda item: -item[1].duration)
+        if not results:
+            await ctx.send(self.SWEEP_NONE)
+            return
+        rows = []
+        for guild_id, sweep in results[:10]:
+            gld = self.bot.get_guild(guild_id)
+            rows.append("**{}**: ".format(discord.utils.escape_markdown(gld.name) if gld else guild_id) +
+                        self.SWEEP_ROW.format(duration=sweep.duration, started=int(sweep.started),
+                                              left="" if sweep.finished else self.SWEEP_LEFT))
+        embed = discord.Embed(title="Slowest periodic checks", colour=discord.Colour.lighter_grey())
+        embed.description = "\n".join(rows)
+        embed.set_footer(text="{} server{} checked".format(len(results), self.plural_s(len(results))))
+        await ctx.send(embed=embed)
+
+    @_reputation_settings.command(name="jobs")
+    @checks.is_owner()
+    async def view_jobs(self, ctx: Context, action: str = None):
+        """See the background jobs of this cog (on all servers)
+
+        Use `retry` to queue the failed jobs again, or `clear` to delete them."""
+        if action is not None:
+            await ctx.send(await self.jobs.run_action(action))
+            return
+        await ctx.send(embed=await self.jobs.summary_embed(discord.Colour.lighter_grey()))
+
     @commands.guild_only()
     @commands.command()
     async def rep(self, ctx: Context, user: discord.Member, *, comment: str = None):
@@ -358,10 +569,10 @@ class Reputation(commands.Cog):
             rep_channel = await self.config.guild(gld).reputation_channel()
             if rep_channel is None or rep_channel == channel.id:
                 rep_msg = None if not comment else comment  # Add message as NULL to db if empty string.
-                is_added = await self.rep_db.insert_rep(aut.id, str(aut), user.id, str(user),
-                                                        ctx.message.created_at, rep_msg, cooldown_secs)
+                is_added = await self.insert_rep(aut, user, ctx.message.created_at, rep_msg, cooldown_secs)
                 if is_added:
                     notice = None
+                    self.index_rep(gld, aut.id, user.id, ctx.message.created_at)
                     await self.user_role_check(ctx, member=user)
                     await ctx.tick()
                 else:
@@ -369,24 +580,19 @@ class Reputation(commands.Cog):
             else:
                 notice = self.BAD_CHANNEL
         if notice:  # Delete after some seconds as to not clog the channel.
-            await ctx.send(notice, delete_after=20)
-            await sleep(20)
-            try:  # Delete the original message at the same time.
-                await ctx.message.delete()
-            except discord.Forbidden:
-                print("rep -> I lack manage messages permissions!")
+            notice_msg = await ctx.send(notice)
+            # Delete the original message at the same time.
+            self.delete_scheduler.schedule(notice_msg, self.NOTICE_DELETE_DELAY)
+            self.delete_scheduler.schedule(ctx.message, self.NOTICE_DELETE_DELAY)
 
     @rep.error
     async def rep_error(self, ctx, error):
         """Ensure that input errors cause message deletions"""
         if isinstance(error, commands.BadArgument):
-            await ctx.send(self.REP_BAD_INPUT, delete_after=30)
+            notice_msg = await ctx.send(self.REP_BAD_INPUT)
+            self.delete_scheduler.schedule(notice_msg, self.BAD_INPUT_DELETE_DELAY)
         # Delete the original message.
-        await sleep(20)
-        try:
-            await ctx.message.delete()
-        except discord.Forbidden:
-            print("rep_error -> I lack manage messages permissions!")
+        self.delete_scheduler.schedule(ctx.message, self.NOTICE_DELETE_DELAY)
 
     @commands.command(name="reps", aliases=["rep_count"])
     async def rep_count(self, ctx: Context, user: discord.Member = None):
@@ -395,58 +601,129 @@ class Reputation(commands.Cog):
             user = ctx.author
         embed = discord.Embed(title="User reputation count", colour=discord.Colour.purple())
 
-        count, distinct_count, dt_str = await self.rep_db.user_rep_count(user.id)
+        count, distinct_count, last_stamp = await self.rep_db.user_rep_count(user.id)
         if count:
             cs, dcs = self.plural_s(count), self.plural_s(distinct_count)
             embed.description = self.COUNT_DESC.format(user.mention, count, cs, distinct_count, dcs)
-            embed.timestamp = dt.datetime.strptime(dt_str, self.TIME_FMT)
+            embed.timestamp = dt.datetime.fromtimestamp(last_stamp, dt.timezone.utc)
             embed.set_footer(text="User ID: {} | Last rep given".format(user.id))
         else:
             embed.description = self.COUNT_NO_REPS.format(user.mention)
         await ctx.send(embed=embed)
 
     @commands.command(name="leaderboard", aliases=["lboard"])
-    async def rep_leaderboard(self, ctx: Context):
+    async def rep_leaderboard(self, ctx: Context, period: str = None):
         """See the reputation leaderboard
 
+        By default, all reputations are counted. To only count recent ones, give a period:
+        `week`, `month`, `season`, `decay` (the decay period of this server), or an amount of days.
         Ties are broken based on who received a reputation the most recently."""
-        board_list = await self.rep_db.rep_leaderboard()
+        since, period_desc = None, None
+        if period is not None:
+            period = period.lower()
+            if period in self.LEADERBOARD_PERIODS:
+                days = self.LEADERBOARD_PERIODS[period]
+            elif period == "decay" and ctx.guild:
+                decay_secs = await self.config.guild(ctx.guild).decay_period()
+                days = decay_secs / (60 * 60 * 24) if decay_secs else None
+            elif period.isdigit() and int(period) > 0:
+                days = int(period)
+            else:
+                await ctx.send(self.LEADERBOARD_BAD_PERIOD)
+                return
+            if days is not None:  # No decay period means all-time.
+                since = ctx.message.created_at.replace(tzinfo=None) - dt.timedelta(days=days)
+                period_desc = "{:g} day{}".format(days, self.plural_s(days))
+                archived_until = (await self.rep_db.archive_status())[3]
+                if archived_until is not None and self.rep_db.to_stamp(since) <= archived_until:
+                    first_kept = dt.datetime.utcfromtimestamp(archived_until).date() + dt.timedelta(days=1)
+                    await ctx.send(self.LEADERBOARD_ARCHIVED.format(first_kept))
+                    return
+        board_list = await self.rep_db.rep_leaderboard(since)
         if board_list is None:
             await ctx.send(self.LEADERBOARD_NO_REPS)
         else:  # At least one rep given
             repped_count = len(board_list)
-            width = len(str(repped_count))
-            desc = self.LEADERBOARD_DESC.format(repped_count)
-            # Split the leaderboard into fields with at most 10 rows each.
-            field_list = []
-            for i in range((repped_count // 10) + 1):
-                start = 10 * i
-                end = start + 10 if repped_count > (start + 10) else repped_count
-
-                field_name = "{}-{}".format(start + 1, end)
-                field_value = "\n".join((self.LEADERBOARD_ROW.format((i + 1), width, f"<@{t[0]}>", t[1])
-                                         for i, t in enumerate(board_list[start:end], start=start)))
-                field_list.append((field_name, field_value))
-
-            field_count = len(field_list)
-            if field_count == 1:  # If only 1 field, send as 1 embed.
-                f_name = field_list[0][0]
-                f_value = field_list[0][1]
-                embed = discord.Embed(title="Reputation leaderboard", description=desc, colour=discord.Colour.purple())
-                embed.add_field(name=f_name, value=f_value)
-                footer = "1 of 1"
-                embed.set_footer(text=footer)
-                await ctx.send(embed=embed)
-            else:  # If more than one field, send as a pagified menu.
-                embed_list = []
-                for n, (f_name, f_value) in enumerate(field_list, start=1):
-                    embed = discord.Embed(title="Reputation leaderboard", colour=discord.Colour.purple())
-                    embed.description = desc
-                    embed.add_field(name=f_name, value=f_value)
-                    footer = "{n} of {total}.".format(n=n, total=field_count)
-                    embed.set_footer(text=footer)
-                    embed_list.append(embed)
-                await red_menu.menu(ctx, embed_list, red_menu.DEFAULT_CONTROLS, timeout=30.0)
+            # Split the leaderboard into pages with at most 10 rows each. Pages are rendered when they're viewed.
+            page_count = (repped_count + 9) // 10
+            if page_count == 1:  # If only 1 page, send as 1 embed.
+                await ctx.send(embed=self.leaderboard_page(board_list, 0, page_count, period_desc))
+            else:  # If more than one page, send as a pagified menu.
+                await self.menus.open(ctx, page_count,
+                                      lambda n: self.leaderboard_page(board_list, n, page_count, period_desc),
+                                      timeout=30.0)
+
+    @commands.guild_only()
+    @checks.mod_or_permissions(administrator=True)
+    @commands.command(name="repsearch", aliases=["rsearch"])
+    async def rep_search(self, ctx: Context, *, query: str):
+        """Search the reputation comments
+
+        All words must occur in a comment. End a word with `*` to also match longer words (e.g. `aerial*`).
+        Narrow the search down with the filters `to:<user>`, `from:<user>`, `after:YYYY-MM-DD` and `before:YYYY-MM-DD`.
+        Example: `repsearch rotations to:@coach after:2021-01-01`
+        Archived reputations are not searched, see `rephistory` for those."""
+        words, filters = [], {}
+        for token in query.split():
+            key, sep, value = token.partition(":")
+            if sep and value and key.lower() in self.SEARCH_FILTERS:
+                filters[key.lower()] = value
+            else:
+                words.append(token)
+        user_ids = {}
+        for key in ("to", "from"):
+            if key in filters:
+                user_ids[key] = self.parse_user_id(ctx.guild, filters[key])
+                if user_ids[key] is None:
+                    await ctx.send(self.SEARCH_BAD_USER.format(filters[key]))
+                    return
+        dates = {}
+        for key in ("after", "before"):
+            if key in filters:
+                try:
+                    dates[key] = dt.datetime.strptime(filters[key], "%Y-%m-%d")
+                except ValueError:
+                    await ctx.send(self.SEARCH_BAD_DATE.format(filters[key]))
+                    return
+        text = " ".join(words)
+        if self.rep_db.match_expression(text) is None:
+            await ctx.send(self.SEARCH_NO_WORDS)
+            return
+        results = await self.rep_db.search_reps(text, user_ids.get("to"), user_ids.get("from"), dates.get("after"),
+                                                dates.get("before"))
+        if not results:
+            await ctx.send(self.SEARCH_NO_RESULTS)
+            return
+        page_count = (len(results) + self.SEARCH_PAGE_SIZE - 1) // self.SEARCH_PAGE_SIZE
+        if page_count == 1:
+            await ctx.send(embed=self.search_page(query, results, 0, page_count))
+        else:
+            await self.menus.open(ctx, page_count, lambda n: self.search_page(query, results, n, page_count),
+                                  timeout=60.0)
+
+    @commands.guild_only()
+    @checks.mod_or_permissions(administrator=True)
+    @commands.command(name="rephistory", aliases=["rhistory"])
+    async def rep_history(self, ctx: Context, user: str):
+        """See the archived reputations that a user received
+
+        The user can be a mention, a user ID or a username. Newest reputations first."""
+        user_id = self.parse_user_id(ctx.guild, user)
+        if user_id is None:
+            await ctx.send(self.SEARCH_BAD_USER.format(user))
+            return
+        async with ctx.typing():
+            lookup = functools.partial(self.rep_db.archived_reps, to_id=user_id)
+            results = await asyncio.get_event_loop().run_in_executor(None, lookup)
+        if not results:
+            await ctx.send(self.HISTORY_NO_REPS)
+            return
+        page_count = (len(results) + self.HISTORY_PAGE_SIZE - 1) // self.HISTORY_PAGE_SIZE
+        if page_count == 1:
+            await ctx.send(embed=self.history_page(user_id, results, 0, page_count))
+        else:
+            await self.menus.open(ctx, page_count, lambda n: self.history_page(user_id, results, n, page_count),
+                                  timeout=60.0)
 
     # Utilities
     async def red_delete_data_for_user(
@@ -460,6 +737,66 @@ class Reputation(commands.Cog):
         This does not take care of any rank roles that the user may have."""
         await self.bot.send_to_owners(self.DEL_REQUEST.format(user_id, requester))
 
+    def leaderboard_page(self, board_list: List[Tuple[int, int]], page: int, page_count: int,
+                         period: str = None) -> discord.Embed:
+        """
+        :param board_list: The full leaderboard, as returned by rep_leaderboard.
+        :param page: The (zero-based) index of the page to render.
+        :param page_count: The total amount of pages.
+        :param period: (Optional) Description of the period the leaderboard covers, if it's not all-time.
+        :return: The embed of that leaderboard page.
+        """
+        repped_count = len(board_list)
+        width = len(str(repped_count))
+        start = 10 * page
+        end = min(start + 10, repped_count)
+        field_name = "{}-{}".format(start + 1, end)
+        field_value = "\n".join((self.LEADERBOARD_ROW.format((i + 1), width, f"<@{t[0]}>", t[1])
+                                 for i, t in enumerate(board_list[start:end], start=start)))
+        title = "Reputation leaderboard" if period is None else "Reputation leaderboard (last {})".format(period)
+        embed = discord.Embed(title=title, colour=discord.Colour.purple())
+        embed.description = self.LEADERBOARD_DESC.format(repped_count)
+        embed.add_field(name=field_name, value=field_value)
+        embed.set_footer(text="{n} of {total}".format(n=page + 1, total=page_count))
+        return embed
+
+    def search_page(self, query: str, results: List[Tuple[int, int, str, str]], page: int,
+                    page_count: int) -> discord.Embed:
+        """
+        :param query: The search, as given by the user.
+        :param results: The search results, as returned by search_reps.
+        :param page: The (zero-based) index of the page to render.
+        :param page_count: The total amount of pages.
+        :return: The embed of that page of search results.
+        """
+        start = self.SEARCH_PAGE_SIZE * page
+        rows = (self.SEARCH_ROW.format(date=dt.datetime.utcfromtimestamp(stamp).date(), from_id=from_id, to_id=to_id,
+                                       snippet=snippet)
+                for from_id, to_id, stamp, snippet in results[start:start + self.SEARCH_PAGE_SIZE])
+        embed = discord.Embed(title="Reputation search", colour=discord.Colour.purple())
+        description = self.SEARCH_DESC.format(discord.utils.escape_markdown(query[:100]))
+        embed.description = description + "\n\n" + "\n\n".join(rows)
+        embed.set_footer(text="{n} of {total} | Best matches first".format(n=page + 1, total=page_count))
+        return embed
+
+    def history_page(self, user_id: int, results: List[Tuple[int, int, int, int, str]], page: int,
+                     page_count: int) -> discord.Embed:
+        """
+        :param user_id: The userID of the user whose archived reputations are shown.
+        :param results: The archived reputations, as returned by archived_reps.
+        :param page: The (zero-based) index of the page to render.
+        :param page_count: The total amount of pages.
+        :return: The embed of that page of archived reputations.
+        """
+        start = self.HISTORY_PAGE_SIZE * page
+        rows = (self.HISTORY_ROW.format(date=dt.datetime.utcfromtimestamp(stamp).date(), from_id=from_id,
+                                        message=discord.utils.escape_markdown(message) if message else "-")
+                for _, from_id, _, stamp, message in results[start:start + self.HISTORY_PAGE_SIZE])
+        embed = discord.Embed(title="Reputation history", colour=discord.Colour.purple())
+        embed.description = self.HISTORY_DESC.format(user_id, len(results)) + "\n\n" + "\n".join(rows)
+        embed.set_footer(text="{n} of {total} | Newest first".format(n=page + 1, total=page_count))
+        return embed
+
     async def user_role_check(self, ctx: Context, member: discord.Member = None) -> None:
         """
         :param ctx: The Context object of the message that requests the check
@@ -540,11 +877,16 @@ class Reputation(commands.Cog):
                     await log_channel.send(log_message.format(user=member.mention))
         return to_return
 
-    async def guild_role_check(self, gld: discord.Guild) -> Tuple[int, int]:
+    async def guild_role_check(self, gld: discord.Guild, deadline: float = None) -> Tuple[int, int, int]:
         """
+        :param gld: The guild to check.
+        :param deadline: (Optional) The event loop time after which no more roles are edited.
+        :return: The amount of members that received the role, that lost it, and that are left (past the deadline).
+
         Check which users on a guild should or shouldn't have the rep role
 
-        Roles will be edited accordingly.
+        Roles will be edited accordingly. Members that are left are picked up by the next check, as they still
+        differ from the database then.
         """
         rep_role = await self.get_reputation_role_obj(gld)
         if rep_role:
@@ -558,14 +900,144 @@ class Reputation(commands.Cog):
             give_tup: Tuple[discord.Member, ...] = tuple(m for m in gld.members if m.id in give_set)
             take_tup: Tuple[discord.Member, ...] = tuple(m for m in current_list if m.id not in eligible_set)
 
-            remove_count = len(take_tup)
-            add_count = 0  # Accumulator.
-            for member in give_tup:
+            loop = asyncio.get_event_loop()
+            add_count, remove_count = 0, 0  # Accumulators.
+            for n, member in enumerate(give_tup):
+                if deadline is not None and loop.time() > deadline:
+                    return add_count, remove_count, len(give_tup) - n + len(take_tup)
                 is_given = await self.give_reputation_role(member, rep_role, gld, gld_config, reason=self.GLD_ADD)
                 add_count += bool(is_given)
-            for member in take_tup:
+            for n, member in enumerate(take_tup):
+                if deadline is not None and loop.time() > deadline:
+                    return add_count, remove_count, len(take_tup) - n
                 await member.remove_roles(rep_role, reason=self.GLD_ADD)
-            return add_count, remove_count
+                remove_count += 1
+            return add_count, remove_count, 0
+        return 0, 0, 0
+
+    async def sweep_guild(self, gld: discord.Guild, deadline: float) -> bool:
+        """The periodic check of a guild, as run by the sweeper. Returns False if members were left"""
+        _, _, left = await self.guild_role_check(gld, deadline)
+        return not left
+
+    async def insert_rep(self, giver: discord.Member, receiver: discord.Member, created_at: dt.datetime,
+                         rep_msg: Optional[str], cooldown: Optional[int]) -> bool:
+        """
+        :return: Whether the rep was inserted, i.e. the pair was not on cooldown.
+
+        Check the cooldown in the index (or in the database if the index can't tell), and insert the rep
+        The rep is recorded in the index before the insert, so that a second rep of the same pair that arrives
+        meanwhile is already on cooldown."""
+        stamp = self.rep_db.to_stamp(created_at)
+        allowed = self.cooldowns.check(giver.id, receiver.id, stamp, cooldown) if cooldown else True
+        if allowed is False:
+            return False
+        previous = self.cooldowns.record(giver.id, receiver.id, stamp)
+        is_added = False
+        try:
+            is_added = await self.rep_db.insert_rep(giver.id, str(giver), receiver.id, str(receiver), created_at,
+                                                    rep_msg, cooldown if allowed is None else None)
+        finally:
+            if not is_added:
+                self.cooldowns.discard(giver.id, receiver.id, stamp, previous)
+        return is_added
+
+    async def load_indexes(self) -> None:
+        """(Re)load the cooldown and ring indexes. Also picks up changed cooldowns, and reps added outside of the cog"""
+        await self.load_cooldowns()
+        await self.ring_full_pass()
+        self.indexes_loaded = time.time()
+
+    async def load_cooldowns(self) -> int:
+        """
+        :return: The amount of (giver, receiver) pairs in the index.
+
+        (Re)load the cooldown index from the database, for the longest cooldown of all guilds"""
+        cooldowns = [self.DEFAULT_COOLDOWN]
+        for gld_config in (await self.config.all_guilds()).values():
+            cooldowns.append(gld_config.get("cooldown_period") or 0)
+        since = dt.datetime.utcnow() - dt.timedelta(seconds=max(cooldowns))
+        rows = await self.rep_db.reps_since(since)
+        self.cooldowns.load(rows, self.rep_db.to_stamp(since), max(cooldowns))
+        return len(self.cooldowns)
+
+    def index_rep(self, gld: discord.Guild, from_id: int, to_id: int, created_at: dt.datetime) -> None:
+        """Add a rep to the ring index. Rings it completes are reported in the background"""
+        stamp = self.rep_db.to_stamp(created_at)
+        if self.rings_pending is not None:  # A full pass is reading the database, so replay this rep afterwards.
+            self.rings_pending.append((from_id, to_id, stamp))
+        suspects = self.rings.add(from_id, to_id, stamp)
+        if suspects:
+            asyncio.ensure_future(self.report_new_rings(gld, suspects, stamp))
+
+    async def ring_full_pass(self) -> int:
+        """
+        :return: The amount of rings that were reported.
+
+        Rebuild the ring index from the database, and report the rings in it that were not reported yet (also not
+        before a restart, as reports are stored)"""
+        now = dt.datetime.utcnow()
+        start = now - dt.timedelta(seconds=self.rings.WINDOW)
+        self.rings.load_reported(await self.rep_db.ring_reports(self.rep_db.to_stamp(start)))
+        self.rings_pending = []
+        try:
+            rows = await self.rep_db.reps_since(start)
+            reps = set(rows)
+            reps.update(self.rings_pending)  # A rep can be in both, hence the set.
+        finally:
+            self.rings_pending = None
+        suspects = self.rings.rebuild(reps, self.rep_db.to_stamp(now))
+        if suspects:  # Stored before they're sent, so that an interrupted pass doesn't send them twice.
+            await self.rep_db.insert_ring_reports([s.members for s in suspects], self.rep_db.to_stamp(now))
+        reported = 0
+        for gld in self.bot.guilds:
+            in_guild = [s for s in suspects if all(gld.get_member(user_id) for user_id in s.members)]
+            if in_guild:
+                reported += await self.report_rings(gld, in_guild)
+        return reported
+
+    async def archive_pass(self) -> int:
+        """
+        :return: The amount of reputations that were archived.
+
+        Archive the reputations older than the retention period, if one is set"""
+        months = await self.config.retention_months()
+        if not months:
+            return 0
+        # Keep every rep that a cooldown, decay check, ring check or named leaderboard period can still look at.
+        keep = [months * self.RETENTION_MONTH, self.rings.WINDOW, self.DEFAULT_COOLDOWN, self.DEFAULT_DECAY,
+                max(self.LEADERBOARD_PERIODS.values()) * 60 * 60 * 24]
+        for gld_config in (await self.config.all_guilds()).values():
+            keep.extend(gld_config.get(key) or 0 for key in ("cooldown_period", "decay_period"))
+        start = dt.datetime.utcnow() - dt.timedelta(seconds=max(keep))
+        cutoff = dt.datetime.combine(start.date(), dt.time())  # Whole days, so that kept days have all their rows.
+        return await asyncio.get_event_loop().run_in_executor(None, self.rep_db.archive_before, cutoff)
+
+    async def report_new_rings(self, gld: discord.Guild, suspects: List[Suspect], stamp: float) -> int:
+        """Store rings that a rep completed as reported, so that they aren't reported again after a reload, and
+        report them. Returns the amount of rings sent"""
+        try:
+            await self.rep_db.insert_ring_reports([s.members for s in suspects], stamp)
+        except sqlite3.Error as e:  # Still report them: a second report beats none.
+            print("Reputation -> Could not store a reputation ring report: {!r}".format(e))
+        return await self.report_rings(gld, suspects)
+
+    async def report_rings(self, gld: discord.Guild, suspects: List[Suspect]) -> int:
+        """Send the rings to the log channel of a guild, if it has one. Returns the amount of rings sent"""
+        try:
+            log_channel_id = await self.config.guild(gld).log_channel()
+            log_channel = discord.utils.get(gld.channels, id=log_channel_id) if log_channel_id else None
+            if log_channel is None:
+                return 0
+            days = self.rings.WINDOW // (60 * 60 * 24)
+            for suspect in suspects:
+                members = ", ".join("<@{}>".format(user_id) for user_id in sorted(suspect.members))
+                await log_channel.send(self.RING_REPORT.format(members=members, reps=suspect.reps,
+                                                               s=self.plural_s(suspect.reps), days=days))
+            return len(suspects)
+        except discord.HTTPException as e:  # Reports are a side effect, so they must not break the caller.
+            print("Reputation -> Could not report a reputation ring: {!r}".format(e))
+            return 0
 
     async def get_reputation_role_obj(self, guild: discord.Guild) -> Optional[discord.Role]:
         """Get the reputation role object if a role ID is set, None otherwise
@@ -589,6 +1061,15 @@ class Reputation(commands.Cog):
             assert rep_role, "The shadow role ID is configured, but the role does not exist!"
         return rep_role
 
+    @staticmethod
+    def parse_user_id(guild: discord.Guild, value: str) -> Optional[int]:
+        """Get the user ID from a mention, an ID or the name of a member. Mentions and IDs need not be members"""
+        id_match = re.fullmatch(r"<@!?(\d{15,21})>|(\d{15,21})", value)
+        if id_match:
+            return int(id_match.group(1) or id_match.group(2))
+        member = guild.get_member_named(value)
+        return member.id if member else None
+
     @staticmethod
     def plural_s(n: int) -> str:
         """Returns an 's' if n is not 1, otherwise returns an empty string"""
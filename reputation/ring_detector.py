@@ -0,0 +1,183 @@
+# Default library.
+import bisect
+import collections
+from typing import Deque, Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+
+class Suspect(NamedTuple):
+    members: FrozenSet[int]  # User IDs.
+    reps: int  # Reputations given among the members within the window.
+    density: float  # Fraction of the ordered member pairs (giver, receiver) with at least one rep.
+
+
+class RingDetector:
+    """An in-memory index of who gave reputation to whom within a sliding window, to find reputation rings
+
+    Every rep adds an edge giver -> receiver. After each rep, only the neighbourhood of its two users is checked:
+    - a reciprocal pair: both users gave each other at least PAIR_MIN_REPS reps;
+    - a dense group: at least CLIQUE_MIN_SIZE users that (nearly) all gave each other reps.
+    A group is only reported once per window. Times are POSIX timestamps, so the caller decides on the clock."""
+    WINDOW = 60 * 60 * 24 * 30  # Seconds that a rep counts towards a ring.
+    PAIR_MIN_REPS = 2  # Reps that both users of a pair must have given each other.
+    CLIQUE_MIN_SIZE = 3
+    CLIQUE_MIN_DENSITY = 0.8
+    MAX_CANDIDATES = 40  # Neighbours considered when growing a group, to bound the cost per rep.
+
+    def __init__(self):
+        self._edges: Dict[Tuple[int, int], Deque[float]] = {}  # (giver, receiver) -> stamps, oldest first.
+        self._out: Dict[int, Set[int]] = collections.defaultdict(set)
+        self._in: Dict[int, Set[int]] = collections.defaultdict(set)
+        self._events: Deque[Tuple[float, int, int]] = collections.deque()  # (stamp, giver, receiver), by stamp.
+        self._reported: Dict[FrozenSet[int], float] = {}  # Members -> stamp of the report.
+        # (stamp, sorted members) per report, by stamp, so expired reports are found without a scan.
+        self._report_order: Deque[Tuple[float, Tuple[int, ...]]] = collections.deque()
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+    def add(self, from_id: int, to_id: int, stamp: float) -> List[Suspect]:
+        """
+        :param from_id: UserID of the user that gave the rep.
+        :param to_id: UserID of the user that received the rep.
+        :param stamp: The POSIX timestamp of the rep.
+        :return: The rings that this rep completes, and that were not reported within the window yet.
+        """
+        self._insert(from_id, to_id, stamp)
+        self.expire(stamp - self.WINDOW)
+        return [s for s in self._check(from_id, to_id) if self._mark_reported(s, stamp)]
+
+    def rebuild(self, reps: Iterable[Tuple[int, int, float]], now: float) -> List[Suspect]:
+        """
+        :param reps: (giver, receiver, timestamp) of the reps within the window, in any order.
+        :param now: The current POSIX timestamp.
+        :return: All rings in the window that were not reported within the window yet.
+
+        Replace the index with the given reps, and check every edge (the periodic full pass)"""
+        self._edges.clear()
+        self._out.clear()
+        self._in.clear()
+        self._events.clear()
+        for from_id, to_id, stamp in sorted(reps, key=lambda r: r[2]):
+            self._insert(from_id, to_id, stamp)
+        self.expire(now - self.WINDOW)
+        found: Dict[FrozenSet[int], Suspect] = {}
+        for from_id, to_id in list(self._edges):
+            for suspect in self._check(from_id, to_id):
+                found.setdefault(suspect.members, suspect)
+        # Report the largest groups first, so that a pair inside a reported group isn't reported separately.
+        ordered = sorted(found.values(), key=lambda s: -len(s.members))
+        return [s for s in ordered if self._mark_reported(s, now)]
+
+    def load_reported(self, reports: Iterable[Tuple[FrozenSet[int], float]]) -> None:
+        """Add (members, stamp) of groups that were reported before, e.g. before a restart, so they aren't again"""
+        for members, stamp in reports:
+            if stamp > self._reported.get(members, float("-inf")):
+                self._remember(members, stamp)
+
+    def expire(self, before: float) -> None:
+        """Forget the reps older than a timestamp, and the reports older than the window"""
+        while self._events and self._events[0][0] < before:
+            _, from_id, to_id = self._events.popleft()
+            stamps = self._edges[(from_id, to_id)]
+            stamps.popleft()
+            if not stamps:
+                del self._edges[(from_id, to_id)]
+                self._discard(self._out, from_id, to_id)
+                self._discard(self._in, to_id, from_id)
+        while self._report_order and self._report_order[0][0] < before:
+            stamp, members = self._report_order.popleft()
+            members = frozenset(members)
+            if self._reported.get(members) == stamp:  # Else it was reported again (with a later stamp) since.
+                del self._reported[members]
+
+    # Utilities.
+    def _insert(self, from_id: int, to_id: int, stamp: float) -> None:
+        stamps = self._edges.get((from_id, to_id))
+        if stamps is None:
+            stamps = self._edges[(from_id, to_id)] = collections.deque()
+            self._out[from_id].add(to_id)
+            self._in[to_id].add(from_id)
+        if stamps and stamp < stamps[-1]:  # Out of order (reps are indexed after their insert): keep both sorted.
+            bisect.insort(stamps, stamp)
+        else:
+            stamps.append(stamp)
+        if self._events and stamp < self._events[-1][0]:
+            bisect.insort(self._events, (stamp, from_id, to_id))
+        else:
+            self._events.append((stamp, from_id, to_id))
+
+    def _remember(self, members: FrozenSet[int], stamp: float) -> None:
+        self._reported[members] = stamp
+        report = (stamp, tuple(sorted(members)))
+        if self._report_order and stamp < self._report_order[-1][0]:
+            bisect.insort(self._report_order, report)
+        else:
+            self._report_order.append(report)
+
+    @staticmethod
+    def _discard(index: Dict[int, Set[int]], key: int, value: int) -> None:
+        values = index.get(key)
+        if values is not None:
+            values.discard(value)
+            if not values:
+                del index[key]
+
+    def _count(self, from_id: int, to_id: int) -> int:
+        stamps = self._edges.get((from_id, to_id))
+        return len(stamps) if stamps else 0
+
+    def _mutual(self, user_id: int) -> Set[int]:
+        """The users that both gave reps to and received reps from a user"""
+        given, received = self._out.get(user_id), self._in.get(user_id)
+        return given & received if given and received else set()
+
+    def _linked(self, x: int, y: int) -> bool:
+        return y in self._out.get(x, ()) or y in self._in.get(x, ())
+
+    def _check(self, a: int, b: int) -> List[Suspect]:
+        """Find the rings that contain the edge between a and b"""
+        suspects = []
+        ab, ba = self._count(a, b), self._count(b, a)
+        if ab >= self.PAIR_MIN_REPS and ba >= self.PAIR_MIN_REPS:
+            suspects.append(Suspect(frozenset((a, b)), ab + ba, 1.0))
+        group = self._grow_group(a, b)
+        if group is not None:
+            suspects.append(group)
+        return suspects
+
+    def _grow_group(self, a: int, b: int) -> Optional[Suspect]:
+        """Greedily add the neighbours of a and b that are most connected to the group, while it stays dense"""
+        group = [a, b]
+        links = 1 + (self._count(b, a) > 0)  # Ordered pairs within the group with at least one rep.
+        # In a dense group, every member has reps in both directions with most others. So the candidates are the
+        # users that exchanged reps with a (or b), and have at least one rep with the other. These sets stay small
+        # for users that only receive, like popular coaches, which keeps this cheap on the hot path.
+        neighbours = {n for x, y in ((a, b), (b, a)) for n in self._mutual(x) if self._linked(n, y)}
+        neighbours.difference_update(group)
+        if len(neighbours) > self.MAX_CANDIDATES:  # Keep the neighbours with the strongest ties to the pair.
+            neighbours = set(sorted(neighbours, key=lambda n: -sum(self._count(n, m) + self._count(m, n)
+                                                                    for m in group))[:self.MAX_CANDIDATES])
+        while neighbours:
+            best, best_links = None, -1
+            for candidate in neighbours:
+                candidate_links = sum((self._count(candidate, m) > 0) + (self._count(m, candidate) > 0)
+                                      for m in group)
+                if candidate_links > best_links:
+                    best, best_links = candidate, candidate_links
+            size = len(group) + 1
+            if (links + best_links) / (size * (size - 1)) < self.CLIQUE_MIN_DENSITY:
+                break
+            group.append(best)
+            links += best_links
+            neighbours.discard(best)
+        if len(group) < self.CLIQUE_MIN_SIZE:
+            return None
+        reps = sum(self._count(x, y) for x in group for y in group if x != y)
+        return Suspect(frozenset(group), reps, links / (len(group) * (len(group) - 1)))
+
+    def _mark_reported(self, suspect: Suspect, stamp: float) -> bool:
+        """Remember a report. Returns False if this group (or a group containing it) was reported already"""
+        if any(suspect.members <= members for members in self._reported):
+            return False
+        self._remember(suspect.members, stamp)
+        return True
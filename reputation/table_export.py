@@ -0,0 +1,82 @@
+# Default library.
+import csv
+import gzip
+import json
+import sqlite3
+from pathlib import Path
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+FORMATS = ("ndjson", "csv")
+CHUNK_SIZE = 5000  # Rows fetched from the cursor (and written) at a time.
+COMPRESS_LEVEL = 6  # The gzip default (9) is several times slower, for a few percent smaller files.
+
+
+def enable_wal(db_path: str) -> None:
+    """Switch a database to write-ahead logging, so that long reads (like exports) don't block writers
+
+    The journal mode is stored in the database file, so this only has to succeed once."""
+    connection = sqlite3.connect(db_path)
+    try:
+        connection.execute("PRAGMA journal_mode = WAL;")
+    except sqlite3.OperationalError:  # Another connection is busy. Retried on the next start.
+        pass
+    connection.close()
+
+
+def _chunks(cursor: sqlite3.Cursor, chunk_size: int) -> Iterator[List[tuple]]:
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            return
+        yield rows
+
+
+def _jsonable(value):
+    return value.hex() if isinstance(value, bytes) else value
+
+
+def export_tables(db_path: str, tables: Sequence[str], out_dir: str, fmt: str = "ndjson", prefix: str = "",
+                  chunk_size: int = CHUNK_SIZE) -> Dict[str, Tuple[Path, int]]:
+    """
+    :param db_path: The SQLite database to export from.
+    :param tables: The tables to export.
+    :param out_dir: The directory to write the files to. It is created if needed.
+    :param fmt: "ndjson" (one JSON object per row) or "csv" (with a header row). Blobs are written as hex.
+    :param prefix: (Optional) Prefix for the file names, e.g. a timestamp.
+    :param chunk_size: Rows per fetch from the cursor.
+    :return: Table -> (path of the gzip-compressed file, amount of rows).
+
+    All tables are read in one read transaction, so together they form a consistent snapshot. In WAL mode, that
+    transaction does not block writers. Rows are streamed from the cursor in chunks, so memory use does not depend
+    on the table size. This is blocking, so run it in an executor from the event loop.
+    """
+    if fmt not in FORMATS:
+        raise ValueError("Unknown export format: {}".format(fmt))
+    out_path = Path(out_dir)
+    out_path.mkdir(parents=True, exist_ok=True)
+    connection = sqlite3.connect(db_path, isolation_level=None)  # Transactions are handled below.
+    results = {}
+    try:
+        connection.execute("PRAGMA query_only = ON;")
+        connection.execute("BEGIN;")  # The snapshot starts at the first read, and lasts until the end.
+        for table in tables:
+            cursor = connection.execute("SELECT * FROM `{}`;".format(table.replace("`", "")))
+            columns = [d[0] for d in cursor.description]
+            file_path = out_path / "{}{}.{}.gz".format(prefix, table, fmt)
+            row_count = 0
+            with gzip.open(file_path, "wt", compresslevel=COMPRESS_LEVEL, encoding="utf-8", newline="") as file:
+                writer = csv.writer(file) if fmt == "csv" else None
+                if writer:
+                    writer.writerow(columns)
+                for rows in _chunks(cursor, chunk_size):
+                    if writer:
+                        writer.writerows([[_jsonable(v) for v in row] for row in rows])
+                    else:
+                        file.write("".join(json.dumps(dict(zip(columns, map(_jsonable, row)))) + "\n"
+                                           for row in rows))
+                    row_count += len(rows)
+            results[table] = (file_path, row_count)
+        connection.execute("COMMIT;")
+    finally:
+        connection.close()
+    return results
@@ -0,0 +1,307 @@
+# Default library.
+import asyncio
+import collections
+import json
+import sqlite3  # Only to make the db on init.
+import time
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Optional
+
+# Used by Red.
+import discord
+
+# Requirements.
+import aiosqlite
+
+
+class Job(NamedTuple):
+    job_id: int
+    kind: str
+    payload: dict
+    priority: int
+    attempts: int  # Including the current attempt.
+    max_attempts: int
+    every: Optional[float]  # Seconds between the starts of a recurring job, None for a one-off job.
+
+
+JobHandler = Callable[[Job], Awaitable[None]]
+
+
+class JobQueue:
+    """A persistent queue of background jobs, run by a small pool of workers
+
+    Jobs are rows in an SQLite database, so queued work survives reloads, restarts and crashes. A job that was running
+    when the bot stopped is queued again on the next start, so handlers must be safe to run twice (use checkpoint to
+    resume long jobs). Due jobs run by priority (highest first), then in the order they were queued. A failing job is
+    retried with an exponential backoff, and kept as failed after max_attempts, until it's retried or cleared.
+    A recurring job is queued again after every run, every seconds after its previous start.
+    A dedupe key allows only one queued or running job with that key, so a job can be queued on every load."""
+    CREATE_TABLE = "CREATE TABLE IF NOT EXISTS `jobs` (`job_id` INTEGER PRIMARY KEY, `kind` TEXT, `payload` TEXT, " \
+                   "`priority` INTEGER, `dedupe_key` TEXT, `state` TEXT, `attempts` INTEGER, " \
+                   "`max_attempts` INTEGER, `every` REAL, `run_after` REAL, `created` REAL, `updated` REAL, " \
+                   "`last_error` TEXT);"
+    CREATE_DEDUPE_INDEX = "CREATE UNIQUE INDEX IF NOT EXISTS jobs_dedupe ON jobs(dedupe_key) " \
+                          "WHERE state IN ('queued', 'running');"
+    CREATE_DUE_INDEX = "CREATE INDEX IF NOT EXISTS jobs_due ON jobs(state, priority, job_id);"
+    ENABLE_WAL = "PRAGMA journal_mode = WAL;"
+    REQUEUE_RUNNING = "UPDATE `jobs` SET state = 'queued' WHERE state = 'running';"
+    INSERT_JOB = "INSERT OR IGNORE INTO `jobs` (kind, payload, priority, dedupe_key, state, attempts, max_attempts, " \
+                 "every, run_after, created, updated) VALUES (?, ?, ?, ?, 'queued', 0, ?, ?, ?, ?, ?);"
+    SELECT_DUE = "SELECT job_id, kind, payload, priority, attempts, max_attempts, every FROM `jobs` " \
+                 "WHERE state = 'queued' AND run_after <= ? ORDER BY priority DESC, job_id LIMIT 1;"
+    SELECT_NEXT_DUE = "SELECT MIN(run_after) FROM `jobs` WHERE state = 'queued';"
+    CLAIM_JOB = "UPDATE `jobs` SET state = 'running', attempts = attempts + 1, updated = ? WHERE job_id = ?;"
+    DELETE_JOB = "DELETE FROM `jobs` WHERE job_id = ?;"
+    RESCHEDULE_JOB = "UPDATE `jobs` SET state = 'queued', attempts = ?, run_after = ?, updated = ?, last_error = ? " \
+                     "WHERE job_id = ?;"
+    FAIL_JOB = "UPDATE `jobs` SET state = 'failed', updated = ?, last_error = ? WHERE job_id = ?;"
+    UPDATE_PAYLOAD = "UPDATE `jobs` SET payload = ?, updated = ? WHERE job_id = ?;"
+    COUNT_STATES = "SELECT state, COUNT(*) FROM `jobs` GROUP BY state;"
+    SELECT_STATE = "SELECT job_id, kind, priority, attempts, max_attempts, run_after, updated, last_error " \
+                   "FROM `jobs` WHERE state = ? ORDER BY priority DESC, run_after, job_id LIMIT ?;"
+    RETRY_FAILED = "UPDATE `jobs` SET state = 'queued', attempts = 0, run_after = ?, updated = ? " \
+                   "WHERE state = 'failed' AND (dedupe_key IS NULL OR dedupe_key NOT IN " \
+                   "(SELECT dedupe_key FROM `jobs` WHERE state IN ('queued', 'running') AND dedupe_key IS NOT NULL));"
+    DELETE_FAILED = "DELETE FROM `jobs` WHERE state = 'failed';"
+    # Priorities.
+    INTERACTIVE = 10  # Started by a command, and someone waits for the result.
+    BACKGROUND = 0  # Maintenance.
+    WORKERS = 2  # Jobs that run at once.
+    MAX_ATTEMPTS = 3
+    RETRY_DELAY = 60  # Seconds before the first retry. Doubles with every attempt.
+    # The jobs command of a cog (see summary_embed and run_action).
+    SUMMARY_TITLE = "Background jobs"
+    SUMMARY_DESC = "Queued: **{queued}** • Running: **{running}** • Failed: **{failed}** • Done since load: **{done}**"
+    SUMMARY_ROW = "`#{job_id}` {kind} • attempt {attempts}/{max_attempts} • <t:{stamp}:R>{error}"
+    SUMMARY_STATES = ("running", "queued", "failed")
+    RETRIED = ":white_check_mark: Queued {n} failed job{s} again."
+    CLEARED = ":put_litter_in_its_place: Deleted {n} failed job{s}."
+    BAD_ACTION = ":x: Error: Unknown action. Use `retry` or `clear`, or nothing to see the jobs."
+    ERROR_DELAY = 30  # Seconds before the queue tries again after a database error (e.g. locked or a full disk).
+
+    def __init__(self, db_path: str, workers: int = WORKERS):
+        self.path = db_path
+        self.workers = workers
+        self.handlers: Dict[str, JobHandler] = {}
+        self.running: Dict[int, float] = {}  # Job ID -> POSIX timestamp of the start.
+        self.finished = collections.Counter()  # Kind -> jobs (or runs of recurring jobs) finished since the start.
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._tasks: Dict[int, asyncio.Task] = {}
+        self.init_table()
+
+    def init_table(self) -> None:
+        """Create the table if it doesn't exist, and queue the jobs that were running when the bot stopped again
+
+        Note: this method uses sqlite3 rather than aiosqlite"""
+        connection = sqlite3.connect(self.path)
+        cursor = connection.cursor()
+        for query in (self.CREATE_TABLE, self.CREATE_DEDUPE_INDEX, self.CREATE_DUE_INDEX, self.REQUEUE_RUNNING):
+            cursor.execute(query)
+        connection.commit()
+        cursor.execute(self.ENABLE_WAL)
+        connection.close()
+        return
+
+    def register(self, kind: str, handler: JobHandler) -> None:
+        """Set the coroutine function that runs the jobs of a kind"""
+        self.handlers[kind] = handler
+
+    def start(self) -> None:
+        """Start running jobs. Call this from the bot's event loop, after registering the handlers"""
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.ensure_future(self._dispatch())
+
+    def close(self) -> int:
+        """Stop running jobs. Returns the amount of jobs that were interrupted, which run again on the next start"""
+        if self._task is not None:
+            self._task.cancel()
+        interrupted = len(self._tasks)
+        for task in self._tasks.values():
+            task.cancel()
+        return interrupted
+
+    async def enqueue(self, kind: str, payload: dict = None, priority: int = BACKGROUND, dedupe_key: str = None,
+                      delay: float = 0.0, every: float = None, max_attempts: int = MAX_ATTEMPTS) -> Optional[int]:
+        """
+        :param kind: The kind of job, which decides the handler.
+        :param payload: The arguments of the job. Must be JSON serialisable, so dict keys become strings.
+        :param priority: Due jobs with a higher priority run first.
+        :param dedupe_key: (Optional) Don't queue the job if a job with this key is queued or running already.
+        :param delay: The amount of seconds before the job is due.
+        :param every: (Optional) Make the job recurring, with this many seconds between the starts of its runs.
+        :param max_attempts: The amount of times the job is tried before it's marked as failed.
+        :return: The ID of the job, or None if it was deduplicated.
+        """
+        now = time.time()
+        params = [kind, json.dumps(payload or {}), priority, dedupe_key, max_attempts, every, now + delay, now, now]
+        async with aiosqlite.connect(self.path) as db:
+            async with db.execute(self.INSERT_JOB, params) as cursor:
+                job_id = cursor.lastrowid if cursor.rowcount else None
+            await db.commit()
+        if job_id is not None and self._wakeup is not None:
+            self._wakeup.set()
+        return job_id
+
+    async def checkpoint(self, job: Job, payload: dict) -> None:
+        """Save the progress of a running job, so that it continues from there if it's interrupted"""
+        await self.exec_sql(self.UPDATE_PAYLOAD, [json.dumps(payload), time.time(), job.job_id], commit=True)
+
+    async def counts(self) -> Dict[str, int]:
+        """Get state -> the amount of jobs in that state (queued, running or failed)"""
+        return dict(await self.exec_sql(self.COUNT_STATES))
+
+    async def list_jobs(self, state: str, limit: int = 5) -> List[tuple]:
+        """Get (job_id, kind, priority, attempts, max_attempts, run_after, updated, last_error) of jobs in a state"""
+        return await self.exec_sql(self.SELECT_STATE, [state, limit])
+
+    async def retry_failed(self) -> int:
+        """Queue all failed jobs again, with fresh attempts. Returns the amount of jobs queued"""
+        now = time.time()
+        async with aiosqlite.connect(self.path) as db:
+            async with db.execute(self.RETRY_FAILED, [now, now]) as cursor:
+                retried = cursor.rowcount
+            await db.commit()
+        if retried and self._wakeup is not None:
+            self._wakeup.set()
+        return retried
+
+    async def clear_failed(self) -> int:
+        """Delete all failed jobs. Returns the amount of jobs deleted"""
+        async with aiosqlite.connect(self.path) as db:
+            async with db.execute(self.DELETE_FAILED) as cursor:
+                deleted = cursor.rowcount
+            await db.commit()
+        return deleted
+
+    async def summary_embed(self, colour: discord.Colour) -> discord.Embed:
+        """Get an embed with the amount of jobs per state, and the first jobs of every state"""
+        counts = await self.counts()
+        embed = discord.Embed(title=self.SUMMARY_TITLE, colour=colour)
+        embed.description = self.SUMMARY_DESC.format(queued=counts.get("queued", 0), running=counts.get("running", 0),
+                                                     failed=counts.get("failed", 0), done=sum(self.finished.values()))
+        for state in self.SUMMARY_STATES:
+            rows = []
+            for job_id, kind, _, attempts, max_attempts, run_after, updated, error in await self.list_jobs(state):
+                rows.append(self.SUMMARY_ROW.format(job_id=job_id, kind=kind, attempts=attempts,
+                                                    max_attempts=max_attempts,
+                                                    stamp=int(run_after if state == "queued" else updated),
+                                                    error="\n`{}`".format(error[:100]) if error else ""))
+            if rows:
+                embed.add_field(name=state.capitalize(), value="\n".join(rows), inline=False)
+        return embed
+
+    async def run_action(self, action: str) -> str:
+        """Retry or clear the failed jobs, for the action of a jobs command. Returns the message to send"""
+        if action.lower() == "retry":
+            n = await self.retry_failed()
+            return self.RETRIED.format(n=n, s="" if n == 1 else "s")
+        if action.lower() == "clear":
+            n = await self.clear_failed()
+            return self.CLEARED.format(n=n, s="" if n == 1 else "s")
+        return self.BAD_ACTION
+
+    # Utilities.
+    async def _dispatch(self) -> None:
+        """Claim due jobs one at a time while a worker is free, and sleep until the next job is due otherwise"""
+        slots = asyncio.Semaphore(self.workers)
+        while True:
+            await slots.acquire()
+            now = time.time()
+            try:
+                job = await self._claim_due(now)
+            except Exception as e:  # The dispatcher must keep running, or no job would run until the next load.
+                slots.release()
+                print("JobQueue -> Claiming a job failed, trying again in {} s: {!r}".format(self.ERROR_DELAY, e))
+                await asyncio.sleep(self.ERROR_DELAY)
+                continue
+            if job is not None:  # The slot is released when the job is done.
+                self.running[job.job_id] = now
+                self._tasks[job.job_id] = asyncio.ensure_future(self._run(job, now, slots))
+                continue
+            slots.release()
+            try:
+                next_due = (await self.exec_sql(self.SELECT_NEXT_DUE))[0][0]
+            except Exception as e:
+                print("JobQueue -> Finding the next due job failed, trying again in {} s: {!r}".format(
+                    self.ERROR_DELAY, e))
+                next_due = now + self.ERROR_DELAY
+            self._wakeup.clear()
+            try:  # Woken up early by enqueue, or by a job that was rescheduled.
+                await asyncio.wait_for(self._wakeup.wait(), None if next_due is None else max(0.0, next_due - now))
+            except asyncio.TimeoutError:
+                pass
+
+    async def _claim_due(self, now: float) -> Optional[Job]:
+        """Mark the first due job as running, and return it. Returns None if no job is due"""
+        rows = await self.exec_sql(self.SELECT_DUE, [now])
+        if not rows:
+            return None
+        job_id, kind, payload, priority, attempts, max_attempts, every = rows[0]
+        await self.exec_sql(self.CLAIM_JOB, [now, job_id], commit=True)
+        return Job(job_id, kind, json.loads(payload), priority, attempts + 1, max_attempts, every)
+
+    async def _run(self, job: Job, started: float, slots: asyncio.Semaphore) -> None:
+        """Run a job, and then delete, reschedule or fail it"""
+        try:
+            error = await self._call(job)
+            await self._finish(job, started, error)
+        finally:
+            del self.running[job.job_id]
+            del self._tasks[job.job_id]
+            slots.release()
+
+    async def _call(self, job: Job) -> Optional[str]:
+        """Run the handler of a job. Returns the error if it failed
+
+        A CancelledError (on unload) is passed on: the job stays running, and is queued again on the next start."""
+        try:
+            handler = self.handlers.get(job.kind)
+            if handler is None:
+                raise LookupError("No handler for jobs of kind {!r}".format(job.kind))
+            await handler(job)
+        except Exception as e:
+            print("JobQueue -> Job {} ({}) failed on attempt {} of {}: {!r}".format(
+                job.job_id, job.kind, job.attempts, job.max_attempts, e))
+            return repr(e)
+        self.finished[job.kind] += 1
+        return None
+
+    async def _finish(self, job: Job, started: float, error: Optional[str]) -> None:
+        """Delete, reschedule or fail a job after a run
+
+        Tried until the database accepts it, as the job stays running (and keeps its dedupe key) until then."""
+        while True:
+            try:
+                if error is not None:
+                    await self._after_failure(job, started, error)
+                elif job.every is None:
+                    await self.exec_sql(self.DELETE_JOB, [job.job_id], commit=True)
+                else:
+                    await self._reschedule(job, 0, max(time.time(), started + job.every), None)
+                return
+            except Exception as e:
+                print("JobQueue -> Updating job {} ({}) failed, trying again in {} s: {!r}".format(
+                    job.job_id, job.kind, self.ERROR_DELAY, e))
+                await asyncio.sleep(self.ERROR_DELAY)
+
+    async def _after_failure(self, job: Job, started: float, error: str) -> None:
+        if job.attempts < job.max_attempts:
+            await self._reschedule(job, job.attempts, time.time() + self.RETRY_DELAY * 2 ** (job.attempts - 1), error)
+        elif job.every is not None:  # Out of attempts, but a recurring job should keep its schedule.
+            await self._reschedule(job, 0, max(time.time(), started + job.every), error)
+        else:
+            await self.exec_sql(self.FAIL_JOB, [time.time(), error, job.job_id], commit=True)
+
+    async def _reschedule(self, job: Job, attempts: int, run_after: float, error: Optional[str]) -> None:
+        await self.exec_sql(self.RESCHEDULE_JOB, [attempts, run_after, time.time(), error, job.job_id], commit=True)
+        self._wakeup.set()
+
+    async def exec_sql(self, query, params=None, commit=False) -> list:
+        """Make an SQL query to the job database"""
+        async with aiosqlite.connect(self.path) as db:
+            async with db.execute(query, parameters=params) as cursor:
+                rows = await cursor.fetchall()
+            if commit:
+                await db.commit()
+        return rows
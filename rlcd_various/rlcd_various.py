@@ -1,15 +1,19 @@
 # Default Library.
 import asyncio
 from textwrap import shorten
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 # Used by Red.
 import discord
-from redbot.core import checks, Config
+from redbot.core import checks, Config, data_manager
 from redbot.core import commands
 from redbot.core.bot import Red
 from redbot.core.commands import Cog
 
+# Local files.
+from .job_queue import Job, JobQueue
+from .team_balance import Player, balance_teams, win_probability
+
 RLCD_GLD_ID = 317323644961554434
 
 
@@ -50,9 +54,22 @@ class RlcdVarious(Cog):
     TWITCH_ROLES_CLEARED = BIN + "Successfully cleared the Twitch roles configuration."
     TWITCH_NO_SUB = ERROR + "You are not subscribed to the Twitch channel!"
     TWITCH_NOT_CONFIGURED = ERROR + "The Twitch roles are not configured!"
+    BALANCE_NO_LAFUSEE = ERROR + "Team balancing uses the linked accounts of the LaFusee cog, which is not loaded."
+    BALANCE_TOO_FEW = ERROR + "At least 2 players are needed to make teams.\n" \
+                              "Mention the players, or let them react with {} to the latest lobby invite here."
 
     # Other constants.
     LOBBY_EMBED_TITLE = "Inhouses invite by {}."
+    LOBBY_JOIN_EMOTE = "🎮"
+    LOBBY_JOIN_FOOTER = "React with {} to join, so the teams can be balanced with the balance command."
+    BALANCE_PLAYLISTS = {1: 10, 2: 11, 3: 13}  # Team size -> ranked playlist. Other sizes use the best playlist.
+    BALANCE_PLAYLIST_NAMES = {10: "Duel", 11: "Doubles", 13: "Standard"}
+    BALANCE_DEFAULT_SIGMA = 25 / 3  # Uncertainty of players without a known rank (TrueSkill default).
+    BALANCE_FETCH_TIMEOUT = 10  # Seconds to wait for all ranks. Players whose rank isn't in by then count as unknown.
+    BALANCE_TIME_BUDGET = 0.25  # Seconds the search may take for large lobbies.
+    BALANCE_ROW = "{} • **{:0.0f}**"
+    BALANCE_ROW_UNKNOWN = "{} • *no rank, counted as {:0.0f}*"
+    BALANCE_FOOTER = "{team} win chance: {chance:0.0%} | {search}"
     LTC_SLEEP_TIME = 28 * 60  # 28 minutes.
     SUGGEST_EMOTES = "👍👎❌"
     REGION_ROLE_TAG = {"Africa": "AF", "Asia Central": "AS", "Europe": "EU", "North America": "NA",
@@ -71,24 +88,38 @@ class RlcdVarious(Cog):
         # TODO: Make role toggles for inhouses and meme (low-priority).
         self.config.register_guild(inhouses_channel_id=None, suggest_channel_id=None,
                                    ltc_role_id=None, twitch_role_id=None, hoist_twitch_id=None, feenix_mmr_counter=0)
-        self.ltc_loop = asyncio.ensure_future(self.check_ltc())
-
-    # Loops
-    async def check_ltc(self):
-        """Remove the LTC role from whoever has the role and is offline"""
+        self.lobby_invites: Dict[int, int] = {}  # Channel ID -> message ID of the latest lobby invite.
+        self.jobs = JobQueue(str(data_manager.cog_data_path(self)) + "/jobs.db")
+        self.jobs.register("ltc_check", self.check_ltc)
+        self.unloaded = False
+        self.startup = asyncio.ensure_future(self.start_jobs())
+
+    def cog_unload(self):
+        self.unloaded = True
+        self.startup.cancel()
+        self.jobs.close()
+
+    # Background jobs.
+    async def start_jobs(self):
+        """Start the background jobs once the bot is ready"""
         await self.bot.wait_until_ready()
-        while self == self.bot.get_cog(self.__class__.__name__):
-            gld: discord.Guild = self.bot.get_guild(RLCD_GLD_ID)
-            ltc_id = await self.config.guild(gld).ltc_role_id()
-            if ltc_id:  # Role ID is configured.
-                role_obj: discord.Role = discord.utils.get(gld.roles, id=ltc_id)
-                assert role_obj, "No role object!"
-                # Get all members with the LTC role.
-                ltc_members: List[discord.Member] = [m for m in gld.members if role_obj in m.roles]
-                for member in ltc_members:
-                    if member.status == discord.Status.offline:  # Only remove it when they're offline.
-                        await member.remove_roles(role_obj)
-            await asyncio.sleep(self.LTC_SLEEP_TIME)
+        # Recurring, so queueing it on every load is deduplicated, and its schedule carries over restarts.
+        await self.jobs.enqueue("ltc_check", every=self.LTC_SLEEP_TIME, dedupe_key="ltc_check")
+        if not self.unloaded:  # Else the queue of this instance would keep running next to that of the new one.
+            self.jobs.start()
+
+    async def check_ltc(self, job: Job):
+        """Remove the LTC role from whoever has the role and is offline (a recurring job, once per LTC_SLEEP_TIME)"""
+        gld: discord.Guild = self.bot.get_guild(RLCD_GLD_ID)
+        ltc_id = await self.config.guild(gld).ltc_role_id()
+        if ltc_id:  # Role ID is configured.
+            role_obj: discord.Role = discord.utils.get(gld.roles, id=ltc_id)
+            assert role_obj, "No role object!"
+            # Get all members with the LTC role.
+            ltc_members: List[discord.Member] = [m for m in gld.members if role_obj in m.roles]
+            for member in ltc_members:
+                if member.status == discord.Status.offline:  # Only remove it when they're offline.
+                    await member.remove_roles(role_obj)
 
     # Events
     @Cog.listener()
@@ -190,6 +221,17 @@ class RlcdVarious(Cog):
             await self.config.guild(ctx.guild).ltc_role_id.set(role.id)
             await ctx.tick()
 
+    @_rlcd_various_settings.command(name="jobs")
+    @checks.is_owner()
+    async def view_jobs(self, ctx: commands.Context, action: str = None):
+        """See the background jobs of this cog
+
+        Use `retry` to queue the failed jobs again, or `clear` to delete them."""
+        if action is not None:
+            await ctx.send(await self.jobs.run_action(action))
+            return
+        await ctx.send(embed=await self.jobs.summary_embed(discord.Colour.lighter_grey()))
+
     @_rlcd_various_settings.command(name="twitch")
     @commands.guild_only()
     @checks.admin_or_permissions(administrator=True)
@@ -229,7 +271,56 @@ class RlcdVarious(Cog):
             embed.add_field(name="Region", value=region_str)
             embed.add_field(name="Lobby name", value=lobby_name)
             embed.add_field(name="Password", value=password)
-            await ctx.send("New inhouses invite. @here", embed=embed, filter=None)
+            embed.set_footer(text=self.LOBBY_JOIN_FOOTER.format(self.LOBBY_JOIN_EMOTE))
+            invite = await ctx.send("New inhouses invite. @here", embed=embed, filter=None)
+            self.lobby_invites[chn.id] = invite.id
+            try:
+                await invite.add_reaction(self.LOBBY_JOIN_EMOTE)
+            except discord.HTTPException:
+                pass
+
+    @commands.guild_only()
+    @commands.command(name="balance", aliases=["teams"])
+    async def balance_lobby(self, ctx: commands.Context, *members: discord.Member):
+        """Split the players of an inhouses lobby into two balanced teams
+
+        If no players are mentioned, the members that reacted to the latest lobby invite in this channel play.
+        Ranks are taken from the accounts linked with the `rl link` command."""
+        lafusee = self.bot.get_cog("LaFusee")
+        if lafusee is None:
+            await ctx.send(self.BALANCE_NO_LAFUSEE)
+            return
+        players = list(dict.fromkeys(members)) or await self.lobby_participants(ctx.channel)
+        if len(players) < 2:
+            await ctx.send(self.BALANCE_TOO_FEW.format(self.LOBBY_JOIN_EMOTE))
+            return
+        async with ctx.typing():
+            playlist_id = self.BALANCE_PLAYLISTS.get(len(players) // 2)
+            skills = await self.fetch_linked_skills(lafusee, players)
+            ratings = {m.id: self.pick_rating(skills.get(m.id), playlist_id) for m in players}
+            known = [d["mu"] for d in ratings.values() if d is not None]
+            fill_mu = sum(known) / len(known) if known else 25.0  # Unknown players count as the lobby average.
+            player_list = [Player(m.id, ratings[m.id]["mu"], ratings[m.id]["sigma"] or self.BALANCE_DEFAULT_SIGMA)
+                           if ratings[m.id] is not None else Player(m.id, fill_mu, self.BALANCE_DEFAULT_SIGMA)
+                           for m in players]
+            # The search is CPU-bound (up to the time budget), so it runs outside the event loop.
+            split = await asyncio.get_event_loop().run_in_executor(None, balance_teams, player_list,
+                                                                   self.BALANCE_TIME_BUDGET)
+        embed = discord.Embed(colour=discord.Colour.purple(), title="Balanced teams")
+        embed.description = "Based on {} ratings.".format(self.BALANCE_PLAYLIST_NAMES.get(playlist_id, "best"))
+        for name, team in (("Blue", split.team_a), ("Orange", split.team_b)):
+            rows = []
+            for i in team:
+                member, player = players[i], player_list[i]
+                row_str = self.BALANCE_ROW if ratings[member.id] is not None else self.BALANCE_ROW_UNKNOWN
+                rows.append(row_str.format(member.mention, player.mu * 20 + 100))
+            average = sum(player_list[i].mu * 20 + 100 for i in team) / len(team)
+            embed.add_field(name="{} (avg. {:0.0f})".format(name, average), value="\n".join(rows))
+        search = "exact, {} splits".format(split.evaluated) if split.exact \
+            else "local search, {} splits".format(split.evaluated)
+        chance = win_probability(player_list, split.team_a, split.team_b)
+        embed.set_footer(text=self.BALANCE_FOOTER.format(team="Blue", chance=chance, search=search))
+        await ctx.send(embed=embed)
 
     @is_in_rlcd()
     @commands.guild_only()
@@ -348,5 +439,47 @@ class RlcdVarious(Cog):
             await ctx.send(notice)
 
     # Utilities
+    async def lobby_participants(self, channel: discord.TextChannel) -> List[discord.Member]:
+        """Get the members that reacted with the join emote to the latest lobby invite in a channel"""
+        message_id = self.lobby_invites.get(channel.id)
+        if message_id is None:
+            return []
+        try:
+            invite = await channel.fetch_message(message_id)
+        except discord.NotFound:
+            del self.lobby_invites[channel.id]
+            return []
+        reaction = discord.utils.get(invite.reactions, emoji=self.LOBBY_JOIN_EMOTE)
+        if reaction is None:
+            return []
+        users = await reaction.users().flatten()
+        members = (channel.guild.get_member(u.id) for u in users if not u.bot)
+        return [m for m in members if m is not None]
+
+    async def fetch_linked_skills(self, lafusee, members: List[discord.Member]) -> Dict[int, Optional[list]]:
+        """Get the player skills of the best linked account of members (like `rl update`), all within one deadline
+
+        Members whose skills could not be fetched in time are left out. Members that are not linked have None."""
+        async def fetch(member: discord.Member):
+            response = await lafusee.fetch_best_skills(member.id)
+            return member.id, response.get("player_skills") if response else None
+
+        tasks = [asyncio.ensure_future(fetch(m)) for m in members]
+        done, pending = await asyncio.wait(tasks, timeout=self.BALANCE_FETCH_TIMEOUT)
+        for task in pending:
+            task.cancel()
+        return dict(t.result() for t in done if not t.cancelled() and t.exception() is None)
+
+    @staticmethod
+    def pick_rating(player_skills: Optional[list], playlist_id: Optional[int]) -> Optional[dict]:
+        """Pick the playlist dict to balance on: the given playlist, else the highest ranked one, else casual"""
+        if not player_skills:
+            return None
+        by_playlist = {d["playlist"]: d for d in player_skills}
+        if playlist_id in by_playlist:
+            return by_playlist[playlist_id]
+        ranked = [d for d in player_skills if d["playlist"] != 0]
+        return max(ranked, key=lambda d: d["mu"]) if ranked else by_playlist.get(0)
+
     async def red_delete_data_for_user(self, **kwargs):
         pass  # No user data stored.
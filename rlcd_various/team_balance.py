@@ -0,0 +1,123 @@
+# Default Library.
+import itertools
+import math
+import random
+import time
+from typing import List, NamedTuple, Sequence, Tuple
+
+EXACT_MAX_PLAYERS = 12  # C(12, 6) = 924 splits. Larger lobbies use the local search below.
+SIGMA_WEIGHT = 0.5  # How much a difference in total uncertainty between the teams counts, relative to mu.
+BETA = 25 / 6  # Performance variance of a single player (TrueSkill default).
+MAX_STALE_RESTARTS = 200  # Stop the local search early once this many restarts in a row found nothing better.
+
+
+class Player(NamedTuple):
+    key: int
+    mu: float
+    sigma: float
+
+
+class Split(NamedTuple):
+    team_a: Tuple[int, ...]  # Indices into the player list.
+    team_b: Tuple[int, ...]
+    cost: float
+    exact: bool
+    evaluated: int  # Amount of splits that were scored.
+
+
+def split_cost(players: Sequence[Player], team_a: Sequence[int], team_b: Sequence[int]) -> float:
+    """The mu gap between two teams, plus a (weighted) gap in total sigma
+
+    The sigma term keeps uncertain players (e.g. unlinked ones) spread over both teams."""
+    mu_gap = sum(players[i].mu for i in team_a) - sum(players[i].mu for i in team_b)
+    sigma_gap = sum(players[i].sigma for i in team_a) - sum(players[i].sigma for i in team_b)
+    return abs(mu_gap) + SIGMA_WEIGHT * abs(sigma_gap)
+
+
+def win_probability(players: Sequence[Player], team_a: Sequence[int], team_b: Sequence[int]) -> float:
+    """The chance that team A wins, following the TrueSkill model"""
+    mu_gap = sum(players[i].mu for i in team_a) - sum(players[i].mu for i in team_b)
+    variance = sum(players[i].sigma ** 2 + BETA ** 2 for i in itertools.chain(team_a, team_b))
+    return 0.5 * (1 + math.erf(mu_gap / math.sqrt(2 * variance)))
+
+
+def balance_teams(players: Sequence[Player], time_budget: float = 0.25, seed: int = None) -> Split:
+    """
+    :param players: The players to split over two teams. With an odd amount, team B gets the extra player.
+    :param time_budget: The maximum amount of seconds the local search may take, for lobbies that are too large
+        for an exact search.
+    :param seed: (Optional) Seed for the restarts of the local search.
+    :return: The best split that was found.
+    """
+    if len(players) <= EXACT_MAX_PLAYERS:
+        return _exact_split(players)
+    return _local_search_split(players, time_budget, random.Random(seed))
+
+
+def _exact_split(players: Sequence[Player]) -> Split:
+    """Score every split. With an even amount of players, player 0 stays in team A to skip mirrored splits"""
+    n = len(players)
+    size_a = n // 2
+    everyone = set(range(n))
+    if n % 2 == 0 and n:
+        candidates = ((0, *rest) for rest in itertools.combinations(range(1, n), size_a - 1))
+    else:
+        candidates = itertools.combinations(range(n), size_a)
+    best, evaluated = None, 0
+    for team_a in candidates:
+        team_b = tuple(sorted(everyone.difference(team_a)))
+        cost = split_cost(players, team_a, team_b)
+        evaluated += 1
+        if best is None or cost < best[2]:
+            best = (team_a, team_b, cost)
+    return Split(*best, exact=True, evaluated=evaluated)
+
+
+def _local_search_split(players: Sequence[Player], time_budget: float, rng: random.Random) -> Split:
+    """Greedy start, then best-improvement swaps between the teams, restarting from shuffles until out of time"""
+    n = len(players)
+    size_a = n // 2
+    deadline = time.perf_counter() + time_budget
+    # Greedy start: strongest players first, each to the team with the lowest total (while it has room).
+    order = sorted(range(n), key=lambda i: players[i].mu, reverse=True)
+    best_a, best_b, best_cost = None, None, math.inf
+    evaluated = 0
+    stale = 0
+    while True:
+        team_a: List[int] = []
+        team_b: List[int] = []
+        for i in order:
+            sum_a = sum(players[j].mu for j in team_a)
+            sum_b = sum(players[j].mu for j in team_b)
+            if len(team_b) >= n - size_a or (len(team_a) < size_a and sum_a <= sum_b):
+                team_a.append(i)
+            else:
+                team_b.append(i)
+        cost = split_cost(players, team_a, team_b)
+        evaluated += 1
+        improved = True
+        while improved and time.perf_counter() < deadline:
+            improved = False
+            swap = None
+            for x, i in enumerate(team_a):
+                for y, j in enumerate(team_b):
+                    team_a[x], team_b[y] = j, i
+                    new_cost = split_cost(players, team_a, team_b)
+                    team_a[x], team_b[y] = i, j
+                    evaluated += 1
+                    if new_cost < cost - 1e-9:
+                        cost, swap = new_cost, (x, y)
+            if swap is not None:
+                x, y = swap
+                team_a[x], team_b[y] = team_b[y], team_a[x]
+                improved = True
+        if cost < best_cost - 1e-9:
+            best_a, best_b, best_cost = tuple(sorted(team_a)), tuple(sorted(team_b)), cost
+            stale = 0
+        else:
+            stale += 1
+        if best_cost < 1e-9 or stale >= MAX_STALE_RESTARTS or time.perf_counter() >= deadline:
+            break
+        order = list(range(n))
+        rng.shuffle(order)  # Restart from a random order, to escape the local optimum.
+    return Split(best_a, best_b, best_cost, exact=False, evaluated=evaluated)
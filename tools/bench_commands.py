@@ -0,0 +1,283 @@
+"""End-to-end command latency benchmark
+
+Drives the real command coroutines of LaFusee and Reputation with fake Red/discord objects (see tools/fakes.py),
+the local mock API (see tools/mock_api.py) and temporary SQLite databases. Reports p50/p95/p99 latency and throughput
+per command, and optionally compares them against a stored baseline file.
+
+Usage (from the repository root):
+    python -m tools.bench_commands --iterations 500 --concurrency 20 --latency fixed:0.05
+    python -m tools.bench_commands --save-baseline bench_baseline.json
+    python -m tools.bench_commands --baseline bench_baseline.json --tolerance 0.25
+    python -m tools.bench_commands lfg rocket --background 40
+"""
+# Default library.
+import argparse
+import asyncio
+import datetime as dt
+import json
+import random
+import sys
+import tempfile
+import time
+from contextlib import ExitStack
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional
+
+# Local files.
+from . import fakes
+from .mock_api import ID64_BASE, LatencyModel, MockApiServer, SyntheticPlayers
+
+COMMANDS = ("lfg", "rocket", "plist", "compare", "register", "rlboard", "rep", "reps", "leaderboard", "repsearch",
+            "guild_role_check")
+PSY_TOKEN = "Token " + "0" * 40
+STEAM_TOKEN = "0" * 32
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(pct / 100 * len(sorted_values) + 0.5)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class BenchEnvironment:
+    """Sets up a fake guild, both cogs (with temporary databases), and the mock API"""
+
+    def __init__(self, members: int, reps: int, latency: LatencyModel, seed: int = 0):
+        self.member_count = members
+        self.rep_count = reps
+        self.rng = random.Random(seed)
+        self.server = MockApiServer(players=SyntheticPlayers(seed, unknown_rate=0.0, unplayed_rate=0.0),
+                                    latency=latency, seed=seed)
+        self.stack = ExitStack()
+        self.bot = fakes.FakeBot()
+        self.guild = fakes.FakeGuild()
+        self.bot.guilds.append(self.guild)
+        self.rep_role = fakes.FakeRole("Reputable")
+        self.guild.roles.append(self.rep_role)
+        self.lafusee = None
+        self.reputation = None
+
+    async def __aenter__(self) -> "BenchEnvironment":
+        # Imported here, so that the cogs (and discord.py) are only loaded once the benchmark actually runs.
+        import lafusee.lafusee
+        import reputation.reputation
+        from lafusee.psyonix_calls import PsyonixCalls
+        from lafusee.steam_calls import SteamCalls
+
+        tmp_dir = Path(self.stack.enter_context(tempfile.TemporaryDirectory(prefix="rocketcogs_bench_")))
+        fakes.patch_cog_environment(self.stack, tmp_dir, lafusee.lafusee, reputation.reputation)
+        base_url = await self.server.start()
+
+        self.lafusee = lafusee.lafusee.LaFusee(self.bot)
+        await self.lafusee.psy_api.session.close()
+        await self.lafusee.steam_api.session.close()
+        self.lafusee.psy_api = PsyonixCalls(self.lafusee.config, base_url=base_url)
+        self.lafusee.steam_api = SteamCalls(self.lafusee.config, base_url=base_url)
+        await self.lafusee.config.psy_token.set(PSY_TOKEN)
+        await self.lafusee.config.steam_token.set(STEAM_TOKEN)
+        self.reputation = reputation.reputation.Reputation(self.bot)
+        for cog in (self.lafusee, self.reputation):
+            self.bot.add_cog(cog)
+        await self.reputation.config.guild(self.guild).reputation_role.set(self.rep_role.id)
+        await self.seed()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        for cog in (self.lafusee, self.reputation):
+            if cog is not None:
+                cog.cog_unload()
+        if self.lafusee is not None:
+            await self.lafusee.psy_api.session.close()
+            await self.lafusee.steam_api.session.close()
+        await self.server.stop()
+        self.stack.close()
+
+    async def seed(self) -> None:
+        """Fill the guild with linked members, and the reputation database with reps"""
+        for n in range(self.member_count):
+            member = self.guild.add_member("member{}".format(n))
+            await self.lafusee.link_db.insert_user(member.id, str(member), "steam", str(ID64_BASE + n))
+        start = dt.datetime.utcnow() - dt.timedelta(days=365)
+        for n in range(self.rep_count):
+            giver, receiver = self.rng.sample(self.guild.members, 2)
+            stamp = start + dt.timedelta(seconds=n * 365 * 24 * 3600 / max(1, self.rep_count))
+            await self.reputation.rep_db.insert_rep(giver.id, str(giver), receiver.id, str(receiver), stamp, "seed")
+        await self.reputation.load_cooldowns()  # Like the cog does on startup, as the seed bypasses the index.
+
+    async def background_traffic(self, workers: int) -> None:
+        """Keep `workers` skill lookups in flight on the background lane (like bulk rank refreshes), until cancelled"""
+        from lafusee.psyonix_calls import PsyonixCalls
+
+        async def worker():
+            while True:
+                gamer_id = str(ID64_BASE + self.rng.randrange(self.member_count))
+                try:
+                    await self.lafusee.psy_api.player_skills("steam", gamer_id, lane=PsyonixCalls.BACKGROUND)
+                except Exception:  # Errors of the mock API don't matter here, only the load does.
+                    pass
+
+        await asyncio.gather(*(worker() for _ in range(workers)))
+
+    def context(self, author: fakes.FakeMember = None) -> fakes.FakeContext:
+        return fakes.FakeContext(self.bot, self.guild, author or self.rng.choice(self.guild.members))
+
+    def command_runner(self, name: str) -> Callable[[int], Awaitable]:
+        """Return a function that runs one invocation of a command, given the iteration number"""
+        la, rep = self.lafusee, self.reputation
+        cls_la, cls_rep = type(la), type(rep)
+        members = self.guild.members
+
+        async def lfg(i):
+            await cls_la.lfg_user.callback(la, self.context(), self.rng.choice(members))
+
+        async def rocket(i):
+            await cls_la.rocket_user.callback(la, self.context(), self.rng.choice(members))
+
+        async def plist(i):
+            await cls_la.plist_user.callback(la, self.context(), "2s", self.rng.choice(members))
+
+        async def compare(i):
+            await cls_la.compare_users.callback(la, self.context(), *self.rng.sample(members, 5))
+
+        async def register(i):
+            author = fakes.FakeMember(self.guild, "newcomer{}".format(i))
+            # Alternate between ID64 input and vanity input, so that the Steam route gets exercised as well.
+            profile_id = str(ID64_BASE + 10 ** 6 + i) if i % 2 else "vanity{}".format(i)
+            await cls_la.register_tag.callback(la, self.context(author), "steam", profile_id)
+
+        async def rlboard(i):
+            await cls_la.rank_board.callback(la, self.context(), None if i % 2 else "2s")
+
+        async def give_rep(i):
+            giver, receiver = self.rng.sample(members, 2)
+            await cls_rep.rep.callback(rep, self.context(giver), receiver, comment="Benchmark rep")
+
+        async def reps(i):
+            await cls_rep.rep_count.callback(rep, self.context(), self.rng.choice(members))
+
+        async def leaderboard(i):
+            await cls_rep.rep_leaderboard.callback(rep, self.context())
+
+        async def repsearch(i):
+            words = ("seed", "seed to:{}".format(self.rng.choice(members).id), "see*")
+            await cls_rep.rep_search.callback(rep, self.context(), query=words[i % len(words)])
+
+        async def guild_role_check(i):
+            await rep.guild_role_check(self.guild)
+
+        return {"lfg": lfg, "rocket": rocket, "plist": plist, "compare": compare, "register": register,
+                "rlboard": rlboard, "rep": give_rep, "reps": reps, "leaderboard": leaderboard, "repsearch": repsearch,
+                "guild_role_check": guild_role_check}[name]
+
+
+async def bench_command(runner: Callable[[int], Awaitable], iterations: int, concurrency: int) -> dict:
+    """Run a command `iterations` times with at most `concurrency` invocations in flight"""
+    latencies: List[float] = []
+    errors: Dict[str, int] = {}
+    counter = iter(range(iterations))
+
+    async def worker():
+        for i in counter:
+            start = time.perf_counter()
+            try:
+                await runner(i)
+            except Exception as e:  # Errors raised to the user (e.g. CustomNotice) count, but are still timed.
+                errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+            latencies.append(time.perf_counter() - start)
+
+    wall_start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall_time = time.perf_counter() - wall_start
+    latencies.sort()
+    return {"p50": percentile(latencies, 50), "p95": percentile(latencies, 95), "p99": percentile(latencies, 99),
+            "throughput": len(latencies) / wall_time if wall_time else 0.0, "errors": errors}
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float) -> List[str]:
+    """Return a line per regression: p95 slower, or throughput lower, by more than `tolerance` (a fraction)"""
+    regressions = []
+    for name, res in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        if base["p95"] and res["p95"] > base["p95"] * (1 + tolerance):
+            regressions.append("{}: p95 {:.2f} ms -> {:.2f} ms".format(name, base["p95"] * 1e3, res["p95"] * 1e3))
+        if base["throughput"] and res["throughput"] < base["throughput"] * (1 - tolerance):
+            regressions.append("{}: throughput {:.1f}/s -> {:.1f}/s".format(name, base["throughput"],
+                                                                             res["throughput"]))
+    return regressions
+
+
+def print_results(results: Dict[str, dict], baseline: Optional[Dict[str, dict]]) -> None:
+    print("{:<18}{:>10}{:>10}{:>10}{:>12}{:>10}  errors".format("command", "p50 ms", "p95 ms", "p99 ms",
+                                                                "ops/s", "vs base"))
+    for name, res in results.items():
+        base = (baseline or {}).get(name)
+        delta = "{:+.0%}".format(res["p95"] / base["p95"] - 1) if base and base["p95"] else "-"
+        err = ", ".join("{}={}".format(k, v) for k, v in res["errors"].items()) or "-"
+        print("{:<18}{:>10.2f}{:>10.2f}{:>10.2f}{:>12.1f}{:>10}  {}".format(
+            name, res["p50"] * 1e3, res["p95"] * 1e3, res["p99"] * 1e3, res["throughput"], delta, err))
+
+
+def print_lanes(scheduler) -> None:
+    print("{:<18}{:>10}{:>10}{:>10}{:>10}{:>10}".format("API lane", "requests", "wait p50", "wait p95",
+                                                        "tot p50", "tot p95"))
+    for lane in scheduler.weights:
+        r = scheduler.report(lane)
+        print("{:<18}{:>10}{:>10.2f}{:>10.2f}{:>10.2f}{:>10.2f}".format(
+            lane, r.requests, r.wait_p50 * 1e3, r.wait_p95 * 1e3, r.total_p50 * 1e3, r.total_p95 * 1e3))
+
+
+async def run(args: argparse.Namespace) -> int:
+    latency = LatencyModel.parse(args.latency, rng=random.Random(args.seed))
+    results = {}
+    async with BenchEnvironment(args.members, args.reps, latency, args.seed) as env:
+        background = asyncio.ensure_future(env.background_traffic(args.background)) if args.background else None
+        for name in args.commands:
+            results[name] = await bench_command(env.command_runner(name), args.iterations, args.concurrency)
+        if background is not None:
+            background.cancel()
+        scheduler = env.lafusee.psy_api.scheduler
+    baseline = json.loads(Path(args.baseline).read_text()) if args.baseline else None
+    print_results(results, baseline)
+    print()
+    print_lanes(scheduler)
+    if args.save_baseline:
+        to_save = {k: {m: v[m] for m in ("p50", "p95", "p99", "throughput")} for k, v in results.items()}
+        Path(args.save_baseline).write_text(json.dumps(to_save, indent=2, sort_keys=True))
+        print("Saved baseline to {}".format(args.save_baseline))
+    if baseline:
+        regressions = compare(results, baseline, args.tolerance)
+        for line in regressions:
+            print("REGRESSION " + line)
+        return 1 if regressions else 0
+    return 0
+
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("commands", nargs="*", metavar="command",
+                        help="Commands to benchmark (default: all): {}.".format(", ".join(COMMANDS)))
+    parser.add_argument("--iterations", type=int, default=200, help="Invocations per command.")
+    parser.add_argument("--concurrency", type=int, default=10, help="Invocations in flight at the same time.")
+    parser.add_argument("--members", type=int, default=500, help="Linked members in the fake guild.")
+    parser.add_argument("--reps", type=int, default=5000, help="Reputations seeded before benchmarking.")
+    parser.add_argument("--latency", default="fixed:0.02", help="Mock API latency, see tools.mock_api --help.")
+    parser.add_argument("--background", type=int, default=0,
+                        help="Skill lookups kept in flight on the background API lane while benchmarking.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baseline", help="Compare the results against this baseline file.")
+    parser.add_argument("--save-baseline", help="Write the results to this baseline file.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression (default 0.2).")
+    args = parser.parse_args(argv)
+    args.commands = args.commands or list(COMMANDS)
+    unknown = [c for c in args.commands if c not in COMMANDS]
+    if unknown:
+        parser.error("unknown command(s): {}".format(", ".join(unknown)))
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
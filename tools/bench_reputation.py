@@ -0,0 +1,300 @@
+"""Reputation database benchmark
+
+Times every query method of reputation.db_queries.DbQueries against a (large, synthetic) reputation database,
+and prints the SQLite query plan of every query constant. Use it to justify index and schema changes with numbers.
+
+Usage (from the repository root):
+    python -m tools.bench_reputation --rows 1000000 --users 100000   # Generates a temporary dataset.
+    python -m tools.bench_reputation --db /tmp/reputation.db        # Uses a dataset made by tools.rep_dataset.
+    python -m tools.bench_reputation --cache-stats                   # Also measures page cache hit rates.
+"""
+# Default library.
+import argparse
+import asyncio
+import ctypes
+import ctypes.util
+import datetime as dt
+import inspect
+import json
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Tuple, Union
+
+# Local files.
+from .rep_dataset import generate
+
+
+def sample_users(db_path: str, rng: random.Random) -> Dict[str, int]:
+    """Pick a heavy receiver (top of the leaderboard), a typical receiver, and a heavy giver"""
+    connection = sqlite3.connect(db_path)
+    heavy = connection.execute("SELECT to_user FROM reputations GROUP BY to_user "
+                               "ORDER BY COUNT(*) DESC LIMIT 1").fetchone()[0]
+    receivers = [r[0] for r in connection.execute("SELECT DISTINCT to_user FROM reputations LIMIT 10000")]
+    giver = connection.execute("SELECT from_user FROM reputations GROUP BY from_user "
+                               "ORDER BY COUNT(*) DESC LIMIT 1").fetchone()[0]
+    connection.close()
+    return {"heavy": heavy, "typical": rng.choice(receivers), "giver": giver}
+
+
+def benchmark_cases(db, users: Dict[str, int]) -> Dict[str, Callable[[], Awaitable]]:
+    """Return a benchmark case per DbQueries method. Methods without a case are reported as uncovered"""
+    now = dt.datetime.utcnow()
+    month_ago = now - dt.timedelta(days=30)
+    week = 60 * 60 * 24 * 7
+    counter = iter(range(10 ** 9))
+    return {
+        "all_eligible_users": lambda: db.all_eligible_users(2, 10, week * 5),
+        "all_eligible_users (no decay)": lambda: db.all_eligible_users(2, 10, None),
+        "insert_rep": lambda: db.insert_rep(users["giver"], "giver#0001", users["typical"] + next(counter) + 1,
+                                            "bench#0001", now, "bench", cooldown=week),
+        "insert_rep (cooldown hit)": lambda: db.insert_rep(users["giver"], "giver#0001", users["heavy"],
+                                                           "bench#0001", now, "bench", cooldown=week * 1000),
+        "user_rep_count": lambda: db.user_rep_count(users["heavy"]),
+        "user_rep_count (typical)": lambda: db.user_rep_count(users["typical"]),
+        "rep_leaderboard": lambda: db.rep_leaderboard(),
+        "rep_leaderboard (week)": lambda: db.rep_leaderboard(now - dt.timedelta(days=7)),
+        "rep_leaderboard (season)": lambda: db.rep_leaderboard(now - dt.timedelta(days=90)),
+        "recent_reps": lambda: db.recent_reps(users["heavy"], month_ago),
+        "reps_since": lambda: db.reps_since(month_ago),
+        "archive_status": lambda: db.archive_status(),
+        "search_reps": lambda: db.search_reps("coaching"),
+        "search_reps (recipient)": lambda: db.search_reps("coach*", to_id=users["heavy"]),
+        "search_reps (giver, date)": lambda: db.search_reps("thanks", from_id=users["giver"], after=month_ago),
+    }
+
+
+def query_plan_params(users: Dict[str, int]) -> Dict[str, Union[list, dict]]:
+    """Parameters per query constant, used to print EXPLAIN QUERY PLAN"""
+    from reputation.db_queries import DbQueries  # Imported here, as this loads Red.
+    window = DbQueries.window_params(dt.datetime.utcnow() - dt.timedelta(days=30))
+    stamp = window["since"]
+    return {
+        "SELECT_REP_PAIR": [users["giver"], users["heavy"], stamp],
+        "SELECT_REP_COUNT": {"user": users["heavy"]},
+        "SELECT_REPS_SINCE": [stamp],
+        "SELECT_LEADERBOARD": [],
+        "SELECT_WINDOW_LEADERBOARD": window,
+        "CHECK_SIMPLE": {"role_min": 10},
+        "CHECK_DOUBLE": dict(window, decay_min=2, role_min=10),
+        "GET_RECENT_REPS": dict(window, user=users["heavy"]),
+        "SEARCH_REPS": {"query": 'message : ("coaching") AND users : "t{}"'.format(users["heavy"]), "after": stamp,
+                        "before": None, "window": 2000, "limit": 50},
+        "SELECT_ARCHIVE_BATCH": [stamp - 365 * 24 * 60 * 60, DbQueries.ARCHIVE_CHUNK],
+        "SELECT_ARCHIVE_CHUNKS": [stamp - 365 * 24 * 60 * 60, stamp],
+        "SELECT_ARCHIVE_STATUS": [],
+        "SELECT_RING_REPORTS": [],
+    }
+
+
+async def time_cases(cases: Dict[str, Callable[[], Awaitable]], repeat: int) -> Dict[str, List[float]]:
+    timings = {}
+    for name, case in cases.items():
+        await case()  # Warm-up (page cache, statement compilation).
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            await case()
+            samples.append(time.perf_counter() - start)
+        timings[name] = samples
+    return timings
+
+
+def print_query_plans(db_path: str, db_class, params: Dict[str, Union[list, dict]]) -> None:
+    connection = sqlite3.connect(db_path)
+    for name, query_params in params.items():
+        query = getattr(db_class, name)
+        print("\n{}:\n  {}".format(name, " ".join(query.split())))
+        for row in connection.execute("EXPLAIN QUERY PLAN " + query, query_params):
+            print("  {}".format(row[-1]))
+    connection.close()
+
+
+def print_storage(db_path: str) -> None:
+    """Print the size of every table and index, if SQLite was built with the dbstat table"""
+    connection = sqlite3.connect(db_path)
+    try:
+        rows = connection.execute("SELECT name, SUM(pgsize) FROM dbstat GROUP BY name ORDER BY 2 DESC").fetchall()
+    except sqlite3.OperationalError:
+        rows = []
+    connection.close()
+    for name, size in rows:
+        print("  {:<30}{:>10.1f} MiB".format(name, size / 2 ** 20))
+
+
+class NativeConnection:
+    """A read-only connection opened through the SQLite C library (with ctypes), to read its page cache counters
+
+    The sqlite3 module doesn't expose sqlite3_db_status, nor the handle of its connections, so the benchmark opens a
+    connection of its own. It only runs queries (with sqlite3-style parameters) and discards their rows."""
+    OPEN_READONLY = 1
+    ROW, DONE = 100, 101
+    CACHE_HIT, CACHE_MISS = 7, 8  # SQLITE_DBSTATUS_CACHE_HIT and SQLITE_DBSTATUS_CACHE_MISS.
+    TRANSIENT = ctypes.c_void_p(-1)  # SQLITE_TRANSIENT: SQLite copies bound text.
+
+    def __init__(self, library: str, db_path: str):
+        self.lib = lib = ctypes.CDLL(library)
+        void_p, c_int = ctypes.c_void_p, ctypes.c_int
+        for name, restype, argtypes in (
+                ("sqlite3_open_v2", c_int, [ctypes.c_char_p, ctypes.POINTER(void_p), c_int, ctypes.c_char_p]),
+                ("sqlite3_prepare_v2", c_int, [void_p, ctypes.c_char_p, c_int, ctypes.POINTER(void_p), void_p]),
+                ("sqlite3_bind_parameter_index", c_int, [void_p, ctypes.c_char_p]),
+                ("sqlite3_bind_int64", c_int, [void_p, c_int, ctypes.c_int64]),
+                ("sqlite3_bind_double", c_int, [void_p, c_int, ctypes.c_double]),
+                ("sqlite3_bind_text", c_int, [void_p, c_int, ctypes.c_char_p, c_int, void_p]),
+                ("sqlite3_bind_null", c_int, [void_p, c_int]),
+                ("sqlite3_step", c_int, [void_p]),
+                ("sqlite3_finalize", c_int, [void_p]),
+                ("sqlite3_errmsg", ctypes.c_char_p, [void_p]),
+                ("sqlite3_db_status", c_int, [void_p, c_int, ctypes.POINTER(c_int), ctypes.POINTER(c_int), c_int]),
+                ("sqlite3_close_v2", c_int, [void_p])):
+            function = getattr(lib, name)
+            function.restype, function.argtypes = restype, argtypes
+        self.handle = void_p()
+        if lib.sqlite3_open_v2(db_path.encode(), ctypes.byref(self.handle), self.OPEN_READONLY, None) != 0:
+            message = lib.sqlite3_errmsg(self.handle)
+            lib.sqlite3_close_v2(self.handle)
+            raise sqlite3.OperationalError(message.decode() if message else "Could not open " + db_path)
+
+    def execute(self, query: str, params: Union[list, dict] = ()) -> None:
+        """Run a query, binding a list (positional) or dict (named) of parameters like the sqlite3 module"""
+        lib, statement = self.lib, ctypes.c_void_p()
+        if lib.sqlite3_prepare_v2(self.handle, query.encode(), -1, ctypes.byref(statement), None) != 0:
+            raise sqlite3.OperationalError(lib.sqlite3_errmsg(self.handle).decode())
+        try:
+            items = params.items() if isinstance(params, dict) else enumerate(params, start=1)
+            for key, value in items:
+                index = key if isinstance(key, int) else lib.sqlite3_bind_parameter_index(statement,
+                                                                                          ":{}".format(key).encode())
+                if index == 0:  # Not used by this query.
+                    continue
+                if value is None:
+                    lib.sqlite3_bind_null(statement, index)
+                elif isinstance(value, int):
+                    lib.sqlite3_bind_int64(statement, index, value)
+                elif isinstance(value, float):
+                    lib.sqlite3_bind_double(statement, index, value)
+                else:
+                    lib.sqlite3_bind_text(statement, index, str(value).encode(), -1, self.TRANSIENT)
+            result = lib.sqlite3_step(statement)
+            while result == self.ROW:
+                result = lib.sqlite3_step(statement)
+            if result != self.DONE:
+                raise sqlite3.OperationalError(lib.sqlite3_errmsg(self.handle).decode())
+        finally:
+            lib.sqlite3_finalize(statement)
+
+    def counters(self) -> Tuple[int, int]:
+        """The page cache (hits, misses) since the previous call"""
+        values = []
+        for op in (self.CACHE_HIT, self.CACHE_MISS):
+            current, highwater = ctypes.c_int(), ctypes.c_int()
+            self.lib.sqlite3_db_status(self.handle, op, ctypes.byref(current), ctypes.byref(highwater), 1)
+            values.append(current.value)
+        return values[0], values[1]
+
+    def close(self) -> None:
+        self.lib.sqlite3_close_v2(self.handle)
+
+
+def print_cache_stats(db_path: str, db_class, params: Dict[str, Union[list, dict]], cache_mib: float,
+                      rounds: int, rng: random.Random) -> None:
+    """Print the pages every query reads on a new connection (like exec_sql, which connects per query), and the
+    page cache hit rate of all queries in a random order on one connection with a cache of cache_mib"""
+    library = ctypes.util.find_library("sqlite3")
+    if library is None:
+        print("\nPage cache statistics need the SQLite library, which was not found.")
+        return
+    print("\n{:<34}{:>12}{:>12}".format("query (new connection)", "pages read", "hit rate"))
+    for name, query_params in params.items():
+        connection = NativeConnection(library, db_path)
+        connection.execute(getattr(db_class, name), query_params)
+        hits, misses = connection.counters()
+        connection.close()
+        print("{:<34}{:>12}{:>11.1f}%".format(name, misses, 100 * hits / max(hits + misses, 1)))
+    connection = NativeConnection(library, db_path)
+    connection.execute("PRAGMA cache_size = {};".format(-int(cache_mib * 1024)))
+    workload = [name for name in params for _ in range(rounds)]
+    rng.shuffle(workload)
+    connection.counters()
+    for name in workload:
+        connection.execute(getattr(db_class, name), params[name])
+    hits, misses = connection.counters()
+    connection.close()
+    print("Mixed workload, {} MiB cache: {:.1f}% hit rate ({} pages read)".format(
+        cache_mib, 100 * hits / max(hits + misses, 1), misses))
+
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", help="Existing dataset to use. Note that insert_rep adds rows to it.")
+    parser.add_argument("--rows", type=int, default=200000, help="Rows to generate if no --db is given.")
+    parser.add_argument("--users", type=int, default=20000, help="Users to generate if no --db is given.")
+    parser.add_argument("--guilds", type=int, default=3, help="Guilds to generate if no --db is given.")
+    parser.add_argument("--repeat", type=int, default=20, help="Timed runs per method.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Also write the timings (in seconds) to this file.")
+    parser.add_argument("--cache-stats", action="store_true",
+                        help="Also measure page cache hit rates, through the SQLite C library (needs ctypes).")
+    parser.add_argument("--cache-mib", type=float, default=2.0, help="Page cache size for the mixed workload.")
+    args = parser.parse_args(argv)
+
+    from reputation.db_queries import DbQueries  # Imported here, as this loads Red.
+
+    with tempfile.TemporaryDirectory(prefix="rocketcogs_bench_") as tmp_dir:
+        db_path = args.db
+        if db_path is None:
+            db_path = str(Path(tmp_dir) / "reputation.db")
+            start = time.perf_counter()
+            generate(db_path, args.rows, args.users, args.guilds, seed=args.seed)
+            print("Generated {} rows in {:.1f} s.".format(args.rows, time.perf_counter() - start))
+        rng = random.Random(args.seed)
+        users = sample_users(db_path, rng)
+        start = time.perf_counter()
+        db = DbQueries(db_path)
+        if db.needs_upgrade:  # A database with an older schema, which the cog migrates in the background.
+            db.init_table()
+        print("Opened the database in {:.1f} s.".format(time.perf_counter() - start))
+        connection = sqlite3.connect(db_path)
+        row_count = connection.execute("SELECT COUNT(*) FROM reputations").fetchone()[0]
+        connection.execute("PRAGMA wal_checkpoint(TRUNCATE);")  # So that the file size includes everything.
+        connection.close()
+        size_mb = Path(db_path).stat().st_size / 2 ** 20
+        print("Database: {} rows, {:.1f} MiB".format(row_count, size_mb))
+        print_storage(db_path)
+        print()
+
+        cases = benchmark_cases(db, users)
+        timings = asyncio.run(time_cases(cases, args.repeat))
+        print("{:<34}{:>10}{:>10}{:>10}{:>10}".format("method", "mean ms", "p50 ms", "p95 ms", "max ms"))
+        for name, samples in timings.items():
+            ordered = sorted(samples)
+            p95 = ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]
+            print("{:<34}{:>10.2f}{:>10.2f}{:>10.2f}{:>10.2f}".format(
+                name, statistics.mean(samples) * 1e3, statistics.median(samples) * 1e3, p95 * 1e3,
+                ordered[-1] * 1e3))
+        # Report methods and queries that the benchmark does not cover yet.
+        covered = {name.split(" ")[0] for name in cases}
+        methods = {n for n, f in inspect.getmembers(DbQueries, inspect.iscoroutinefunction) if not n.startswith("_")}
+        for name in sorted(methods - covered - {"exec_sql"}):
+            print("No benchmark case for DbQueries.{}".format(name))
+
+        plan_params = query_plan_params(users)
+        print_query_plans(db_path, DbQueries, plan_params)
+        # Checks, and a query fragment.
+        not_planned = ("TABLE_CHECK", "LEGACY_CHECK", "FTS_CHECK", "ROLLUP_CHECK", "WINDOW_COUNTS")
+        queries = {n for n, v in vars(DbQueries).items() if n.isupper() and isinstance(v, str)
+                   and v.lstrip().upper().startswith("SELECT") and n not in not_planned}
+        for name in sorted(queries - set(plan_params)):
+            print("No query plan parameters for DbQueries.{}".format(name))
+        if args.cache_stats:
+            print_cache_stats(db_path, DbQueries, plan_params, args.cache_mib, args.repeat, rng)
+        if args.json:
+            Path(args.json).write_text(json.dumps(timings, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""Streaming database export
+
+Exports the `registrations` table of LaFusee and the reputations, usernames and archive of Reputation to
+gzip-compressed NDJSON or CSV files, without stopping the bot. Tables are read in a single read transaction per
+database (a consistent snapshot) and streamed in fixed-size chunks, so memory use stays flat for large tables.
+The databases are switched to WAL mode (like the cogs do on load), so the export doesn't block writers.
+
+Usage (from the repository root):
+    python -m tools.export_tables --registrations <data>/LaFusee/account_registrations.db \\
+        --reputations <data>/Reputation/reputation.db --out backups/ --format csv
+"""
+# Default library.
+import argparse
+import datetime as dt
+import time
+from typing import List
+
+REPUTATION_TABLES = ["reputations", "user_names", "rep_archive", "rep_archived_pairs"]
+
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--registrations", help="Path of account_registrations.db (LaFusee).")
+    parser.add_argument("--reputations", help="Path of reputation.db (Reputation).")
+    parser.add_argument("--out", default=".", help="Directory to write the exports to.")
+    parser.add_argument("--format", choices=("ndjson", "csv"), default="ndjson")
+    parser.add_argument("--chunk-size", type=int, default=5000, help="Rows per fetch.")
+    args = parser.parse_args(argv)
+    if not (args.registrations or args.reputations):
+        parser.error("give --registrations and/or --reputations")
+
+    from reputation.table_export import enable_wal, export_tables  # Imported here, as this loads Red.
+
+    prefix = dt.datetime.utcnow().strftime("%Y%m%d-%H%M%S-")
+    for db_path, tables in ((args.registrations, ["registrations"]), (args.reputations, REPUTATION_TABLES)):
+        if db_path is None:
+            continue
+        enable_wal(db_path)
+        start = time.perf_counter()
+        results = export_tables(db_path, tables, args.out, args.format, prefix, args.chunk_size)
+        for table, (path, rows) in results.items():
+            print("{}: {} rows -> {}".format(table, rows, path))
+        print("({:.1f} s)".format(time.perf_counter() - start))
+
+
+if __name__ == "__main__":
+    main()
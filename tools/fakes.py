@@ -0,0 +1,290 @@
+"""Minimal stand-ins for the Red and discord.py objects that the cogs touch
+
+These are only meant for driving command coroutines in tools (benchmarks); they implement just enough of the
+interfaces used by the cogs. Cogs are constructed with their real __init__, with Config and the data path patched.
+"""
+# Default library.
+import asyncio
+import copy
+import datetime as dt
+import itertools
+from contextlib import ExitStack
+from pathlib import Path
+from typing import Dict, List, Optional
+from unittest import mock
+
+_ids = itertools.count(10 ** 17)
+
+
+def new_id() -> int:
+    """A unique snowflake-like ID"""
+    return next(_ids)
+
+
+# Config.
+class FakeValue:
+    def __init__(self, data: dict, defaults: dict, key: str):
+        self._data, self._defaults, self._key = data, defaults, key
+
+    def __call__(self):
+        return self._get()
+
+    async def _get(self):
+        return copy.deepcopy(self._data.get(self._key, self._defaults[self._key]))
+
+    async def set(self, value) -> None:
+        self._data[self._key] = copy.deepcopy(value)
+
+    async def clear(self) -> None:
+        self._data.pop(self._key, None)
+
+
+class FakeGroup:
+    def __init__(self, data: dict, defaults: dict):
+        self._data, self._defaults = data, defaults
+
+    def __getattr__(self, item: str) -> FakeValue:
+        if item.startswith("_") or item not in self._defaults:
+            raise AttributeError(item)
+        return FakeValue(self._data, self._defaults, item)
+
+    async def all(self) -> dict:
+        return copy.deepcopy({**self._defaults, **self._data})
+
+
+class FakeConfig:
+    """In-memory replacement for redbot.core.Config"""
+
+    def __init__(self):
+        self._defaults: Dict[str, dict] = {"global": {}, "guild": {}, "member": {}, "user": {}}
+        self._data: Dict[str, dict] = {"global": {}, "guild": {}, "member": {}, "user": {}}
+
+    @classmethod
+    def get_conf(cls, cog_instance, identifier: int, force_registration: bool = False, **kwargs) -> "FakeConfig":
+        return cls()
+
+    def register_global(self, **defaults) -> None:
+        self._defaults["global"].update(defaults)
+
+    def register_guild(self, **defaults) -> None:
+        self._defaults["guild"].update(defaults)
+
+    def register_member(self, **defaults) -> None:
+        self._defaults["member"].update(defaults)
+
+    def register_user(self, **defaults) -> None:
+        self._defaults["user"].update(defaults)
+
+    def guild(self, guild) -> FakeGroup:
+        return FakeGroup(self._data["guild"].setdefault(guild.id, {}), self._defaults["guild"])
+
+    def member(self, member) -> FakeGroup:
+        key = (member.guild.id, member.id)
+        return FakeGroup(self._data["member"].setdefault(key, {}), self._defaults["member"])
+
+    def user(self, user) -> FakeGroup:
+        return FakeGroup(self._data["user"].setdefault(user.id, {}), self._defaults["user"])
+
+    async def all_guilds(self) -> Dict[int, dict]:
+        return {k: {**self._defaults["guild"], **v} for k, v in self._data["guild"].items()}
+
+    def __getattr__(self, item: str) -> FakeValue:
+        if item.startswith("_") or item not in self._defaults["global"]:
+            raise AttributeError(item)
+        return FakeValue(self._data["global"], self._defaults["global"], item)
+
+
+# Discord objects.
+class FakePermissions:
+    manage_roles = True
+    manage_messages = True
+    administrator = False
+
+
+class FakeRole:
+    def __init__(self, name: str, role_id: int = None):
+        self.id = role_id or new_id()
+        self.name = name
+        self.mention = "<@&{}>".format(self.id)
+
+    def __repr__(self):
+        return "<FakeRole {}>".format(self.name)
+
+
+class FakeMember:
+    def __init__(self, guild: "FakeGuild", name: str, member_id: int = None, roles: List[FakeRole] = None):
+        self.id = member_id or new_id()
+        self.guild = guild
+        self.name = name
+        self.display_name = name
+        self.discriminator = "{:04d}".format(self.id % 10000)
+        self.roles: List[FakeRole] = list(roles or [])
+        self.mention = "<@{}>".format(self.id)
+        self.bot = False
+        self.status = "online"
+        self.guild_permissions = FakePermissions()
+
+    def __str__(self):
+        return "{}#{}".format(self.name, self.discriminator)
+
+    def avatar_url_as(self, **kwargs) -> str:
+        return "https://cdn.discordapp.com/embed/avatars/0.png"
+
+    async def add_roles(self, *roles, reason: str = None) -> None:
+        await asyncio.sleep(0)
+        self.roles.extend(r for r in roles if r not in self.roles)
+
+    async def remove_roles(self, *roles, reason: str = None) -> None:
+        await asyncio.sleep(0)
+        self.roles = [r for r in self.roles if r not in roles]
+
+    async def edit(self, **kwargs) -> None:
+        await asyncio.sleep(0)
+
+
+class FakeMessage:
+    def __init__(self, channel: "FakeChannel", author, content: str = None, embed=None):
+        self.id = new_id()
+        self.channel = channel
+        self.guild = channel.guild
+        self.author = author
+        self.content = content
+        self.embed = embed
+        self.created_at = dt.datetime.utcnow()
+
+    async def delete(self) -> None:
+        await asyncio.sleep(0)
+
+    async def edit(self, content: str = None, embed=None) -> None:
+        await asyncio.sleep(0)
+        self.content, self.embed = content or self.content, embed or self.embed
+
+    async def add_reaction(self, emoji) -> None:
+        await asyncio.sleep(0)
+
+    async def remove_reaction(self, emoji, member) -> None:
+        await asyncio.sleep(0)
+
+    async def clear_reactions(self) -> None:
+        await asyncio.sleep(0)
+
+
+class FakeChannel:
+    def __init__(self, guild: Optional["FakeGuild"], name: str = "general"):
+        self.id = new_id()
+        self.guild = guild
+        self.name = name
+        self.mention = "<#{}>".format(self.id)
+        self.sent = 0
+
+    async def send(self, content: str = None, *, embed=None, **kwargs) -> FakeMessage:
+        await asyncio.sleep(0)
+        self.sent += 1
+        return FakeMessage(self, self.guild.me if self.guild else None, content, embed)
+
+    async def delete_messages(self, messages) -> None:
+        await asyncio.sleep(0)
+
+
+class FakeGuild:
+    def __init__(self, name: str = "Benchmark guild"):
+        self.id = new_id()
+        self.name = name
+        self.roles: List[FakeRole] = [FakeRole("@everyone", self.id)]
+        self.members: List[FakeMember] = []
+        self._members: Dict[int, FakeMember] = {}
+        self.me = FakeMember(self, "Bot")
+        self.channels: List[FakeChannel] = [FakeChannel(self)]
+
+    def add_member(self, name: str, roles: List[FakeRole] = None) -> FakeMember:
+        member = FakeMember(self, name, roles=roles)
+        self.members.append(member)
+        self._members[member.id] = member
+        return member
+
+    @property
+    def member_count(self) -> int:
+        return len(self.members)
+
+    def get_member(self, member_id: int) -> Optional[FakeMember]:
+        return self._members.get(member_id)
+
+    def get_member_named(self, name: str) -> Optional[FakeMember]:
+        return next((m for m in self.members if m.name == name or str(m) == name), None)
+
+    def get_channel(self, channel_id: int) -> Optional[FakeChannel]:
+        return next((c for c in self.channels if c.id == channel_id), None)
+
+    async def create_role(self, name: str, **kwargs) -> FakeRole:
+        await asyncio.sleep(0)
+        role = FakeRole(name)
+        self.roles.append(role)
+        return role
+
+
+class FakeTyping:
+    async def __aenter__(self) -> None:
+        await asyncio.sleep(0)
+
+    async def __aexit__(self, *exc_info) -> None:
+        pass
+
+
+class FakeContext:
+    def __init__(self, bot: "FakeBot", guild: FakeGuild, author: FakeMember, channel: FakeChannel = None):
+        self.bot = bot
+        self.guild = guild
+        self.author = author
+        self.channel = channel or guild.channels[0]
+        self.message = FakeMessage(self.channel, author, "!command")
+        self.prefix = "!"
+
+    async def send(self, content: str = None, **kwargs) -> FakeMessage:
+        return await self.channel.send(content, **kwargs)
+
+    async def tick(self) -> bool:
+        await asyncio.sleep(0)
+        return True
+
+    def typing(self) -> "FakeTyping":
+        return FakeTyping()
+
+    async def send_help(self) -> None:
+        await asyncio.sleep(0)
+
+
+class FakeBot:
+    def __init__(self):
+        self.user = FakeMember(FakeGuild("DMs"), "Bot")
+        self.guilds: List[FakeGuild] = []
+        self.cogs: Dict[str, object] = {}
+        self._ready = asyncio.Event()  # Never set, so background loops of the cogs stay idle.
+
+    async def wait_until_ready(self) -> None:
+        await self._ready.wait()
+
+    def get_cog(self, name: str):
+        return self.cogs.get(name)
+
+    def get_guild(self, guild_id: int) -> Optional[FakeGuild]:
+        return next((g for g in self.guilds if g.id == guild_id), None)
+
+    async def send_to_owners(self, content: str) -> None:
+        await asyncio.sleep(0)
+
+    def add_cog(self, cog) -> None:
+        self.cogs[type(cog).__name__] = cog
+
+
+def patch_cog_environment(stack: ExitStack, data_path: Path, *modules) -> None:
+    """Patch Config and the cog data path in the given cog modules, for as long as `stack` is open"""
+    def cog_data_path(cog_instance) -> Path:
+        path = data_path / type(cog_instance).__name__
+        path.mkdir(parents=True, exist_ok=True)
+        return path
+
+    fake_data_manager = mock.Mock()
+    fake_data_manager.cog_data_path.side_effect = cog_data_path
+    for module in modules:
+        stack.enter_context(mock.patch.object(module, "Config", FakeConfig))
+        stack.enter_context(mock.patch.object(module, "data_manager", fake_data_manager))
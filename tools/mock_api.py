@@ -0,0 +1,293 @@
+"""Local stand-in for the Psyonix and Steam APIs
+
+Serves the routes used by PsyonixCalls (playerskills, playertitles, leaderboard/stats) and SteamCalls
+(ResolveVanityURL) with seeded synthetic players, so that the client stack can be exercised without tokens or network.
+Latency, error statuses, timeouts and rate limiting can be configured to load-test the clients.
+
+Usage (from the repository root):
+    python -m tools.mock_api --port 8080 --latency lognormal:0.12:0.5 --error 500=0.01 --timeout-rate 0.005
+
+Then point the clients at it: PsyonixCalls(config, base_url="http://127.0.0.1:8080"), and likewise for SteamCalls.
+"""
+# Default library.
+import argparse
+import asyncio
+import math
+import random
+import time
+import zlib
+from collections import Counter
+from typing import Dict, List, Optional
+
+# Used by Red.
+from aiohttp import web
+
+PLAYLIST_IDS = (0, 10, 11, 12, 13, 27, 28, 29, 30)
+GAS_TYPES = ("goals", "assists", "saves", "wins", "mvps", "shots")
+TITLES = ("Rocketeer", "Grand Champion", "Supersonic Legend", "Pro", "Veteran", "Expert", "Master", "Legend")
+ID64_BASE = 76561197960265728
+
+
+class LatencyModel:
+    """Draws artificial response latencies (in seconds) from a distribution
+
+    Supported kinds (with parameters):
+    - none
+    - fixed:<seconds>
+    - uniform:<low>:<high>
+    - exponential:<mean>
+    - lognormal:<median>:<sigma>
+    """
+    KINDS = ("none", "fixed", "uniform", "exponential", "lognormal")
+
+    def __init__(self, kind: str = "none", *params: float, rng: random.Random = None):
+        if kind not in self.KINDS:
+            raise ValueError("Unknown latency distribution: {}".format(kind))
+        self.kind = kind
+        self.params = params
+        self.rng = rng or random.Random()
+
+    @classmethod
+    def parse(cls, spec: str, rng: random.Random = None) -> "LatencyModel":
+        """Make a latency model from a string like `lognormal:0.12:0.5`"""
+        kind, *params = spec.split(":")
+        return cls(kind, *(float(p) for p in params), rng=rng)
+
+    def sample(self) -> float:
+        if self.kind == "fixed":
+            return self.params[0]
+        if self.kind == "uniform":
+            return self.rng.uniform(self.params[0], self.params[1])
+        if self.kind == "exponential":
+            return self.rng.expovariate(1 / self.params[0])
+        if self.kind == "lognormal":
+            return self.rng.lognormvariate(math.log(self.params[0]), self.params[1])
+        return 0.0
+
+
+class TokenBucket:
+    """Simple token bucket rate limiter: `rate` requests per second, with bursts of up to `burst` requests"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def take(self) -> bool:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+class SyntheticPlayers:
+    """Deterministic synthetic players: the same seed, platform and ID always give the same player
+
+    A fraction of all IDs does not belong to an account (Psyonix status 400, Steam "No match")."""
+
+    def __init__(self, seed: int = 0, unknown_rate: float = 0.02, unplayed_rate: float = 0.01):
+        self.seed = seed
+        self.unknown_rate = unknown_rate
+        self.unplayed_rate = unplayed_rate
+
+    def _rng(self, *key: str) -> random.Random:
+        return random.Random(zlib.crc32("|".join((str(self.seed),) + key).encode()))
+
+    def exists(self, platform: str, uid: str) -> bool:
+        return self._rng("exists", platform, uid).random() >= self.unknown_rate
+
+    def player_skills(self, platform: str, uid: str) -> dict:
+        """A PlayerSkills response (before it is wrapped in a list)"""
+        rng = self._rng("skills", platform, uid)
+        skills = []
+        if rng.random() >= self.unplayed_rate:
+            base_mu = rng.gauss(25, 9)
+            for playlist in PLAYLIST_IDS:
+                if playlist != 0 and rng.random() < 0.3:  # Not every playlist is played.
+                    continue
+                mu = max(0.0, base_mu + rng.gauss(0, 3))
+                sigma = rng.uniform(2.5, 8.3)
+                matches = int(rng.paretovariate(1.2) * 20)
+                tier = 0 if playlist == 0 or matches < 10 else self.mu_to_tier(mu)
+                skills.append({"division": rng.randrange(4) if 0 < tier < 19 else 0, "matches_played": matches,
+                               "mu": round(mu, 4), "playlist": playlist, "sigma": round(sigma, 4),
+                               "skill": int(mu * 20 + 100), "tier": tier, "tier_max": max(tier, rng.randrange(20)),
+                               "win_streak": rng.randrange(-5, 6)})
+        level = rng.randrange(8)
+        return {"user_name": "{}_player_{}".format(platform, uid)[:32], "player_skills": skills, "user_id": uid,
+                "season_rewards": {"wins": rng.randrange(10) if level else None, "level": level or None}}
+
+    def player_titles(self, platform: str, uid: str) -> dict:
+        rng = self._rng("titles", platform, uid)
+        return {"titles": rng.sample(TITLES, rng.randrange(len(TITLES)))}
+
+    def stat_value(self, platform: str, uid: str, stat_type: str) -> dict:
+        rng = self._rng("stat", platform, uid, stat_type)
+        return {"user_id": uid, "stat_type": stat_type, "value": str(int(rng.paretovariate(1.1) * 100))}
+
+    def vanity_to_id64(self, vanity: str) -> Optional[str]:
+        if self._rng("vanity", vanity).random() < self.unknown_rate:
+            return None
+        return str(ID64_BASE + zlib.crc32(vanity.lower().encode()))
+
+    @staticmethod
+    def mu_to_tier(mu: float) -> int:
+        """Rough mu -> tier mapping (tiers 1-19), good enough for synthetic data"""
+        return max(1, min(19, int((mu * 20 + 100 - 150) / 70) + 1))
+
+
+class MockApiServer:
+    """aiohttp application that serves the mocked Psyonix and Steam routes
+
+    :param players: The synthetic player generator.
+    :param latency: The latency model applied before every response.
+    :param error_rates: Mapping of HTTP status -> probability that a request is answered with that status.
+    :param timeout_rate: Probability that a request hangs for `hang_time` seconds (to trigger client timeouts).
+    :param rate_limit: Optional (requests per second, burst) limit per token. Excess requests get status 429.
+    """
+
+    def __init__(self, players: SyntheticPlayers = None, latency: LatencyModel = None,
+                 error_rates: Dict[int, float] = None, timeout_rate: float = 0.0, hang_time: float = 60.0,
+                 rate_limit: Optional[tuple] = None, seed: int = 0):
+        self.rng = random.Random(seed)
+        self.players = players or SyntheticPlayers(seed)
+        self.latency = latency or LatencyModel(rng=self.rng)
+        self.error_rates = error_rates or {}
+        self.timeout_rate = timeout_rate
+        self.hang_time = hang_time
+        self.rate_limit = rate_limit
+        self.buckets: Dict[str, TokenBucket] = {}
+        self.stats: Counter = Counter()  # Response counts by status (and "timeout").
+        self.app = web.Application(middlewares=[self._faults])
+        self.app.add_routes([
+            web.get("/api/v1/{platform}/playerskills/{uid}", self.player_skills),
+            web.get("/api/v1/{platform}/playertitles/{uid}", self.player_titles),
+            web.get("/api/v1/{platform}/leaderboard/stats/{stat_type}/{uid}", self.stat_value),
+            web.get("/ISteamUser/ResolveVanityURL/v1/", self.resolve_vanity),
+        ])
+        self._runner: Optional[web.AppRunner] = None
+        self.base_url: Optional[str] = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Start serving, and return the base url. Port 0 picks a free port"""
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        bound_port = site._server.sockets[0].getsockname()[1]
+        self.base_url = "http://{}:{}".format(host, bound_port)
+        return self.base_url
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def __aenter__(self) -> "MockApiServer":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.stop()
+
+    # Middleware.
+    @web.middleware
+    async def _faults(self, request: web.Request, handler):
+        """Apply auth, rate limiting, latency and fault injection before the actual route"""
+        is_steam = request.path.startswith("/ISteamUser/")
+        token = request.query.get("key") if is_steam else request.headers.get("Authorization")
+        if not token:
+            return self._respond(web.Response(status=403 if is_steam else 401))
+        if self.rate_limit:
+            bucket = self.buckets.get(token)
+            if bucket is None:
+                bucket = self.buckets[token] = TokenBucket(*self.rate_limit)
+            if not bucket.take():
+                return self._respond(web.Response(status=429))
+        await asyncio.sleep(self.latency.sample())
+        if self.timeout_rate and self.rng.random() < self.timeout_rate:
+            self.stats["timeout"] += 1
+            await asyncio.sleep(self.hang_time)
+        roll = self.rng.random()
+        for status, rate in self.error_rates.items():
+            if roll < rate:
+                return self._respond(web.Response(status=status))
+            roll -= rate
+        return self._respond(await handler(request))
+
+    def _respond(self, response: web.StreamResponse) -> web.StreamResponse:
+        self.stats[response.status] += 1
+        return response
+
+    # Routes.
+    async def player_skills(self, request: web.Request) -> web.Response:
+        platform, uid = request.match_info["platform"], request.match_info["uid"]
+        if not self.players.exists(platform, uid):
+            return web.Response(status=400)
+        return web.json_response([self.players.player_skills(platform, uid)])
+
+    async def player_titles(self, request: web.Request) -> web.Response:
+        platform, uid = request.match_info["platform"], request.match_info["uid"]
+        if not self.players.exists(platform, uid):
+            return web.Response(status=400)
+        return web.json_response([self.players.player_titles(platform, uid)])
+
+    async def stat_value(self, request: web.Request) -> web.Response:
+        platform, uid = request.match_info["platform"], request.match_info["uid"]
+        stat_type = request.match_info["stat_type"]
+        if stat_type not in GAS_TYPES or not self.players.exists(platform, uid):
+            return web.Response(status=400)
+        return web.json_response([self.players.stat_value(platform, uid, stat_type)])
+
+    async def resolve_vanity(self, request: web.Request) -> web.Response:
+        vanity = request.query.get("vanityurl")
+        if not vanity:
+            return web.Response(status=400)
+        id64 = self.players.vanity_to_id64(vanity)
+        if id64 is None:
+            return web.json_response({"response": {"message": "No match", "success": 42}})
+        return web.json_response({"response": {"steamid": id64, "success": 1}})
+
+
+def parse_error_rates(specs: List[str]) -> Dict[int, float]:
+    """Parse `status=probability` pairs, e.g. `500=0.01`"""
+    rates = {}
+    for spec in specs:
+        status, rate = spec.split("=")
+        rates[int(status)] = float(rate)
+    if sum(rates.values()) > 1:
+        raise ValueError("The error rates add up to more than 1.")
+    return rates
+
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--seed", type=int, default=0, help="Seed for synthetic players and fault injection.")
+    parser.add_argument("--unknown-rate", type=float, default=0.02, help="Fraction of IDs without an account.")
+    parser.add_argument("--latency", default="none", help="E.g. fixed:0.1, uniform:0.05:0.2, lognormal:0.12:0.5")
+    parser.add_argument("--error", action="append", default=[], metavar="STATUS=RATE",
+                        help="Inject an error status with a probability. Can be repeated.")
+    parser.add_argument("--timeout-rate", type=float, default=0.0, help="Probability that a request hangs.")
+    parser.add_argument("--hang-time", type=float, default=60.0, help="Seconds a hanging request takes.")
+    parser.add_argument("--rate-limit", type=float, nargs=2, metavar=("PER_SECOND", "BURST"),
+                        help="Token bucket limit per API token. Excess requests get status 429.")
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    server = MockApiServer(players=SyntheticPlayers(args.seed, unknown_rate=args.unknown_rate),
+                           latency=LatencyModel.parse(args.latency, rng=rng),
+                           error_rates=parse_error_rates(args.error), timeout_rate=args.timeout_rate,
+                           hang_time=args.hang_time,
+                           rate_limit=(args.rate_limit[0], int(args.rate_limit[1])) if args.rate_limit else None,
+                           seed=args.seed)
+    web.run_app(server.app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
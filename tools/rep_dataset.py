@@ -0,0 +1,144 @@
+"""Synthetic reputation dataset generator
+
+Generates a reputation database with the schema of reputation/db_queries.py, at a configurable size.
+The rep graph is shaped like real usage:
+- Givers and receivers follow power laws (a few coaches receive most reps, a few members give most reps).
+- Users belong to guilds, and reps are given within a guild. Some users are in several guilds.
+- Reps come in bursts (e.g. after a coaching session), on top of a steady background rate.
+
+The guild membership is written next to the database as `<db>.guilds.json`, for benchmarks that need members.
+
+Usage (from the repository root):
+    python -m tools.rep_dataset /tmp/reputation.db --rows 2000000 --users 200000 --guilds 5
+"""
+# Default library.
+import argparse
+import datetime as dt
+import itertools
+import json
+import random
+import sqlite3
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, Tuple
+
+USER_ID_BASE = 10 ** 17
+COMMENTS = (None, None, None, "Great coaching session!", "Helped me with rotations", "Thanks for the replay review",
+            "Very patient coach", "Good tips on aerials", "Explained boost management really well", "gg")
+
+
+def power_law_cum_weights(n: int, exponent: float, rng: random.Random) -> Tuple[List[int], List[float]]:
+    """Shuffle n indices, and give them Zipf-like cumulative weights (rank r gets weight 1 / r^exponent)"""
+    order = list(range(n))
+    rng.shuffle(order)
+    return order, list(itertools.accumulate(1 / (r ** exponent) for r in range(1, n + 1)))
+
+
+def assign_guilds(users: int, guilds: int, overlap: float, rng: random.Random) -> Dict[int, List[int]]:
+    """Give every user a home guild, and give a fraction of them a second guild. Guild sizes follow a power law"""
+    guild_order, guild_weights = power_law_cum_weights(guilds, 1.0, rng)
+    members: Dict[int, List[int]] = {g: [] for g in range(guilds)}
+    homes = rng.choices(guild_order, cum_weights=guild_weights, k=users)
+    for user, home in enumerate(homes):
+        members[home].append(user)
+        if guilds > 1 and rng.random() < overlap:
+            other = rng.choice([g for g in range(guilds) if g != home])
+            members[other].append(user)
+    return members
+
+
+def generate_rows(rows: int, members: Dict[int, List[int]], days: int, burst_share: float,
+                  rng: random.Random) -> Iterator[tuple]:
+    """Yield reputation rows in insertion order: (from_user, to_user, stamp, message)"""
+    per_guild = {}  # Guild -> (giver order, giver weights, receiver order, receiver weights).
+    for g, guild_members in members.items():
+        if len(guild_members) >= 2:
+            givers = power_law_cum_weights(len(guild_members), 0.8, rng)
+            receivers = power_law_cum_weights(len(guild_members), 1.2, rng)
+            per_guild[g] = (guild_members, givers, receivers)
+    guild_ids = list(per_guild)
+    guild_cum = list(itertools.accumulate(len(per_guild[g][0]) for g in guild_ids))
+    start = dt.datetime.now(dt.timezone.utc).timestamp() - days * 24 * 3600
+    # Reps arrive as a Poisson process of draws, where a draw is either one rep or a burst of reps to one receiver.
+    # Offsets are generated in increasing order, so rows are inserted chronologically like in the real table.
+    reps_per_draw = (1 - burst_share) + burst_share * 14  # Bursts have 3-25 reps, 14 on average.
+    mean_gap = days * 24 * 3600 / (rows / reps_per_draw)
+    offset = 0.0
+    produced = 0
+    while produced < rows:
+        offset += rng.expovariate(1 / mean_gap)
+        g = rng.choices(guild_ids, cum_weights=guild_cum)[0]
+        guild_members, (g_order, g_weights), (r_order, r_weights) = per_guild[g]
+        to_user = guild_members[rng.choices(r_order, cum_weights=r_weights)[0]]
+        if rng.random() < burst_share:  # A burst: one receiver gets several reps within minutes.
+            draw = []
+            burst_offset = offset
+            for _ in range(min(rng.randint(3, 25), rows - produced)):
+                burst_offset += rng.expovariate(1 / 40)
+                draw.append((burst_offset, guild_members[rng.choices(g_order, cum_weights=g_weights)[0]]))
+        else:
+            draw = [(offset, guild_members[rng.choices(g_order, cum_weights=g_weights)[0]])]
+        for rep_offset, from_user in draw:
+            if from_user == to_user:  # Nobody can rep themselves.
+                continue
+            produced += 1
+            yield USER_ID_BASE + from_user, USER_ID_BASE + to_user, int(start + rep_offset), rng.choice(COMMENTS)
+
+
+def generate(db_path: str, rows: int, users: int, guilds: int = 3, days: int = 3 * 365, overlap: float = 0.05,
+             burst_share: float = 0.02, seed: int = 0, batch_size: int = 50000) -> Dict[int, List[int]]:
+    """
+    :param db_path: Path of the database to create or extend. The table is made by DbQueries if it doesn't exist.
+    :param rows: The amount of reputations to generate.
+    :param users: The amount of distinct users.
+    :param guilds: The amount of guilds the users are spread over.
+    :param days: The period (ending now) the reputations are spread over.
+    :param overlap: The fraction of users that is also a member of a second guild.
+    :param burst_share: The fraction of draws that starts a burst of reps to one user.
+    :param seed: Seed for the random generator.
+    :param batch_size: Rows per executemany call.
+    :return: Guild index -> list of member user IDs.
+    """
+    from reputation.db_queries import DbQueries  # Imported here, as this loads Red.
+    DbQueries(db_path)  # Create the table and indexes like the cog does.
+    rng = random.Random(seed)
+    members = assign_guilds(users, guilds, overlap, rng)
+    connection = sqlite3.connect(db_path)
+    connection.execute("PRAGMA synchronous = OFF")
+    connection.execute("PRAGMA journal_mode = MEMORY")
+    connection.executemany("INSERT OR REPLACE INTO user_names (user_id, name) VALUES (?, ?);",
+                           ((USER_ID_BASE + u, "user{}#{:04d}".format(u, u % 10000)) for u in range(users)))
+    row_iter = generate_rows(rows, members, days, burst_share, rng)
+    insert = "INSERT INTO reputations (from_user, to_user, stamp, message) VALUES (?, ?, ?, ?);"
+    while True:
+        batch = list(itertools.islice(row_iter, batch_size))
+        if not batch:
+            break
+        connection.executemany(insert, batch)
+        connection.commit()
+    connection.execute("ANALYZE")
+    connection.commit()
+    connection.close()
+    member_ids = {g: [USER_ID_BASE + u for u in m] for g, m in members.items()}
+    Path(str(db_path) + ".guilds.json").write_text(json.dumps(member_ids))
+    return member_ids
+
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("db", help="Path of the database to generate.")
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--guilds", type=int, default=3)
+    parser.add_argument("--days", type=int, default=3 * 365)
+    parser.add_argument("--overlap", type=float, default=0.05, help="Fraction of users in a second guild.")
+    parser.add_argument("--burst-share", type=float, default=0.02, help="Fraction of draws that start a burst.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    start = time.perf_counter()
+    generate(args.db, args.rows, args.users, args.guilds, args.days, args.overlap, args.burst_share, args.seed)
+    print("Generated {} rows in {:.1f} s.".format(args.rows, time.perf_counter() - start))
+
+
+if __name__ == "__main__":
+    main()